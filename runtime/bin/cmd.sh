@@ -9,6 +9,17 @@ GUNICORN_WORKER_CLASS="${GUNICORN_WORKER_CLASS:-sync}"
 GUNICORN_NUM_WORKERS="${GUNICORN_NUM_WORKERS:-2}"
 GUNICORN_NUM_THREADS="${GUNICORN_NUM_THREADS:-5}"
 GUNICORN_TIMEOUT="${GUNICORN_TIMEOUT:-60}"
+# asyncio serving mode: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker GUNICORN_APP="yagsvc:create_asgi_app()"
+GUNICORN_APP="${GUNICORN_APP:-yagsvc:create_app()}"
+
+# the app sizes its connection pools by the number of threads
+export GUNICORN_NUM_THREADS
+
+# workers share their metrics through files, stale ones of a previous run must go
+PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/yagsvc-metrics}"
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+export PROMETHEUS_MULTIPROC_DIR
 
 exec "gunicorn" \
     --bind ":${GUNICORN_PORT}" \
@@ -21,4 +32,4 @@ exec "gunicorn" \
     --limit-request-field_size 0 \
     --threads ${GUNICORN_NUM_THREADS} \
     -c "${APP_HOME_DIR}/conf/gunicorn.config.py" \
-    yagsvc:create_app\(\)
+    "${GUNICORN_APP}"
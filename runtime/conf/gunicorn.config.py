@@ -15,6 +15,11 @@ from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    ParentBased,
+    TraceIdRatioBased,
+)
+from prometheus_client import multiprocess
 
 OTEL_COLLECTOR_HOST = os.environ.get("OTEL_COLLECTOR_HOST")
 OTEL_COLLECTOR_PORT = os.environ.get("OTEL_COLLECTOR_PORT")
@@ -22,6 +27,9 @@ OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME")
 OTEL_SERVICE_INSTANCE_ID = os.environ.get("OTEL_SERVICE_INSTANCE_ID")
 
 OTEL_TRACE_ENABLED = os.environ.get("OTEL_TRACE_ENABLED", "false").lower() == "true"
+# head-based sampling: kept or dropped as a whole when the request comes in, unless its caller already decided
+OTEL_TRACE_SAMPLE_RATIO = float(os.environ.get("OTEL_TRACE_SAMPLE_RATIO", "0.1"))
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
 
 
 def post_fork(server: Arbiter, worker: ThreadWorker) -> None:
@@ -50,8 +58,16 @@ def post_fork(server: Arbiter, worker: ThreadWorker) -> None:
     logging.getLogger().addHandler(handler)
 
     # traces setup
-    trace.set_tracer_provider(TracerProvider(resource=resource))
+    trace.set_tracer_provider(
+        TracerProvider(resource=resource, sampler=ParentBased(TraceIdRatioBased(OTEL_TRACE_SAMPLE_RATIO)))
+    )
     span_processor = BatchSpanProcessor(
         OTLPSpanExporter(endpoint=f"{OTEL_COLLECTOR_HOST}:{OTEL_COLLECTOR_PORT}", insecure=True)
     )
     trace.get_tracer_provider().add_span_processor(span_processor)
+
+
+def child_exit(server: Arbiter, worker: ThreadWorker) -> None:
+    # live gauges of dead workers would be reported forever otherwise
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,57 @@
+-- Users' libraries as rows (accounts.library) rather than users.apps_lib documents.
+--
+-- Idempotent, run it with:
+--     psql "postgresql://$SQLDB_USERNAME:$SQLDB_PASSWORD@$SQLDB_HOST:$SQLDB_PORT/$SQLDB_DBNAME" \
+--         -v ON_ERROR_STOP=1 -f scripts/migrations/001_library.sql
+--
+-- apps_lib is assumed to be shaped as {"apps": [...]}, its elements being either app release uuids or objects with an
+-- "app_release_uuid" key (their other keys become the item's metadata), oldest first. Anything else is skipped, as are
+-- uuids longer than 64 characters, and items of a release already copied (the first one is kept). apps_lib itself is
+-- left as it is: 002_apps_lib_without_apps.sql removes the apps lists copied whole and reports the other ones.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS accounts.library (
+    user_id BIGINT NOT NULL REFERENCES accounts.users (id) ON DELETE CASCADE,
+    app_release_uuid VARCHAR(64) NOT NULL,
+    added_ts TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    -- order of the item in the apps list of apps_lib
+    position NUMERIC NOT NULL,
+    metadata JSONB,
+    PRIMARY KEY (user_id, app_release_uuid)
+);
+
+-- pages of a library, most recently added first (scanned backwards)
+CREATE INDEX IF NOT EXISTS library_user_id_added_ts_idx ON accounts.library (user_id, added_ts, app_release_uuid);
+-- the apps list of apps_lib
+CREATE INDEX IF NOT EXISTS library_user_id_position_idx ON accounts.library (user_id, position, app_release_uuid);
+-- owners of a release
+CREATE INDEX IF NOT EXISTS library_app_release_uuid_idx ON accounts.library (app_release_uuid);
+
+-- apps_lib has no dates: items get distinct ones, a microsecond apart, in their order in the list
+INSERT INTO accounts.library (user_id, app_release_uuid, added_ts, position, metadata)
+SELECT
+    user_id,
+    app_release_uuid,
+    now() - (count(*) OVER (PARTITION BY user_id) - ord) * interval '1 microsecond',
+    ord,
+    metadata
+FROM (
+    SELECT
+        u.id AS user_id,
+        CASE jsonb_typeof(e.item)
+            WHEN 'string' THEN e.item #>> '{}'
+            WHEN 'object' THEN e.item ->> 'app_release_uuid'
+        END AS app_release_uuid,
+        CASE jsonb_typeof(e.item)
+            WHEN 'object' THEN nullif(e.item - 'app_release_uuid', '{}')
+        END AS metadata,
+        e.ord
+    FROM accounts.users u
+    CROSS JOIN LATERAL jsonb_array_elements(u.apps_lib -> 'apps') WITH ORDINALITY AS e(item, ord)
+    WHERE jsonb_typeof(u.apps_lib -> 'apps') = 'array'
+) items
+WHERE length(app_release_uuid) <= 64
+ON CONFLICT (user_id, app_release_uuid) DO NOTHING;
+
+COMMIT;
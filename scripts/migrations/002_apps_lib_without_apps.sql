@@ -0,0 +1,43 @@
+-- Library items are only stored as accounts.library rows: removes the apps lists which 001_library.sql copied from
+-- users.apps_lib, whose other keys are kept. Replies rebuild apps_lib's apps list from the rows.
+--
+-- Only lists copied whole are removed: each of their items has a row, with its metadata, and no two items are of the
+-- same app release. Other lists (items which aren't uuids or objects with an app_release_uuid, uuids longer than 64
+-- characters, duplicated releases, whose rows keep the first item) are moved to the "unmigrated" key of apps_lib, and
+-- documents which aren't objects become {"unmigrated": <document>}: nothing is lost, the users whose apps_lib has an
+-- "unmigrated" key are listed at the end, for their libraries to be fixed by hand.
+--
+-- Idempotent, run it right after 001_library.sql once the version reading apps lists from the rows is deployed (the
+-- items which the previous version added meanwhile are copied by 001 first):
+--     psql "postgresql://$SQLDB_USERNAME:$SQLDB_PASSWORD@$SQLDB_HOST:$SQLDB_PORT/$SQLDB_DBNAME" \
+--         -v ON_ERROR_STOP=1 -f scripts/migrations/001_library.sql -f scripts/migrations/002_apps_lib_without_apps.sql
+
+BEGIN;
+
+UPDATE accounts.users u
+SET apps_lib = CASE
+    WHEN jsonb_typeof(u.apps_lib) <> 'object' THEN jsonb_build_object('unmigrated', u.apps_lib)
+    WHEN u.apps_lib -> 'apps' = 'null' OR (
+        jsonb_typeof(u.apps_lib -> 'apps') = 'array'
+        AND (
+            SELECT count(*) = count(l.app_release_uuid) AND count(*) = count(DISTINCT l.app_release_uuid)
+            FROM jsonb_array_elements(u.apps_lib -> 'apps') AS e(item)
+            LEFT JOIN accounts.library l
+                ON l.user_id = u.id
+                AND l.app_release_uuid = CASE jsonb_typeof(e.item)
+                    WHEN 'string' THEN e.item #>> '{}'
+                    WHEN 'object' THEN e.item ->> 'app_release_uuid'
+                END
+                AND l.metadata IS NOT DISTINCT FROM CASE jsonb_typeof(e.item)
+                    WHEN 'object' THEN nullif(e.item - 'app_release_uuid', '{}')
+                END
+        )
+    ) THEN u.apps_lib - 'apps'
+    ELSE (u.apps_lib - 'apps') || jsonb_build_object('unmigrated', u.apps_lib -> 'apps')
+END
+WHERE jsonb_typeof(u.apps_lib) NOT IN ('object', 'null') OR u.apps_lib ? 'apps';
+
+COMMIT;
+
+-- what is left to fix by hand
+SELECT id AS user_id, apps_lib -> 'unmigrated' AS unmigrated FROM accounts.users WHERE apps_lib ? 'unmigrated';
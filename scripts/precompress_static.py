@@ -0,0 +1,41 @@
+"""Writes .br and .gz variants next to every compressible file in yagsvc/static.
+
+Served by biz.compression when the client accepts the encoding, so nothing is compressed at request time.
+
+Usage:
+    python scripts/precompress_static.py [static_dir]
+"""
+
+import gzip
+import os
+import sys
+
+import brotli
+
+COMPRESSIBLE = (".css", ".html", ".js", ".json", ".map", ".svg", ".txt")
+
+
+def precompress(path: str) -> None:
+    with open(path, "rb") as f:
+        data = f.read()
+    for suffix, compressed in (
+        (".br", brotli.compress(data, quality=11)),
+        (".gz", gzip.compress(data, compresslevel=9, mtime=0)),
+    ):
+        # not worth serving (and shipping) variants which don't save anything
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(compressed)
+            print(f"{path}{suffix}: {len(data)} -> {len(compressed)}")
+
+
+def main() -> None:
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "yagsvc", "static")
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            if name.endswith(COMPRESSIBLE):
+                precompress(os.path.join(root, name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Stand-in for appsvc serving the endpoints used by yagsvc from a generated catalog.
+
+Usage:
+    python tests/appsvc_stub.py --port 8085 --latency 0.05 --apps 5000
+    APPSVC_URL=http://localhost:8085 ...
+"""
+
+import argparse
+import datetime
+import json
+import time
+import typing as t
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+
+
+def make_app_release(n: int, screenshots: int, descr_len: int) -> dict:
+    return {
+        "addl_artifacts": {},
+        "alternative_names": [f"Game {n} Deluxe", f"Game {n}: The Sequel"],
+        "app_reqs": {"color_bits": 8, "screen_width": 640, "screen_height": 480},
+        "companies": [
+            {
+                "id": n % 97,
+                "name": f"Studio {n % 97}",
+                "developer": True,
+                "porting": False,
+                "publisher": n % 2 == 0,
+                "supporting": False,
+            }
+        ],
+        "esrb_rating": n % 6,
+        "igdb": {"id": n, "slug": f"game-{n}", "similar_ids": [n + 1, n + 2]},
+        "id": n,
+        "is_visible": True,
+        "lang": "en",
+        "long_descr": "x" * descr_len,
+        "media_assets": {
+            "cover": {"image_id": f"cover{n}"},
+            "screenshots": [{"width": 640, "height": 480, "image_id": f"shot{n}_{i}"} for i in range(screenshots)],
+        },
+        "media_assets_localized": None,
+        "name": f"Game {n}",
+        "platform": {
+            "id": 1,
+            "name": "PC (Microsoft Windows)",
+            "abbreviation": "PC",
+            "alternative_name": "",
+            "slug": "win",
+        },
+        "refs": {"ag_id": None, "lutris_id": None, "mg_id": None, "pcgw_id": None, "qz_id": None},
+        "runner": {"name": "dosbox", "ver": "0.74", "window_system": "x11"},
+        "short_descr": f"Game {n} short description",
+        "ts_added": (datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=n)).isoformat(),
+        "uuid": f"app-{n}",
+        "year_released": 1980 + n % 40,
+    }
+
+
+def make_search_item(release: dict) -> dict:
+    return {
+        "cover_image_id": release["media_assets"]["cover"]["image_id"],
+        "esrb_rating": release["esrb_rating"],
+        "id": release["uuid"],
+        "lang": release["lang"],
+        "name": release["name"],
+        "slug": release["igdb"]["slug"],
+        "year_released": release["year_released"],
+        "ts_added": release["ts_added"],
+    }
+
+
+class Catalog:
+    def __init__(self, apps: int, screenshots: int, descr_len: int) -> None:
+        # newest first, as with order_by=ts_added
+        self.releases = {f"app-{n}": make_app_release(n, screenshots, descr_len) for n in range(apps, 0, -1)}
+        self.items = [make_search_item(r) for r in self.releases.values()]
+
+    def search(self, req: dict) -> dict:
+        items: t.Iterable[dict] = self.items
+        if req.get("kids_mode"):
+            items = (i for i in items if i["esrb_rating"] <= 2)
+        if req.get("app_name"):
+            items = (i for i in items if req["app_name"].lower() in i["name"].lower())
+        # ts_added: newest first (as self.items are), the others ascending; ids break ties
+        order_by = req.get("order_by") or "ts_added"
+        reverse = order_by == "ts_added"
+        if not reverse:
+            items = sorted(items, key=lambda i: (i[order_by], i["id"]))
+        if req.get("after_id") is not None:
+            after = (req["after_value"], req["after_id"])
+            items = [
+                i for i in items if ((i[order_by], i["id"]) < after if reverse else (i[order_by], i["id"]) > after)
+            ]
+        offset, limit = req.get("offset", 0), req.get("limit", 100)
+        return {"apps": list(items)[offset : offset + limit]}
+
+    def acl(self, req: dict) -> dict:
+        releases = [r for r in self.releases.values() if not req.get("kids_mode") or r["esrb_rating"] <= 2]
+        if req.get("company_name"):
+            names = sorted({c["name"] for r in releases for c in r["companies"]})
+            prefix = req["company_name"].lower()
+        else:
+            # alternative names are matched as well
+            names = [n for r in releases for n in [r["name"], *r["alternative_names"]]]
+            prefix = (req.get("app_name") or "").lower()
+        return {"acl": [n for n in names if n.lower().startswith(prefix)][:10]}
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # lets hundreds of concurrent clients connect without being refused
+    request_queue_size = 1024
+
+
+def make_handler(catalog: Catalog, latency: float, schema_version: str) -> t.Type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, delayed ACKs would add 40ms to every reply otherwise
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: t.Any) -> None:
+            pass
+
+        def reply(self, status: int, body: t.Optional[dict] = None, headers: t.Optional[dict] = None) -> None:
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-Schema-Version", schema_version)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:  # noqa: N802
+            time.sleep(latency)
+            release = catalog.releases.get(self.path.rsplit("/", 1)[-1])
+            if release is None:
+                self.reply(404, {"code": 404, "message": "app release not found"})
+                return
+            etag = f'"{release["uuid"]}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.reply(304, headers={"ETag": etag})
+                return
+            self.reply(200, release, {"ETag": etag})
+
+        def do_POST(self) -> None:  # noqa: N802
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(latency)
+            if self.path == "/apps/search":
+                self.reply(200, catalog.search(req))
+            elif self.path == "/apps/search/acl":
+                self.reply(200, catalog.acl(req))
+            else:
+                self.reply(404, {"code": 404, "message": "not found"})
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument("--apps", type=int, default=1000, help="catalog size")
+    parser.add_argument("--screenshots", type=int, default=8, help="screenshots per release (payload size)")
+    parser.add_argument("--descr-len", type=int, default=2000, help="long_descr length (payload size)")
+    parser.add_argument("--schema-version", default="2", help="DTO version sent along replies (passthrough)")
+    args = parser.parse_args()
+    catalog = Catalog(args.apps, args.screenshots, args.descr_len)
+    Server((args.host, args.port), make_handler(catalog, args.latency, args.schema_version)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Dump and load timings of every DTO: fresh schema per call (as handlers used to), prebuilt schema and codec.
+
+Samples are generated from the schemas, dumps of the codec are checked to match the schema's.
+
+Usage:
+    python tests/benchmarks/bench_codecs.py --number 2000
+"""
+
+import argparse
+import datetime
+import inspect
+import os
+import timeit
+import typing as t
+
+from marshmallow import (
+    Schema,
+    fields,
+)
+
+# lists and dicts get this many items, roughly the size of a release details reply
+COLLECTION_SIZE = 5
+
+
+def sample(field: fields.Field) -> t.Any:
+    # pylint: disable=too-many-return-statements
+    if isinstance(field, fields.Nested):
+        item = sample_dict(field.schema)
+        return [item] * COLLECTION_SIZE if field.many else item
+    if isinstance(field, fields.List):
+        return [sample(field.inner) for _ in range(COLLECTION_SIZE)]
+    if isinstance(field, fields.Dict):
+        value = field.value_field or fields.String()
+        return {f"key{i}": sample(value) for i in range(COLLECTION_SIZE)}
+    if isinstance(field, fields.Enum):
+        return next(iter(field.enum))
+    if isinstance(field, fields.Date):
+        return datetime.date(2000, 1, 1)
+    if isinstance(field, fields.DateTime):
+        return datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+    if isinstance(field, fields.Boolean):
+        return True
+    if isinstance(field, fields.Integer):
+        return 1
+    return "sample value"
+
+
+def sample_dict(schema: Schema) -> dict:
+    return {name: sample(field) for name, field in schema.fields.items()}
+
+
+def bench(number: int, fn: t.Callable[[], t.Any]) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="calls per measurement")
+    args = parser.parse_args()
+
+    # importing yagsvc requires the appsvc URL, it's never called
+    os.environ.setdefault("APPSVC_URL", "http://127.0.0.1:8085")
+    # pylint: disable=import-outside-toplevel
+    from yagsvc.dto.codec import (
+        DTO_MODULES,
+        codec,
+    )
+
+    print(f"{'DTO':<32}{'dump us':>10}{'prebuilt':>10}{'codec':>10}{'load us':>10}{'codec':>10}")
+    for module in DTO_MODULES:
+        for name, dto in inspect.getmembers(module, inspect.isclass):
+            if dto.__module__ != module.__name__ or not hasattr(dto, "Schema"):
+                continue
+            dto_codec = codec(dto)
+            obj = sample_dict(dto.Schema())
+            data = dto.Schema().dump(obj)
+            assert dto_codec.dump(obj) == data, name
+            dump = bench(args.number, lambda: dto.Schema().dump(obj))
+            prebuilt_dump = bench(args.number, lambda: dto_codec.schema.dump(obj))
+            codec_dump = bench(args.number, lambda: dto_codec.dump(obj))
+            try:
+                dto.Schema().load(data)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # generated samples don't satisfy every validator
+                load = codec_load = float("nan")
+            else:
+                load = bench(args.number, lambda: dto.Schema().load(data))
+                codec_load = bench(args.number, lambda: dto_codec.load(data))
+            print(f"{name:<32}{dump:>10.1f}{prebuilt_dump:>10.1f}{codec_dump:>10.1f}{load:>10.1f}{codec_load:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
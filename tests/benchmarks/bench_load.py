@@ -0,0 +1,311 @@
+"""Throughput and latency percentiles of yagsvc under load, for each gunicorn worker class.
+
+Runs gunicorn with the app against the appsvc stub (tests/appsvc_stub.py) and a database stand-in: SQLite files
+attached as the accounts schema by default, or the Postgres described by SQLDB_* with --sqldb env (it must have a
+user with id --user-id). Each endpoint is driven on its own, by --concurrency clients sending requests back to back.
+
+Usage:
+    python tests/benchmarks/bench_load.py --duration 10 --concurrency 1,8,32 --latency 0.02
+    python tests/benchmarks/bench_load.py --worker-classes gthread --endpoints search,release
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.dirname(BENCH_DIR)
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+# worker class -> app served by gunicorn (factories of this module, so that workers use the database stand-in)
+WORKER_APPS = {
+    "sync": "bench_load:create_bench_app()",
+    "gthread": "bench_load:create_bench_app()",
+    "uvicorn.workers.UvicornWorker": "bench_load:create_bench_asgi_app()",
+}
+
+ENDPOINTS = ("search", "acl", "release", "account", "library")
+
+
+def make_request(endpoint: str, apps: int) -> tuple[str, str, t.Optional[dict]]:
+    # random catalog entries: warm caches hit as often as the catalog size allows
+    n = random.randint(1, apps)
+    if endpoint == "search":
+        return "POST", "/api/apps/search", {"app_name": f"Game {n}", "limit": 20}
+    if endpoint == "acl":
+        return "POST", "/api/apps/search/acl", {"app_name": f"Game {n}"[: random.randint(3, 8)]}
+    if endpoint == "release":
+        return "GET", f"/api/apps/app-{n}", None
+    if endpoint == "library":
+        return "GET", "/api/accounts/library?limit=20", None
+    # the profile of clients reading their library a page at a time
+    return "GET", "/api/accounts/user?exclude=apps_lib", None
+
+
+def percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def drive(
+    base_url: str, endpoint: str, concurrency: int, duration: float, apps: int, cookies: dict
+) -> tuple[int, int, list[float]]:
+    latencies: list[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, limits=limits, timeout=30) as client:
+
+        async def run(until: float) -> None:
+            nonlocal errors
+            while time.perf_counter() < until:
+                method, path, body = make_request(endpoint, apps)
+                started = time.perf_counter()
+                try:
+                    res = await client.request(method, path, json=body)
+                    ok = res.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        until = time.perf_counter() + duration
+        await asyncio.gather(*(run(until) for _ in range(concurrency)))
+    latencies.sort()
+    return len(latencies), errors, latencies
+
+
+def session_cookie(secret_key: str, user_id: int) -> str:
+    # pylint: disable=import-outside-toplevel
+    from flask import Flask
+    from flask.sessions import SecureCookieSessionInterface
+
+    app = Flask(__name__)
+    app.secret_key = secret_key
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    return serializer.dumps({"_user_id": str(user_id), "_fresh": True})
+
+
+def setup_sqlite_standin(db_dir: str) -> None:
+    """Lets the Postgres models run on SQLite: JSONB stored as JSON, the accounts schema as an attached file."""
+    # pylint: disable=import-outside-toplevel,unused-variable
+    from sqlalchemy import event
+    from sqlalchemy.dialects.postgresql import JSONB
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.ext.compiler import compiles
+
+    @compiles(JSONB, "sqlite")
+    def compile_jsonb(*_: t.Any, **__: t.Any) -> str:
+        return "JSON"
+
+    @event.listens_for(Engine, "connect")
+    def attach_accounts(dbapi_conn: t.Any, _: t.Any) -> None:
+        if not dbapi_conn.__class__.__module__.startswith("sqlite3"):
+            return
+        if "accounts" not in (row[1] for row in dbapi_conn.execute("PRAGMA database_list")):
+            dbapi_conn.execute(f"ATTACH DATABASE '{os.path.join(db_dir, 'accounts.db')}' AS accounts")
+
+
+def create_sqlite_standin(db_dir: str, users: int) -> str:
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy import create_engine
+
+    import yagsvc.models.auth  # noqa: F401  # pylint: disable=unused-import
+    from yagsvc.models.account import (
+        LibraryItemDAO,
+        UserDAO,
+    )
+    from yagsvc.sqldb import sqldb
+
+    setup_sqlite_standin(db_dir)
+    uri = f"sqlite:///{os.path.join(db_dir, 'main.db')}"
+    engine = create_engine(uri)
+    sqldb.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            UserDAO.__table__.insert(),
+            [
+                {
+                    "id": i,
+                    "email": f"user{i}@example.com",
+                    "name": f"User {i}",
+                    "tz": "UTC",
+                    # the apps list of apps_lib is the library rows
+                    "apps_lib": {"sort": "added"},
+                    "dob": datetime.date(1990, 1, 1),
+                    "is_active": True,
+                }
+                for i in range(1, users + 1)
+            ],
+        )
+        conn.execute(
+            LibraryItemDAO.__table__.insert(),
+            [
+                {
+                    "user_id": i,
+                    "app_release_uuid": f"app-{j}",
+                    "added_ts": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+                    + datetime.timedelta(days=j),
+                    "position": j,
+                }
+                for i in range(1, users + 1)
+                for j in range(1, 101)
+            ],
+        )
+    engine.dispose()
+    return uri
+
+
+def create_bench_app() -> t.Any:
+    # pylint: disable=import-outside-toplevel
+    from yagsvc import create_app
+
+    if os.environ.get("BENCH_SQLITE_DIR"):
+        setup_sqlite_standin(os.environ["BENCH_SQLITE_DIR"])
+    return create_app()
+
+
+def create_bench_asgi_app() -> t.Any:
+    # pylint: disable=import-outside-toplevel
+    from yagsvc.asgi import AsgiApp
+
+    return AsgiApp(create_bench_app())
+
+
+def wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-classes", default=",".join(WORKER_APPS))
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated client counts")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds before each run, not measured")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=5, help="gunicorn threads per worker (gthread)")
+    parser.add_argument("--port", type=int, default=18280)
+    parser.add_argument("--stub-port", type=int, default=18285)
+    parser.add_argument("--latency", type=float, default=0.02, help="appsvc stub reply latency, in seconds")
+    parser.add_argument("--apps", type=int, default=1000, help="appsvc stub catalog size")
+    parser.add_argument("--screenshots", type=int, default=8, help="screenshots per release (payload size)")
+    parser.add_argument("--descr-len", type=int, default=2000, help="long_descr length (payload size)")
+    parser.add_argument("--sqldb", choices=["sqlite", "env"], default="sqlite", help="database stand-in or SQLDB_*")
+    parser.add_argument("--user-id", type=int, default=1, help="user behind the account endpoint requests")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "APPSVC_URL": f"http://127.0.0.1:{args.stub_port}",
+            "FLASK_SECRET_KEY": os.environ.get("FLASK_SECRET_KEY", "bench"),
+            "GUNICORN_NUM_THREADS": str(args.threads),
+            "PYTHONPATH": os.pathsep.join([BENCH_DIR, ROOT_DIR]),
+        }
+    )
+    sys.path.insert(0, ROOT_DIR)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.sqldb == "sqlite":
+            os.environ["FLASK_SQLALCHEMY_DATABASE_URI"] = create_sqlite_standin(tmp_dir, max(args.user_id, 100))
+            os.environ["BENCH_SQLITE_DIR"] = tmp_dir
+        cookies = {"session": session_cookie(os.environ["FLASK_SECRET_KEY"], args.user_id)}
+        base_url = f"http://127.0.0.1:{args.port}"
+        print(
+            f"appsvc stub: {args.latency * 1000:.0f}ms latency, {args.apps} apps; "
+            f"gunicorn: {args.workers} workers, {args.threads} threads; database: {args.sqldb}"
+        )
+        print(
+            f"{'worker class':<32}{'endpoint':<10}{'clients':>8}{'req/s':>10}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        stub = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(TESTS_DIR, "appsvc_stub.py"),
+                "--port",
+                str(args.stub_port),
+                "--latency",
+                str(args.latency),
+                "--apps",
+                str(args.apps),
+                "--screenshots",
+                str(args.screenshots),
+                "--descr-len",
+                str(args.descr_len),
+            ],
+            # replies to hedged calls yagsvc dropped end in broken pipe tracebacks
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(os.environ["APPSVC_URL"], stub)
+            for worker_class in args.worker_classes.split(","):
+                with tempfile.TemporaryDirectory() as metrics_dir:
+                    server = subprocess.Popen(
+                        [
+                            sys.executable,
+                            "-m",
+                            "gunicorn",
+                            "--bind",
+                            f"127.0.0.1:{args.port}",
+                            "--worker-class",
+                            worker_class,
+                            "--workers",
+                            str(args.workers),
+                            "--threads",
+                            # gunicorn turns sync workers with threads into gthread ones
+                            str(1 if worker_class == "sync" else args.threads),
+                            "--backlog",
+                            "2048",
+                            "--log-level",
+                            "warning",
+                            WORKER_APPS.get(worker_class, WORKER_APPS["sync"]),
+                        ],
+                        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": metrics_dir},
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                    )
+                    try:
+                        wait_until_up(f"{base_url}/api/misc/stats", server)
+                        for endpoint in args.endpoints.split(","):
+                            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                                asyncio.run(drive(base_url, endpoint, concurrency, args.warmup, args.apps, cookies))
+                                count, errors, latencies = asyncio.run(
+                                    drive(base_url, endpoint, concurrency, args.duration, args.apps, cookies)
+                                )
+                                p50, p95, p99 = (
+                                    (percentile(latencies, p) * 1000 for p in (50, 95, 99))
+                                    if latencies
+                                    else (float("nan"),) * 3
+                                )
+                                print(
+                                    f"{worker_class:<32}{endpoint:<10}{concurrency:>8}{count / args.duration:>10.1f}"
+                                    f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{errors:>8}"
+                                )
+                    finally:
+                        server.terminate()
+                        server.wait()
+        finally:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
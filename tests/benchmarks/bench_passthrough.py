@@ -0,0 +1,68 @@
+"""CPU spent per search request by the Flask app with and without appsvc reply passthrough.
+
+appsvc is the stub (tests/appsvc_stub.py) running in a subprocess, so its own CPU isn't measured.
+
+Usage:
+    python tests/benchmarks/bench_passthrough.py --requests 500 --limit 100
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=100, help="search page size")
+    parser.add_argument("--port", type=int, default=18185)
+    args = parser.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(TESTS_DIR, "appsvc_stub.py"), "--port", str(args.port), "--apps", "5000"]
+    )
+    try:
+        os.environ.setdefault("APPSVC_URL", f"http://127.0.0.1:{args.port}")
+        # anonymous searches never touch the database
+        for name, value in (("USERNAME", "-"), ("PASSWORD", "-"), ("HOST", "-"), ("PORT", "5432"), ("DBNAME", "-")):
+            os.environ.setdefault(f"SQLDB_{name}", value)
+        os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+        # pylint: disable=import-outside-toplevel
+        import yagsvc.biz.app as biz_app
+        from yagsvc import create_app
+        from yagsvc.services import appsvc
+
+        client = create_app().test_client()
+        req = {"limit": args.limit}
+        for _ in range(50):
+            try:
+                client.post("/api/apps/search", json=req)
+                break
+            except Exception:  # pylint: disable=broad-exception-caught
+                time.sleep(0.1)
+        appsvc.APPSVC_PASSTHROUGH_VALIDATE_RATE = 0
+        size = len(client.post("/api/apps/search", json=req).data)
+        print(f"search page: {args.limit} items, {size} bytes")
+        print(f"{'cache':<10}{'passthrough':<14}{'cpu us/req':>12}")
+        for cached in (False, True):
+            results = {}
+            for passthrough in (False, True):
+                appsvc.APPSVC_PASSTHROUGH = passthrough
+                started = time.process_time()
+                for _ in range(args.requests):
+                    if not cached:
+                        biz_app.search_cache.clear()
+                    client.post("/api/apps/search", json=req)
+                results[passthrough] = (time.process_time() - started) / args.requests * 1e6
+                print(f"{'hit' if cached else 'miss':<10}{str(passthrough):<14}{results[passthrough]:>12.0f}")
+            print(f"saved: {results[False] - results[True]:.0f} us/req ({1 - results[True] / results[False]:.0%})")
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
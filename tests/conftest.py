@@ -0,0 +1,84 @@
+import os
+import threading
+import typing as t
+
+import pytest
+from appsvc_stub import (
+    Catalog,
+    Server,
+    make_handler,
+)
+from flask import Flask
+
+# yagsvc reads APPSVC_URL when imported: the stub is started before any test module imports it
+catalog = Catalog(apps=200, screenshots=1, descr_len=10)
+server = Server(("127.0.0.1", 0), make_handler(catalog, latency=0.005, schema_version="2"))
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["APPSVC_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture(scope="session")
+def app() -> t.Iterator[Flask]:
+    """yagsvc's Flask app, on the Postgres of SQLDB_* when they are set (tests marked integration)."""
+    from yagsvc import create_app
+
+    if not os.environ.get("SQLDB_HOST"):
+        # connections are opened on first use, which requests of unit tests never get to
+        os.environ.setdefault("FLASK_SQLALCHEMY_DATABASE_URI", "postgresql://yagsvc@127.0.0.1:1/yag")
+    app = create_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def appsvc_catalog() -> t.Iterator[Catalog]:
+    """The catalog served by the appsvc stub, with yagsvc's caches emptied before and after the test."""
+    from yagsvc.biz import app
+
+    caches = [app.release_cache, app.search_cache, app.acl_cache]
+    for cache in caches:
+        cache.clear()
+    yield catalog
+    for cache in caches:
+        cache.clear()
+
+
+class Recorder:
+    """Statements of sqldb's session, recorded rather than run: replies are the rows of the results, in turn."""
+
+    def __init__(self) -> None:
+        self.statements: list[t.Any] = []
+        self.replies: list[list[dict]] = []
+
+    def execute(self, stmt: t.Any, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        from sqlalchemy.engine.result import (
+            IteratorResult,
+            SimpleResultMetaData,
+        )
+
+        self.statements.append(stmt)
+        rows = self.replies.pop(0) if self.replies else []
+        keys = list(rows[0]) if rows else []
+        return IteratorResult(SimpleResultMetaData(keys), iter([tuple(row.values()) for row in rows]))
+
+    def sql(self) -> list[str]:
+        """The statements as Postgres gets them, on one line."""
+        return [" ".join(str(compiled).split()) for compiled in self._compiled()]
+
+    def params(self) -> list[dict]:
+        return [compiled.params for compiled in self._compiled()]
+
+    def _compiled(self) -> list[t.Any]:
+        from sqlalchemy.dialects import postgresql
+
+        return [stmt.compile(dialect=postgresql.dialect()) for stmt in self.statements]
+
+
+@pytest.fixture
+def recorder(monkeypatch, app) -> Recorder:
+    from yagsvc.sqldb import sqldb
+
+    recorder = Recorder()
+    monkeypatch.setattr(sqldb.session, "execute", recorder.execute)
+    monkeypatch.setattr(sqldb.session, "commit", lambda: None)
+    return recorder
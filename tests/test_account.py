@@ -0,0 +1,409 @@
+import datetime
+import os
+import pathlib
+import typing as t
+
+import pytest
+from flask import g
+from sqlalchemy import (
+    delete,
+    insert,
+    select,
+)
+
+# these tests run on the Postgres of SQLDB_*, with scripts/migrations applied
+pytestmark = [
+    pytest.mark.integration,
+    pytest.mark.skipif(not os.environ.get("SQLDB_HOST"), reason="SQLDB_* aren't set"),
+]
+
+
+@pytest.fixture
+def user_id(app):
+    from yagsvc.models.account import UserDAO
+    from yagsvc.sqldb import sqldb
+
+    user_id = sqldb.session.execute(
+        insert(UserDAO).values(tz="UTC", dob=datetime.date(2000, 1, 1)).returning(UserDAO.id)
+    ).scalar_one()
+    sqldb.session.commit()
+    yield user_id
+    # requests of test clients share the app context of the app fixture, and so Flask-Login's user
+    g.pop("_login_user", None)
+    sqldb.session.rollback()
+    sqldb.session.execute(delete(UserDAO).where(UserDAO.id == user_id))
+    sqldb.session.commit()
+
+
+def library(user_id: int) -> list[tuple]:
+    from yagsvc.models.account import LibraryItemDAO
+    from yagsvc.sqldb import sqldb
+
+    rows = sqldb.session.execute(
+        select(LibraryItemDAO.app_release_uuid, LibraryItemDAO.meta)
+        .where(LibraryItemDAO.user_id == user_id)
+        .order_by(LibraryItemDAO.position, LibraryItemDAO.app_release_uuid)
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def apps_lib(user_id: int) -> dict:
+    from yagsvc.biz import account
+
+    return account.get_apps_lib(user_id)
+
+
+def stored_apps_lib(user_id: int) -> dict:
+    from yagsvc.models.account import UserDAO
+    from yagsvc.sqldb import sqldb
+
+    return sqldb.session.execute(select(UserDAO.apps_lib).where(UserDAO.id == user_id)).scalar_one()
+
+
+class TestLibrary:
+    def test_apps_lib_ops_write_library(self, user_id):
+        from yagsvc.biz import account
+        from yagsvc.dto.account import AppsLibOpDTO
+
+        account.patch_user(
+            user_id,
+            {},
+            [
+                AppsLibOpDTO("add", "/apps/-", value="app-1"),
+                AppsLibOpDTO("add", "/apps/-", value={"app_release_uuid": "app-2", "fav": True}),
+                AppsLibOpDTO("add", "/apps/-", value="app-3"),
+            ],
+        )
+        assert library(user_id) == [("app-1", None), ("app-2", {"fav": True}), ("app-3", None)]
+        account.patch_user(user_id, {}, [AppsLibOpDTO("remove", "/apps/0")])
+        assert library(user_id) == [("app-2", {"fav": True}), ("app-3", None)]
+
+    def test_apps_lib_keeps_dates_of_items_already_there(self, user_id):
+        from yagsvc.biz import account
+
+        account.put_library_item(user_id, "app-1", None)
+        added_ts = account.get_library(user_id, 10, None).items[0].added_ts
+        account.patch_user(user_id, {"apps_lib": {"apps": ["app-1", "app-2"]}}, [])
+        items = {item.app_release_uuid: item.added_ts for item in account.get_library(user_id, 10, None).items}
+        assert items["app-1"] == added_ts
+        assert items["app-2"] > added_ts
+
+    def test_library_items_are_apps_lib_items(self, user_id):
+        from yagsvc.biz import account
+
+        account.patch_user(user_id, {"apps_lib": {"apps": [], "sort": "name"}}, [])
+        account.put_library_item(user_id, "app-1", None)
+        account.put_library_item(user_id, "app-2", {"fav": True})
+        assert apps_lib(user_id) == {"apps": ["app-1", {"app_release_uuid": "app-2", "fav": True}], "sort": "name"}
+        account.delete_library_item(user_id, "app-1")
+        assert apps_lib(user_id) == {"apps": [{"app_release_uuid": "app-2", "fav": True}], "sort": "name"}
+        # the column only keeps the rest of the document
+        assert stored_apps_lib(user_id) == {"sort": "name"}
+
+    def test_apps_lib_isnt_loaded_with_users(self, user_id):
+        from sqlalchemy import inspect
+
+        from yagsvc.biz import account
+
+        account.patch_user(user_id, {"apps_lib": {"apps": ["app-1"], "sort": "name"}}, [])
+        account.user_cache.invalidate(user_id)
+        assert "apps_lib" in inspect(account.load_user(user_id)).unloaded
+        assert "apps_lib" not in account.user_cache.get(user_id).value
+
+    def test_user_replies(self, app, user_id):
+        from yagsvc.api.account import _user_response
+        from yagsvc.biz import account
+
+        user = account.patch_user(user_id, {"apps_lib": {"apps": ["app-1"]}}, [])
+        # unknown parameters (e.g. cache busters) are ignored
+        with app.test_request_context("/api/accounts/user?_=1"):
+            assert _user_response(user)["apps_lib"] == {"apps": ["app-1"]}
+        with app.test_request_context("/api/accounts/user?exclude=apps_lib"):
+            assert "apps_lib" not in _user_response(user)
+
+
+class TestUpdateUser:
+    def test_put_of_a_get_reply_keeps_the_library(self, app, user_id):
+        from yagsvc.biz import account
+
+        account.put_library_item(user_id, "app-1", None)
+        account.put_library_item(user_id, "app-2", {"fav": True})
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+        before = client.get("/api/accounts/library").json
+        for query in ("", "?exclude=apps_lib"):
+            user = client.get(f"/api/accounts/user{query}").json
+            assert client.put("/api/accounts/user", json={**user, "tz": "Europe/Paris"}).status_code == 200
+            assert client.get("/api/accounts/library").json == before
+        assert apps_lib(user_id) == {"apps": ["app-1", {"app_release_uuid": "app-2", "fav": True}]}
+        assert account.load_user(user_id).tz == "Europe/Paris"
+
+    def test_put_of_duplicated_items_is_rejected(self, app, user_id):
+        from yagsvc.biz import account
+
+        account.put_library_item(user_id, "app-1", None)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+        user = client.get("/api/accounts/user").json
+        apps = ["app-1", "app-2", {"app_release_uuid": "app-1", "fav": True}]
+        res = client.put("/api/accounts/user", json={**user, "apps_lib": {"apps": apps}})
+        assert res.status_code == 400
+        assert library(user_id) == [("app-1", None)]
+
+    def test_put_of_a_null_apps_lib_clears_it(self, app, user_id):
+        from yagsvc.biz import account
+        from yagsvc.dto.account import UpdateUserRequestDTO
+
+        account.put_library_item(user_id, "app-1", None)
+        account.update_user(user_id, UpdateUserRequestDTO(None, None, "UTC", None, datetime.date(2000, 1, 1)))
+        assert library(user_id) == []
+        assert apps_lib(user_id) is None
+        assert stored_apps_lib(user_id) is None
+
+
+class TestUserCache:
+    @staticmethod
+    def cached(user_id: int) -> dict:
+        from yagsvc.biz import account
+
+        entry = account.user_cache.get(user_id, record=False)
+        assert entry is not None and entry.is_fresh()
+        return entry.value
+
+    def test_update_user_refreshes_the_entry(self, user_id):
+        from yagsvc.biz import account
+        from yagsvc.dto.account import UpdateUserRequestDTO
+
+        assert account.load_user(user_id).tz == "UTC"
+        account.update_user(
+            user_id, UpdateUserRequestDTO("a@b.c", "A", "Europe/Paris", None, datetime.date(2000, 1, 1)), False
+        )
+        assert (self.cached(user_id)["email"], self.cached(user_id)["tz"]) == ("a@b.c", "Europe/Paris")
+        user = account.load_user(user_id)
+        assert (user.email, user.name, user.tz) == ("a@b.c", "A", "Europe/Paris")
+
+    def test_patch_user_refreshes_the_entry(self, user_id):
+        from yagsvc.biz import account
+        from yagsvc.dto.account import AppsLibOpDTO
+
+        assert account.load_user(user_id).name is None
+        account.patch_user(user_id, {"name": "A"}, [])
+        assert self.cached(user_id)["name"] == "A"
+        assert account.load_user(user_id).name == "A"
+        # patches of apps_lib only lock the user row, which is cached again as it is
+        account.patch_user(user_id, {}, [AppsLibOpDTO("add", "/sort", value="name")])
+        assert self.cached(user_id)["name"] == "A"
+        assert "apps_lib" not in self.cached(user_id)
+
+    def test_library_writes_leave_the_entry_as_it_is(self, user_id):
+        from yagsvc.biz import account
+        from yagsvc.dto.account import AppsLibOpDTO
+
+        account.load_user(user_id)
+        before = self.cached(user_id)
+        # the library isn't part of cached users: writes of it can't make them stale
+        account.put_library_item(user_id, "app-1", None)
+        account.patch_user(user_id, {}, [AppsLibOpDTO("add", "/apps/-", value="app-2")])
+        account.delete_library_item(user_id, "app-1")
+        assert self.cached(user_id) == before
+        assert apps_lib(user_id) == {"apps": ["app-2"]}
+
+    def test_unknown_users_are_cached(self, user_id):
+        from yagsvc.biz import account
+
+        assert account.load_user(-user_id) is None
+        assert account.user_cache.get(-user_id, record=False).value is None
+
+
+class TestPatchAppsLib:
+    @staticmethod
+    def patch(user_id: int, *ops: tuple) -> dict:
+        from yagsvc.biz import account
+        from yagsvc.dto.account import AppsLibOpDTO
+
+        account.patch_user(user_id, {}, [AppsLibOpDTO(*op) for op in ops])
+        return apps_lib(user_id)
+
+    def test_add(self, user_id):
+        # appending creates the array of a user without apps_lib
+        assert self.patch(user_id, ("add", "/apps/-", None, "app-1")) == {"apps": ["app-1"]}
+        assert self.patch(user_id, ("add", "/apps/0", None, "app-0"), ("add", "/apps/-", None, "app-2")) == {
+            "apps": ["app-0", "app-1", "app-2"]
+        }
+        assert self.patch(user_id, ("add", "/sort", None, "name"))["sort"] == "name"
+
+    def test_remove(self, user_id):
+        self.patch(user_id, *[("add", "/apps/-", None, f"app-{n}") for n in range(3)], ("add", "/sort", None, "name"))
+        assert self.patch(user_id, ("remove", "/apps/1"), ("remove", "/sort")) == {"apps": ["app-0", "app-2"]}
+        # missing paths are left as they are
+        assert self.patch(user_id, ("remove", "/apps/5"), ("remove", "/view")) == {"apps": ["app-0", "app-2"]}
+
+    def test_replace(self, user_id):
+        self.patch(user_id, ("add", "/apps/-", None, "app-0"), ("add", "/sort", None, "name"))
+        assert self.patch(user_id, ("replace", "/apps/0", None, {"app_release_uuid": "app-0", "fav": True})) == {
+            "apps": [{"app_release_uuid": "app-0", "fav": True}],
+            "sort": "name",
+        }
+        # replace doesn't create missing paths
+        assert "view" not in self.patch(user_id, ("replace", "/view", None, "grid"))
+
+    def test_move(self, user_id):
+        self.patch(user_id, *[("add", "/apps/-", None, f"app-{n}") for n in range(4)])
+        assert self.patch(user_id, ("move", "/apps/3", "/apps/0")) == {"apps": ["app-1", "app-2", "app-3", "app-0"]}
+        assert self.patch(user_id, ("move", "/apps/0", "/apps/3")) == {"apps": ["app-0", "app-1", "app-2", "app-3"]}
+        assert self.patch(user_id, ("move", "/apps/-", "/apps/0")) == {"apps": ["app-1", "app-2", "app-3", "app-0"]}
+        # moving a missing element changes nothing
+        assert self.patch(user_id, ("move", "/apps/0", "/apps/9")) == {"apps": ["app-1", "app-2", "app-3", "app-0"]}
+
+    def test_item_metadata(self, user_id):
+        self.patch(user_id, ("add", "/apps/-", None, "app-0"), ("add", "/apps/-", None, "app-1"))
+        assert self.patch(user_id, ("add", "/apps/1/fav", None, True), ("add", "/apps/1/tags", None, ["a"])) == {
+            "apps": ["app-0", {"app_release_uuid": "app-1", "fav": True, "tags": ["a"]}]
+        }
+        assert self.patch(user_id, ("add", "/apps/1/tags/0", None, "b"), ("remove", "/apps/1/fav")) == {
+            "apps": ["app-0", {"app_release_uuid": "app-1", "tags": ["b", "a"]}]
+        }
+        # items without metadata left are uuids again
+        assert self.patch(user_id, ("remove", "/apps/1/tags")) == {"apps": ["app-0", "app-1"]}
+
+    def test_items_are_rows(self, user_id):
+        self.patch(user_id, ("add", "/apps/-", None, "app-0"), ("add", "/apps/-", None, "app-1"))
+        # a list of items is a library: adding an item already there moves it
+        assert self.patch(user_id, ("add", "/apps/0", None, "app-1")) == {"apps": ["app-1", "app-0"]}
+        assert self.patch(user_id, ("replace", "/apps/0", None, "app-2")) == {"apps": ["app-2", "app-0"]}
+        assert library(user_id) == [("app-2", None), ("app-0", None)]
+        assert self.patch(user_id, ("replace", "/apps", None, ["app-3"])) == {"apps": ["app-3"]}
+        # users without apps_lib nor items have none
+        assert self.patch(user_id, ("remove", "/apps")) is None
+
+    def test_positions_keep_dates(self, user_id):
+        from yagsvc.biz import account
+
+        account.patch_user(user_id, {"apps_lib": {"apps": [f"app-{n}" for n in range(3)]}}, [])
+        before = {item.app_release_uuid: item.added_ts for item in account.get_library(user_id, 10, None).items}
+        assert self.patch(user_id, ("add", "/apps/2", None, "new"), ("move", "/apps/1", "/apps/3")) == {
+            "apps": ["app-0", "app-2", "app-1", "new"]
+        }
+        assert self.patch(user_id, ("move", "/apps/1", "/apps/2")) == {"apps": ["app-0", "app-1", "app-2", "new"]}
+        after = {item.app_release_uuid: item.added_ts for item in account.get_library(user_id, 10, None).items}
+        assert {k: v for k, v in after.items() if k != "new"} == before
+
+    def test_positions_between_close_items(self, user_id):
+        self.patch(user_id, ("add", "/apps/-", None, "first"), ("add", "/apps/-", None, "last"))
+        for n in range(40):
+            self.patch(user_id, ("add", "/apps/1", None, f"app-{n}"))
+        assert apps_lib(user_id)["apps"] == ["first", *[f"app-{n}" for n in reversed(range(40))], "last"]
+
+    def test_escaped_pointers(self, user_id):
+        assert self.patch(user_id, ("add", "/a~1b~0c", None, 1)) == {"a/b~c": 1, "apps": []}
+
+    def test_most_ops_a_request_may_have(self, user_id):
+        from yagsvc.dto.account import APPS_LIB_OPS_MAX
+
+        half = APPS_LIB_OPS_MAX // 2
+        ops = [("add", "/apps/-", None, f"app-{n}") for n in range(half)] + [("move", "/apps/-", "/apps/0")] * half
+        assert self.patch(user_id, *ops)["apps"] == [f"app-{n}" for n in range(half)]
+
+
+class TestGetLibrary:
+    def test_pages(self, user_id):
+        from yagsvc.biz import account
+
+        for n in range(5):
+            account.put_library_item(user_id, f"app-{n}", None)
+        pages, page_cursor = [], None
+        while True:
+            page = account.get_library(user_id, 2, page_cursor)
+            pages.append([item.app_release_uuid for item in page.items])
+            page_cursor = page.next_cursor
+            if page_cursor is None:
+                break
+        assert pages == [["app-4", "app-3"], ["app-2", "app-1"], ["app-0"]]
+
+    def test_items_added_meanwhile_dont_shift_pages(self, user_id):
+        from yagsvc.biz import account
+
+        for n in range(4):
+            account.put_library_item(user_id, f"app-{n}", None)
+        first = account.get_library(user_id, 2, None)
+        account.put_library_item(user_id, "app-new", None)
+        second = account.get_library(user_id, 2, first.next_cursor)
+        assert [item.app_release_uuid for item in second.items] == ["app-1", "app-0"]
+        assert second.next_cursor is None
+
+    def test_app_release_uuids_longer_than_the_column_are_rejected(self, app, user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+        for method in (client.put, client.delete):
+            assert method(f"/api/accounts/library/{'x' * 65}").status_code == 400
+        assert client.put(f"/api/accounts/library/{'x' * 64}").status_code == 200
+        assert library(user_id) == [("x" * 64, None)]
+
+
+class TestMigrations:
+    MIGRATIONS = pathlib.Path(__file__).parent.parent / "scripts" / "migrations"
+
+    @pytest.fixture
+    def user_ids(self, app):
+        from yagsvc.models.account import UserDAO
+        from yagsvc.sqldb import sqldb
+
+        documents = [
+            {"apps": ["app-1", {"app_release_uuid": "app-2", "fav": True}], "sort": "name"},
+            {"apps": ["app-1", {"app_release_uuid": "app-1", "fav": True}]},
+            {"apps": [1, "x" * 65, "app-1"], "sort": "name"},
+            ["app-1"],
+            {"apps": None},
+        ]
+        user_ids = (
+            sqldb.session.execute(
+                insert(UserDAO).returning(UserDAO.id, sort_by_parameter_order=True),
+                [{"tz": "UTC", "dob": datetime.date(2000, 1, 1), "apps_lib": document} for document in documents],
+            )
+            .scalars()
+            .all()
+        )
+        sqldb.session.commit()
+        yield user_ids
+        sqldb.session.execute(delete(UserDAO).where(UserDAO.id.in_(user_ids)))
+        sqldb.session.commit()
+
+    def migrate(self) -> dict[int, t.Any]:
+        """Runs the migrations as psql would, returns the users left to fix by hand."""
+        from yagsvc.sqldb import sqldb
+
+        conn = sqldb.engine.raw_connection()
+        try:
+            conn.driver_connection.autocommit = True
+            with conn.cursor() as cursor:
+                for name in ("001_library.sql", "002_apps_lib_without_apps.sql"):
+                    cursor.execute((self.MIGRATIONS / name).read_text())
+                return dict(cursor.fetchall())
+        finally:
+            conn.driver_connection.autocommit = False
+            conn.close()
+
+    def test_apps_lists_copied_whole_are_removed(self, user_ids):
+        self.migrate()
+        assert library(user_ids[0]) == [("app-1", None), ("app-2", {"fav": True})]
+        assert stored_apps_lib(user_ids[0]) == {"sort": "name"}
+        assert stored_apps_lib(user_ids[4]) == {}
+
+    def test_other_documents_are_kept_and_reported(self, user_ids):
+        unmigrated = self.migrate()
+        assert {user_id: unmigrated.get(user_id) for user_id in user_ids[1:4]} == {
+            user_ids[1]: ["app-1", {"app_release_uuid": "app-1", "fav": True}],
+            user_ids[2]: [1, "x" * 65, "app-1"],
+            user_ids[3]: ["app-1"],
+        }
+        # the first item of a duplicated release is copied
+        assert library(user_ids[1]) == [("app-1", None)]
+        assert library(user_ids[2]) == [("app-1", None)]
+        assert library(user_ids[3]) == []
+        assert stored_apps_lib(user_ids[2]) == {"sort": "name", "unmigrated": [1, "x" * 65, "app-1"]}
+        assert stored_apps_lib(user_ids[3]) == {"unmigrated": ["app-1"]}
+        # migrations can be run again
+        assert self.migrate() == unmigrated
@@ -0,0 +1,156 @@
+import pytest
+
+from yagsvc.biz import acl_index
+from yagsvc.biz.acl_index import (
+    AclIndex,
+    PrefixIndex,
+)
+from yagsvc.biz.errors import AppSvcException
+from yagsvc.services import appsvc
+from yagsvc.services.dto.appsvc import SearchAppsAclRequestDTO
+
+
+def appsvc_acl(**kw) -> list[str]:
+    return appsvc.search_apps_acl(SearchAppsAclRequestDTO(**kw))["acl"]
+
+
+@pytest.mark.unit
+class TestPrefixIndex:
+    def test_lookup(self):
+        index = PrefixIndex({"pinball": "Pinball", "pink panther": "Pink Panther", "pong": "Pong"})
+        assert index.lookup("PIN", 10) == ["Pinball", "Pink Panther"]
+        assert index.lookup("pin", 1) == ["Pinball"]
+        assert index.lookup("  pink   pan", 10) == ["Pink Panther"]
+        assert index.lookup("zzz", 10) == []
+
+
+@pytest.fixture(scope="module")
+def index() -> AclIndex:
+    index = AclIndex()
+    index.refresh()
+    return index
+
+
+@pytest.mark.unit
+class TestAclIndex:
+    def test_falls_back_until_loaded(self, appsvc_catalog):
+        index = AclIndex()
+        assert index.lookup(SearchAppsAclRequestDTO(app_name="Game 199")) is None
+        assert index.lookup(SearchAppsAclRequestDTO(company_name="Studio 9")) is None
+
+    # fewer matches than the ACL limit: the index and appsvc return the same names, maybe in another order
+    @pytest.mark.parametrize("app_name", ["Game 199", "game 19 d", "Game 57:", "GAME 120 D"])
+    def test_names_as_appsvc(self, index, app_name):
+        res = index.lookup(SearchAppsAclRequestDTO(app_name=app_name))
+        assert res is not None
+        assert sorted(res) == sorted(appsvc_acl(app_name=app_name))
+
+    def test_alternative_names(self, index):
+        assert index.lookup(SearchAppsAclRequestDTO(app_name="game 199 deluxe")) == ["Game 199 Deluxe"]
+
+    @pytest.mark.parametrize("company_name", ["Studio 9", "studio 96", "Studio 55"])
+    def test_companies_as_appsvc(self, index, company_name):
+        res = index.lookup(SearchAppsAclRequestDTO(company_name=company_name))
+        assert res is not None
+        assert sorted(res) == sorted(appsvc_acl(company_name=company_name))
+
+    def test_kids_mode(self, index):
+        for app_name in ["Game 199", "Game 198"]:
+            req = SearchAppsAclRequestDTO(app_name=app_name, kids_mode=True)
+            assert sorted(index.lookup(req)) == sorted(appsvc_acl(app_name=app_name, kids_mode=True))
+
+    def test_falls_back_while_details_are_missing(self, appsvc_catalog, monkeypatch):
+        fetch_app_release = appsvc.fetch_app_release
+
+        def failing_fetch_app_release(app_release_uuid, *args, **kw):
+            if app_release_uuid == "app-7":
+                raise AppSvcException("appsvc get_app_release: circuit open")
+            return fetch_app_release(app_release_uuid, *args, **kw)
+
+        monkeypatch.setattr(appsvc, "fetch_app_release", failing_fetch_app_release)
+        index = AclIndex()
+        with pytest.raises(AppSvcException):
+            index.refresh()
+        assert index.lookup(SearchAppsAclRequestDTO(app_name="Game 199")) is None
+        assert index.lookup(SearchAppsAclRequestDTO(company_name="Studio 9")) is None
+        assert index.get_stats()["missing_details"] > 0
+
+        monkeypatch.setattr(appsvc, "fetch_app_release", fetch_app_release)
+        index.refresh()
+        assert index.get_stats()["missing_details"] == 0
+        assert index.lookup(SearchAppsAclRequestDTO(company_name="Studio 9")) is not None
+
+    def test_new_releases_are_indexed_with_their_details(self, index):
+        details = index.counters.snapshot()["details"]
+        index.refresh()
+        # nothing new: the second refresh doesn't fetch details again
+        assert index.counters.snapshot()["details"] == details
+
+
+def failing_search_apps(monkeypatch, pages: int) -> None:
+    """Makes appsvc.search_apps fail after that many pages, once."""
+    search_apps = appsvc.search_apps
+    calls = []
+
+    def search_apps_failing_once(*args, **kw):
+        calls.append(args)
+        if len(calls) == pages + 1:
+            raise AppSvcException("appsvc search_apps: circuit open")
+        return search_apps(*args, **kw)
+
+    monkeypatch.setattr(appsvc, "search_apps", search_apps_failing_once)
+
+
+@pytest.mark.unit
+class TestAclIndexCrawl:
+    @pytest.fixture(autouse=True)
+    def small_pages(self, monkeypatch):
+        monkeypatch.setattr(acl_index, "ACL_INDEX_PAGE_SIZE", 10)
+
+    def test_failed_load_is_resumed(self, appsvc_catalog, monkeypatch):
+        index = AclIndex()
+        failing_search_apps(monkeypatch, 3)
+        with pytest.raises(AppSvcException):
+            index.refresh()
+        assert not index.is_ready()
+        assert len(index.modes[False].release_ids) == 30
+
+        index.refresh()
+        assert index.is_ready()
+        assert index.modes[False].release_ids == {i["id"] for i in appsvc_catalog.items}
+
+    def test_failed_refresh_is_resumed(self, appsvc_catalog, monkeypatch):
+        index = AclIndex()
+        index.refresh()
+        # the 25 newest releases were added since
+        mode = index.modes[False]
+        new = {i["id"] for i in appsvc_catalog.items[:25]}
+        mode.release_ids -= new
+        failing_search_apps(monkeypatch, 1)
+        with pytest.raises(AppSvcException):
+            index.refresh()
+        assert len(mode.release_ids & new) == 10
+
+        index.refresh()
+        assert mode.release_ids >= new
+        assert mode.resume is None
+
+    def test_full_refreshes_drop_removed_and_renamed_releases(self, appsvc_catalog, monkeypatch):
+        index = AclIndex()
+        index.refresh()
+        renamed, removed, *items = appsvc_catalog.items
+        monkeypatch.setattr(appsvc_catalog, "items", [{**renamed, "name": "Renamed 200"}, *items])
+        monkeypatch.setattr(acl_index, "ACL_INDEX_FULL_REFRESH_INTERVAL", 0)
+        details = index.counters.snapshot()["details"]
+        index.refresh()
+        assert index.modes[False].release_ids == {i["id"] for i in appsvc_catalog.items}
+        assert index.lookup(SearchAppsAclRequestDTO(app_name="Renamed 2")) == ["Renamed 200"]
+        assert index.lookup(SearchAppsAclRequestDTO(app_name=removed["name"])) == []
+        # the details of the releases still listed are kept
+        assert index.counters.snapshot()["details"] == details
+
+    def test_pages_arent_read_on_the_slots_of_clients(self, appsvc_catalog):
+        client_calls = appsvc.bulkheads["search_apps"].get_stats()["calls"]
+        AclIndex().refresh()
+        assert appsvc.bulkheads["search_apps"].get_stats()["calls"] == client_calls
+        assert appsvc.bulkheads[appsvc.ACL_INDEX_BULKHEAD].get_stats()["calls"] > 0
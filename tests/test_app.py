@@ -0,0 +1,423 @@
+import asyncio
+import json
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from marshmallow import ValidationError
+
+import yagsvc.biz.app as biz_app
+from yagsvc.api import http_cache
+from yagsvc.biz import (
+    compression,
+    cursor,
+    prefetch,
+)
+from yagsvc.biz.errors import (
+    AppSvcException,
+    AppSvcNotFoundException,
+)
+from yagsvc.dto.app import (
+    SearchAppsRequestDTO,
+    SearchAsYouTypeRequestDTO,
+)
+from yagsvc.dto.codec import codec
+from yagsvc.services import (
+    appsvc,
+    appsvc_async,
+)
+from yagsvc.services.dto.appsvc import (
+    SCHEMA_VERSION,
+    GetAppReleaseResponseDTO,
+    SearchAppsAclRequestDTO,
+    SearchAppsOrderBy,
+    SearchAppsRequestOutDTO,
+    SearchAppsResponseDTO,
+)
+
+
+@pytest.mark.unit
+class TestGetAppReleases:
+    def test_batch_has_slots_of_its_own(self, appsvc_catalog):
+        uuids = list(appsvc_catalog.releases)[:50]
+        client_bulkhead = appsvc.bulkheads["get_app_release"]
+        # clients calls take all the get_app_release slots meanwhile
+        held = 0
+        while client_bulkhead.acquire():
+            held += 1
+        try:
+            res = biz_app.get_app_releases(uuids)
+        finally:
+            for _ in range(held):
+                client_bulkhead.release()
+        assert res["errors"] == {}
+        assert sorted(res["apps"]) == sorted(uuids)
+
+    def test_batch_reports_errors_per_release(self, appsvc_catalog):
+        res = biz_app.get_app_releases(["app-1", "app-unknown"])
+        assert list(res["apps"]) == ["app-1"]
+        assert res["errors"]["app-unknown"]["message"]
+
+
+@pytest.mark.unit
+class TestGetAppReleaseHttp:
+    def test_etag_and_caching_headers(self, app, appsvc_catalog):
+        res = app.test_client().get("/api/apps/app-1")
+        assert res.status_code == 200
+        assert (
+            res.get_data()
+            == app.json.response(codec(GetAppReleaseResponseDTO).dump(appsvc_catalog.releases["app-1"])).get_data()
+        )
+        assert res.get_etag() == (compression.etag(res.get_data()), False)
+        assert res.headers["Cache-Control"] == f"public, max-age={http_cache.APP_RELEASE_MAX_AGE}"
+        assert res.vary.as_set() == {"accept-encoding"}
+
+    @pytest.mark.parametrize("suffix", ["", "-gzip", "-br"])
+    def test_if_none_match(self, app, appsvc_catalog, suffix):
+        client = app.test_client()
+        etag, _ = client.get("/api/apps/app-1").get_etag()
+        res = client.get("/api/apps/app-1", headers={"If-None-Match": f'"{etag}{suffix}"'})
+        assert res.status_code == 304
+        assert res.get_data() == b""
+        assert "Content-Type" not in res.headers
+        assert res.headers["Cache-Control"] == f"public, max-age={http_cache.APP_RELEASE_MAX_AGE}"
+        assert "Accept-Encoding" in res.vary
+
+    def test_other_etags_get_the_release(self, app, appsvc_catalog):
+        res = app.test_client().get("/api/apps/app-1", headers={"If-None-Match": '"other"'})
+        assert res.status_code == 200 and res.get_json()["id"]
+
+    def test_cached_releases_arent_encoded_again(self, monkeypatch, app, appsvc_catalog):
+        client = app.test_client()
+        first = client.get("/api/apps/app-1")
+        monkeypatch.setattr(biz_app, "dumps", None)
+        monkeypatch.setattr(compression, "etag", None)
+        assert client.get("/api/apps/app-1", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+        assert client.get("/api/apps/app-1").get_data() == first.get_data()
+
+
+@pytest.mark.unit
+class TestReleasePrefetch:
+    @pytest.fixture
+    def prefetcher(self, monkeypatch):
+        monkeypatch.setattr(prefetch, "RELEASE_PREFETCH_ENABLED", True)
+        prefetcher = prefetch.release_prefetcher
+        monkeypatch.setattr(prefetcher, "_prefetched", type(prefetcher._prefetched)())
+        return prefetcher
+
+    def test_hits_count_as_used(self, appsvc_catalog, prefetcher):
+        biz_app.get_app_release("app-1")
+        prefetcher._prefetched["app-1"] = None
+        used = prefetcher.counters.snapshot().get("used", 0)
+        biz_app.get_app_release("app-1")
+        biz_app.get_app_release("app-1")
+        assert prefetcher.counters.snapshot()["used"] == used + 1
+
+    def test_not_found_hits_dont(self, appsvc_catalog, prefetcher):
+        with pytest.raises(AppSvcNotFoundException):
+            biz_app.get_app_release("app-unknown")
+        prefetcher._prefetched["app-unknown"] = None
+        used = prefetcher.counters.snapshot().get("used", 0)
+        with pytest.raises(AppSvcNotFoundException):
+            biz_app.get_app_release("app-unknown")
+        assert prefetcher.counters.snapshot().get("used", 0) == used
+
+
+@pytest.mark.unit
+class TestAclCache:
+    @pytest.fixture(autouse=True)
+    def narrowing(self, monkeypatch, appsvc_catalog):
+        monkeypatch.setattr(biz_app, "ACL_UPSTREAM_LIMIT", 10)
+        monkeypatch.setattr(biz_app, "_acl_narrowing_off", threading.Event())
+
+    @staticmethod
+    def narrowed() -> int:
+        return biz_app.acl_cache.counters.snapshot().get("narrowed", 0)
+
+    @pytest.mark.parametrize("app_name", ["Game 199", "GAME 199 d", "game 199:", "Game 199: The"])
+    def test_narrowed_replies_are_appsvc_ones(self, app_name):
+        # "game 199" has 3 names (with the alternative ones), fewer than the limit
+        biz_app.search_apps_acl(SearchAppsAclRequestDTO(app_name="game 199"))
+        narrowed = self.narrowed()
+        req = SearchAppsAclRequestDTO(app_name=app_name)
+        assert biz_app.search_apps_acl(req) == appsvc.search_apps_acl(req)
+        assert self.narrowed() == narrowed + 1
+
+    def test_capped_replies_arent_narrowed(self):
+        # "game 19" matches game 19 and 190 to 199
+        biz_app.search_apps_acl(SearchAppsAclRequestDTO(app_name="game 19"))
+        narrowed = self.narrowed()
+        req = SearchAppsAclRequestDTO(app_name="game 199")
+        assert biz_app.search_apps_acl(req) == appsvc.search_apps_acl(req)
+        assert self.narrowed() == narrowed
+
+    @pytest.mark.parametrize(
+        "acl",
+        [[f"Game 199 #{n}" for n in range(11)], ["Game 199", "Another Game 199"]],
+        ids=["longer than the limit", "not prefixed by the term"],
+    )
+    def test_unexpected_replies_turn_narrowing_off(self, monkeypatch, acl):
+        with monkeypatch.context() as m:
+            m.setattr(appsvc, "search_apps_acl", lambda req: {"acl": acl})
+            assert biz_app.search_apps_acl(SearchAppsAclRequestDTO(app_name="game 199")) == {"acl": acl}
+        assert biz_app.acl_cache.counters.snapshot()["narrowing_off"] >= 1
+        # complete replies aren't narrowed anymore
+        narrowed = self.narrowed()
+        biz_app.search_apps_acl(SearchAppsAclRequestDTO(app_name="game 198"))
+        biz_app.search_apps_acl(SearchAppsAclRequestDTO(app_name="game 198 d"))
+        assert self.narrowed() == narrowed
+
+
+def search_reply(apps: list[dict]) -> appsvc.AppsvcResponse:
+    return appsvc.AppsvcResponse(json.dumps({"apps": apps}).encode(), None, None, SCHEMA_VERSION)
+
+
+def search_item(n: int, name: str = "") -> dict:
+    return {
+        "cover_image_id": f"cover{n}",
+        "esrb_rating": 1,
+        "id": f"app-{n}",
+        "lang": "en",
+        "name": name or f"Game {n}",
+        "slug": f"game-{n}",
+        "year_released": 1990,
+        "ts_added": f"2024-01-01T00:{n:02}:00",
+    }
+
+
+@pytest.fixture
+def passthrough(monkeypatch):
+    monkeypatch.setattr(appsvc, "APPSVC_PASSTHROUGH", True)
+    monkeypatch.setattr(appsvc, "APPSVC_PASSTHROUGH_VALIDATE_RATE", 0)
+
+
+@pytest.mark.unit
+class TestSearchAppsPage:
+    def test_passthrough_reads_the_cursor_from_bytes(self, passthrough):
+        req = SearchAppsRequestDTO(limit=3)
+        res = search_reply([search_item(3), search_item(2), search_item(1)])
+        page = json.loads(biz_app.search_apps_page(req, res))
+        assert "body" not in res.__dict__, "the reply was decoded"
+        assert cursor.decode(page["next_cursor"], (str, str, str)) == ["ts_added", "2024-01-01T00:01:00", "app-1"]
+
+    @pytest.mark.parametrize(
+        "name", ['with "quotes"', "with {braces}}", "ends with a backslash \\", '"id": "app-0"}', '\\\\"{']
+    )
+    def test_passthrough_last_app_with_any_name(self, passthrough, name):
+        req = SearchAppsRequestDTO(limit=2, order_by=SearchAppsOrderBy.NAME)
+        page = json.loads(biz_app.search_apps_page(req, search_reply([search_item(2, "x"), search_item(1, name)])))
+        assert cursor.decode(page["next_cursor"], (str, str, str)) == ["name", name, "app-1"]
+
+    def test_passthrough_last_page(self, passthrough):
+        page = json.loads(biz_app.search_apps_page(SearchAppsRequestDTO(limit=3), search_reply([search_item(1)])))
+        assert page["next_cursor"] is None
+
+    def test_passthrough_empty_reply(self, passthrough):
+        res = appsvc.AppsvcResponse(b"{}", None, None, SCHEMA_VERSION)
+        assert json.loads(biz_app.search_apps_page(SearchAppsRequestDTO(), res)) == {"next_cursor": None}
+
+    def test_passthrough_other_shapes_are_decoded(self, passthrough):
+        raw = json.dumps({"apps": [search_item(2), search_item(1)], "total": 2}).encode()
+        res = appsvc.AppsvcResponse(raw, None, None, SCHEMA_VERSION)
+        page = biz_app.search_apps_page(SearchAppsRequestDTO(limit=2), res)
+        assert page["total"] == 2
+        assert cursor.decode(page["next_cursor"], (str, str, str)) == ["ts_added", "2024-01-01T00:01:00", "app-1"]
+
+    def test_items_without_ts_added_pass_validation(self):
+        body = {"apps": [{k: v for k, v in search_item(1).items() if k != "ts_added"}]}
+        assert codec(SearchAppsResponseDTO).dump(body) == body
+        assert SearchAppsResponseDTO.Schema().dump(body) == body
+
+
+@pytest.mark.unit
+class TestSearchCursor:
+    def test_round_trip(self):
+        assert cursor.decode(cursor.encode(["name", "Game 1", "app-1"]), (str, str, str)) == ["name", "Game 1", "app-1"]
+
+    @pytest.mark.parametrize("value", ["not base64!", cursor.encode(["name", "x"]), cursor.encode({"a": 1})])
+    def test_invalid(self, value):
+        with pytest.raises(ValidationError):
+            cursor.decode(value, (str, str, str))
+
+    def test_first_pages_send_no_keyset(self):
+        out_req = biz_app._search_apps_out_req(SearchAppsRequestDTO(), False)
+        assert "after_value" not in codec(SearchAppsRequestOutDTO).dump(out_req)
+        assert "after_id" not in codec(SearchAppsRequestOutDTO).dump(out_req)
+
+    def test_next_pages(self, app, appsvc_catalog):
+        client = app.test_client()
+        first = client.post("/api/apps/search", json={"limit": 5, "order_by": "name"}).json
+        second = client.post(
+            "/api/apps/search", json={"limit": 5, "order_by": "name", "cursor": first["next_cursor"]}
+        ).json
+        names = sorted(i["name"] for i in appsvc_catalog.items)
+        assert [a["name"] for a in first["apps"] + second["apps"]] == names[:10]
+
+    def test_cursor_of_another_order_by(self, app, appsvc_catalog):
+        client = app.test_client()
+        first = client.post("/api/apps/search", json={"limit": 5, "order_by": "name"}).json
+        res = client.post("/api/apps/search", json={"limit": 5, "order_by": "ts_added", "cursor": first["next_cursor"]})
+        assert res.status_code == 400
+        assert res.json["code"] == 1400
+
+    def test_made_up_cursor(self, app, appsvc_catalog):
+        res = app.test_client().post("/api/apps/search", json={"cursor": "made-up"})
+        assert res.status_code == 400
+
+
+@pytest.mark.unit
+class TestSearchAsYouType:
+    REQ = SearchAsYouTypeRequestDTO(app_name="game", limit=3)
+
+    @pytest.fixture(autouse=True)
+    def timeouts(self, monkeypatch, appsvc_catalog):
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_ACL_TIMEOUT", 5)
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT", 5)
+
+    @staticmethod
+    def stats() -> dict:
+        return biz_app.search_as_you_type_stats.snapshot()
+
+    @staticmethod
+    def search_async(req: SearchAsYouTypeRequestDTO, then: t.Optional[t.Callable[[], t.Awaitable]] = None) -> dict:
+        async def call() -> dict:
+            try:
+                res = await biz_app.search_as_you_type_async(req, False)
+                if then is not None:
+                    # before the clients are closed, e.g. waiting for the calls left running
+                    await then()
+                return res
+            finally:
+                await appsvc_async.close_clients()
+
+        return asyncio.run(call())
+
+    def test_sides_are_fetched_concurrently(self, monkeypatch):
+        # each side waits for the other one to start: run one after the other, they would both fail
+        both_started = threading.Barrier(2, timeout=2)
+        search_apps_acl, fetch_search_apps = biz_app.search_apps_acl, biz_app.fetch_search_apps
+
+        def acl(*args):
+            both_started.wait()
+            return search_apps_acl(*args)
+
+        def search(*args):
+            both_started.wait()
+            return fetch_search_apps(*args)
+
+        monkeypatch.setattr(biz_app, "search_apps_acl", acl)
+        monkeypatch.setattr(biz_app, "fetch_search_apps", search)
+        res = biz_app.search_as_you_type(self.REQ, False)
+        assert res["errors"] == {}
+        assert res["acl"] and len(res["apps"]) == 3 and res["next_cursor"]
+
+    def test_sides_are_fetched_concurrently_async(self, monkeypatch):
+        both_started = asyncio.Barrier(2)
+        search_apps_acl, fetch_search_apps = biz_app.search_apps_acl_async, biz_app.fetch_search_apps_async
+
+        async def acl(*args):
+            await asyncio.wait_for(both_started.wait(), 2)
+            return await search_apps_acl(*args)
+
+        async def search(*args):
+            await asyncio.wait_for(both_started.wait(), 2)
+            return await fetch_search_apps(*args)
+
+        monkeypatch.setattr(biz_app, "search_apps_acl_async", acl)
+        monkeypatch.setattr(biz_app, "fetch_search_apps_async", search)
+        res = self.search_async(self.REQ)
+        assert res["errors"] == {}
+        assert res["acl"] and len(res["apps"]) == 3 and res["next_cursor"]
+
+    def test_a_side_past_its_timeout_is_reported(self, monkeypatch):
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT", 0.05)
+        fetch_search_apps = biz_app.fetch_search_apps
+        release = threading.Event()
+
+        def search(*args):
+            release.wait(5)
+            return fetch_search_apps(*args)
+
+        monkeypatch.setattr(biz_app, "fetch_search_apps", search)
+        timeouts = self.stats()["search_timeouts"]
+        try:
+            res = biz_app.search_as_you_type(self.REQ, False)
+        finally:
+            release.set()
+        assert res["acl"] and res["apps"] is None and res["next_cursor"] is None
+        assert res["errors"] == {"search": {"code": 1409, "message": "appsvc error: search timed out"}}
+        assert self.stats()["search_timeouts"] == timeouts + 1
+        # the call kept running, its reply is served to the next keystroke
+        wait_until(lambda: biz_app.search_cache.get_stats()["entries"] == 1)
+        monkeypatch.setattr(biz_app, "fetch_search_apps", fetch_search_apps)
+        assert biz_app.search_as_you_type(self.REQ, False)["errors"] == {}
+
+    def test_a_failed_side_is_reported(self, monkeypatch):
+        def fail(*args):
+            raise AppSvcException("appsvc search_apps_acl: circuit open")
+
+        monkeypatch.setattr(biz_app, "search_apps_acl", fail)
+        errors = self.stats()["acl_errors"]
+        res = biz_app.search_as_you_type(self.REQ, False)
+        assert res["acl"] is None and len(res["apps"]) == 3
+        assert res["errors"] == {"acl": {"code": 1409, "message": "appsvc search_apps_acl: circuit open"}}
+        assert self.stats()["acl_errors"] == errors + 1
+
+    def test_a_side_past_its_timeout_is_reported_async(self, monkeypatch):
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_ACL_TIMEOUT", 0.05)
+        search_apps_acl = biz_app.search_apps_acl_async
+        calls: list[asyncio.Task] = []
+
+        async def acl(*args):
+            calls.append(asyncio.current_task())
+            await asyncio.sleep(0.1)
+            return await search_apps_acl(*args)
+
+        async def losing_call_done() -> None:
+            await asyncio.wait_for(asyncio.gather(*calls), 2)
+
+        monkeypatch.setattr(biz_app, "search_apps_acl_async", acl)
+        timeouts = self.stats()["acl_timeouts"]
+        res = self.search_async(self.REQ, losing_call_done)
+        assert res["acl"] is None and len(res["apps"]) == 3
+        assert res["errors"] == {"acl": {"code": 1409, "message": "appsvc error: acl timed out"}}
+        assert self.stats()["acl_timeouts"] == timeouts + 1
+        # the losing call wasn't cancelled, its reply was cached
+        assert not calls[0].cancelled()
+        assert biz_app.acl_cache.get_stats()["entries"]
+
+    def test_queued_losing_calls_are_cancelled(self, monkeypatch):
+        # one worker: the search waits for the ACL call, which is past both timeouts
+        executor = ThreadPoolExecutor(max_workers=1)
+        monkeypatch.setattr(biz_app, "get_executor", lambda *args: executor)
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_ACL_TIMEOUT", 0.05)
+        monkeypatch.setattr(biz_app, "SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT", 0.05)
+        search_apps_acl = biz_app.search_apps_acl
+        release = threading.Event()
+        calls: list[str] = []
+
+        def acl(*args):
+            calls.append("acl")
+            release.wait(5)
+            return search_apps_acl(*args)
+
+        monkeypatch.setattr(biz_app, "search_apps_acl", acl)
+        monkeypatch.setattr(biz_app, "fetch_search_apps", lambda *args: calls.append("search"))
+        try:
+            res = biz_app.search_as_you_type(self.REQ, False)
+        finally:
+            release.set()
+            executor.shutdown(wait=True)
+        assert set(res["errors"]) == {"acl", "search"}
+        # the running call completed, the queued one never ran
+        assert calls == ["acl"]
+        assert biz_app.acl_cache.get_stats()["entries"]
+
+
+def wait_until(condition: t.Callable[[], bool]) -> None:
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert condition()
@@ -0,0 +1,239 @@
+import asyncio
+import io
+import itertools
+import json
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from yagsvc.biz.errors import AppSvcException
+from yagsvc.services import (
+    appsvc,
+    appsvc_async,
+)
+from yagsvc.services.dto.appsvc import SearchAppsRequestOutDTO
+from yagsvc.services.helpers import (
+    CircuitBreaker,
+    LatencyTracker,
+)
+
+
+def hedges() -> dict:
+    return appsvc.hedge_stats.snapshot()
+
+
+@pytest.mark.unit
+class TestHedged:
+    @pytest.fixture
+    def executor(self, request, monkeypatch):
+        executor = ThreadPoolExecutor(request.param)
+        monkeypatch.setattr(appsvc, "get_executor", lambda name, n: executor)
+        yield executor
+        executor.shutdown()
+
+    @pytest.mark.parametrize("executor", [2], indirect=True)
+    def test_slow_calls_are_hedged(self, monkeypatch, executor):
+        monkeypatch.setattr(appsvc, "get_hedge_delay", lambda endpoint: 0.01)
+        monkeypatch.setattr(appsvc, "APPSVC_HEDGE_BUDGET", 1)
+        calls = itertools.count()
+
+        def fn():
+            n = next(calls)
+            time.sleep(0.2 if n == 0 else 0)
+            return n
+
+        before = hedges()
+        assert appsvc.hedged("get_app_release", fn) == 1
+        assert hedges()["hedged"] == before["hedged"] + 1
+        assert hedges()["hedge_wins"] == before["hedge_wins"] + 1
+
+    def test_calls_without_latencies_arent_hedged(self, monkeypatch):
+        monkeypatch.setattr(appsvc, "APPSVC_HEDGING", True)
+        monkeypatch.setitem(appsvc.latencies, "get_app_release", LatencyTracker(window=10, min_samples=1))
+        before = hedges()
+        assert appsvc.hedged("get_app_release", threading.current_thread) is threading.current_thread()
+        assert hedges() == before
+
+    @pytest.mark.parametrize("executor", [1], indirect=True)
+    def test_calls_run_inline_without_a_free_worker(self, monkeypatch, executor):
+        monkeypatch.setattr(appsvc, "get_hedge_delay", lambda endpoint: 0.01)
+        monkeypatch.setattr(appsvc, "_hedge_slots", threading.BoundedSemaphore(1))
+        appsvc._hedge_slots.acquire()
+        before = hedges()
+        assert appsvc.hedged("get_app_release", threading.current_thread) is threading.current_thread()
+        assert hedges() == before
+
+    @pytest.mark.parametrize("executor", [1], indirect=True)
+    def test_hedges_need_a_free_worker(self, monkeypatch, executor):
+        monkeypatch.setattr(appsvc, "get_hedge_delay", lambda endpoint: 0.01)
+        monkeypatch.setattr(appsvc, "_hedge_slots", threading.BoundedSemaphore(1))
+        before = hedges()
+        assert appsvc.hedged("get_app_release", lambda: time.sleep(0.05) or "reply") == "reply"
+        assert hedges()["calls"] == before["calls"] + 1
+        assert hedges()["hedged"] == before["hedged"]
+        assert appsvc._hedge_slots.acquire(blocking=False)
+
+    @pytest.mark.parametrize("executor", [2], indirect=True)
+    def test_hedges_are_within_budget(self, monkeypatch, executor):
+        monkeypatch.setattr(appsvc, "get_hedge_delay", lambda endpoint: 0.01)
+        monkeypatch.setattr(appsvc, "APPSVC_HEDGE_BUDGET", 0)
+        before = hedges()
+        assert appsvc.hedged("get_app_release", lambda: time.sleep(0.05) or "reply") == "reply"
+        assert hedges()["hedged"] == before["hedged"]
+
+    @pytest.mark.parametrize("executor", [2], indirect=True)
+    def test_hedges_dont_take_the_slots_of_first_attempts(self, monkeypatch, executor, appsvc_catalog):
+        monkeypatch.setattr(appsvc, "get_hedge_delay", lambda endpoint: 0)
+        monkeypatch.setattr(appsvc, "APPSVC_HEDGE_BUDGET", 1)
+        client_bulkhead = appsvc.bulkheads["get_app_release"]
+        hedge_bulkhead = appsvc.bulkheads[appsvc.APP_RELEASE_HEDGE_BULKHEAD]
+        # clients calls take all the get_app_release slots but one meanwhile
+        held = 0
+        while client_bulkhead.get_stats()["active"] < client_bulkhead.max_concurrent - 1 and client_bulkhead.acquire():
+            held += 1
+        before, hedge_before = client_bulkhead.get_stats(), hedge_bulkhead.get_stats()
+        try:
+            assert appsvc.fetch_app_release("app-1").body["uuid"] == "app-1"
+            executor.shutdown()
+        finally:
+            for _ in range(held):
+                client_bulkhead.release()
+        after = client_bulkhead.get_stats()
+        assert (after["calls"], after["rejected"]) == (before["calls"] + 1, before["rejected"])
+        assert hedge_bulkhead.get_stats()["calls"] == hedge_before["calls"] + 1
+
+
+@pytest.mark.unit
+class TestRequest:
+    @pytest.fixture
+    def breaker(self, monkeypatch) -> CircuitBreaker:
+        """A breaker whose next call is the probe of its half-open state."""
+        breaker = CircuitBreaker(
+            "test_breaker", window=1, min_calls=1, failure_rate=0.5, slow_call_secs=10, slow_call_rate=1, open_secs=0
+        )
+        breaker.allow()
+        breaker.record(True, 0)
+        monkeypatch.setitem(appsvc.breakers, "get_app_release", breaker)
+        return breaker
+
+    @pytest.fixture
+    def failing_span(self, monkeypatch):
+        def span(*args):
+            raise RuntimeError("span not created")
+
+        monkeypatch.setattr(appsvc.tracing, "span", span)
+
+    def test_probes_of_calls_never_made_are_released(self, breaker, failing_span, appsvc_catalog):
+        with pytest.raises(RuntimeError):
+            appsvc.get_client().get("get_app_release", "/apps/app-1")
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+
+    def test_probes_of_calls_never_made_are_released_async(self, breaker, failing_span, appsvc_catalog):
+        async def call() -> None:
+            try:
+                await appsvc_async.get_client().get("get_app_release", "/apps/app-1")
+            finally:
+                await appsvc_async.close_clients()
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(call())
+        assert breaker.allow()
+
+    def test_only_successful_durations_are_tracked(self, monkeypatch, breaker, appsvc_catalog):
+        tracker = LatencyTracker(window=10, min_samples=1)
+        monkeypatch.setitem(appsvc.latencies, "get_app_release", tracker)
+        client = appsvc.get_client()
+        client.get("get_app_release", "/apps/app-1")
+        assert tracker.percentile(100) is not None
+
+        def refused(*args, **kwargs):
+            time.sleep(0.05)
+            raise requests.ConnectionError("refused")
+
+        monkeypatch.setattr(client.session, "request", refused)
+        with pytest.raises(requests.ConnectionError):
+            client.get("get_app_release", "/apps/app-1")
+        assert tracker.percentile(100) < 0.05
+
+
+def response(body: bytes, status_code: int = 200) -> requests.Response:
+    res = requests.Response()
+    res.status_code = status_code
+    res.raw = io.BytesIO(body)
+    return res
+
+
+def read_stream(body: bytes, deadline: float = float("inf")) -> list[dict]:
+    return [app for apps in appsvc._iter_search_apps(response(body), deadline) for app in apps]
+
+
+APPS = [{"id": f"app-{n}", "name": f"Game {n}", "alternative_names": ["x" * 20]} for n in range(5)]
+
+
+@pytest.mark.unit
+class TestStreamSearchApps:
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 8192])
+    def test_apps_split_across_chunks(self, monkeypatch, chunk_size):
+        monkeypatch.setattr(appsvc, "APPSVC_STREAM_CHUNK_SIZE", chunk_size)
+        body = json.dumps({"apps": APPS}, indent=2).encode()
+        assert read_stream(body) == APPS
+
+    @pytest.mark.parametrize("chunk_size", range(1, 12))
+    def test_characters_split_across_chunks(self, monkeypatch, chunk_size):
+        monkeypatch.setattr(appsvc, "APPSVC_STREAM_CHUNK_SIZE", chunk_size)
+        # 2, 3 and 4 byte UTF-8 sequences, sent as they are: some chunks end within one of them
+        apps = [{"id": "app-1", "name": "Pokémon ☃ 🎮"}, {"id": "app-2", "name": "ÆØÅ"}]
+        body = json.dumps({"apps": apps}, ensure_ascii=False).encode()
+        assert read_stream(body) == apps
+
+    def test_apps_are_yielded_as_chunks_come(self, monkeypatch):
+        monkeypatch.setattr(appsvc, "APPSVC_STREAM_CHUNK_SIZE", 64)
+        body = json.dumps({"apps": APPS}).encode()
+        batches = list(appsvc._iter_search_apps(response(body), float("inf")))
+        assert len(batches) > 1
+        assert [app for apps in batches for app in apps] == APPS
+
+    @pytest.mark.parametrize(
+        "body", [b'{"apps": [{"id": "app-1"}, {"id": "app-2", "na', b'{"apps": [{"id": "app-1"}', b'{"ap']
+    )
+    def test_truncated_replies(self, monkeypatch, body):
+        monkeypatch.setattr(appsvc, "APPSVC_STREAM_CHUNK_SIZE", 8)
+        apps = []
+        with pytest.raises(AppSvcException, match="truncated"):
+            for batch in appsvc._iter_search_apps(response(body), float("inf")):
+                apps += batch
+        # the apps read whole were returned meanwhile
+        assert apps == ([{"id": "app-1"}] if b"app-1" in body else [])
+
+    def test_deadline_exceeded(self, monkeypatch):
+        monkeypatch.setattr(appsvc, "APPSVC_STREAM_CHUNK_SIZE", 16)
+        body = json.dumps({"apps": APPS}).encode()
+        stream = appsvc._iter_search_apps(response(body), time.monotonic() + 0.05)
+        first = next(stream)
+        time.sleep(0.06)
+        with pytest.raises(AppSvcException, match="not read in time"):
+            list(stream)
+        assert all(app in APPS for app in first)
+
+    @pytest.mark.parametrize(
+        "reply",
+        [response(b"appsvc failed", 500), AppSvcException("appsvc search_apps: circuit open")],
+        ids=["error_reply", "failed_call"],
+    )
+    def test_upstream_errors_before_the_first_byte(self, monkeypatch, reply):
+        def post(*args: t.Any, **kwargs: t.Any) -> requests.Response:
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        monkeypatch.setattr(appsvc.get_client(), "post", post)
+        active = appsvc.stream_bulkhead.get_stats()["active"]
+        with pytest.raises(AppSvcException):
+            appsvc.stream_search_apps(SearchAppsRequestOutDTO())
+        # raised by the call itself, before any app, with the stream's slot released
+        assert appsvc.stream_bulkhead.get_stats()["active"] == active
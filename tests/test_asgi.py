@@ -0,0 +1,144 @@
+import asyncio
+import json
+import typing as t
+
+import pytest
+from flask import Flask
+
+from yagsvc.asgi import AsgiApp
+from yagsvc.services import appsvc_async
+
+# headers which both serving modes must send alike
+COMPARED_HEADERS = ["content-type", "content-length", "content-encoding", "etag", "cache-control", "vary"]
+
+Reply = tuple[int, dict[str, str], bytes]
+
+
+def asgi_request(asgi_app: AsgiApp, method: str, path: str, body: bytes, headers: dict[str, str]) -> Reply:
+    async def call() -> Reply:
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "server": ("localhost", 80),
+            "method": method,
+            "path": path,
+            "query_string": b"",
+            "headers": [
+                (k.lower().encode("latin-1"), v.encode("latin-1"))
+                for k, v in {**headers, "Content-Length": str(len(body))}.items()
+            ],
+        }
+        messages: list[dict] = []
+
+        async def receive() -> dict:
+            return {"type": "http.request", "body": body}
+
+        async def send(message: dict) -> None:
+            messages.append(message)
+
+        try:
+            await asgi_app(scope, receive, send)
+        finally:
+            await appsvc_async.close_clients()
+        start, *bodies = messages
+        return (
+            start["status"],
+            {k.decode("latin-1"): v.decode("latin-1") for k, v in start["headers"]},
+            b"".join(m.get("body", b"") for m in bodies),
+        )
+
+    return asyncio.run(call())
+
+
+def flask_request(app: Flask, method: str, path: str, body: bytes, headers: dict[str, str]) -> Reply:
+    res = app.test_client().open(path, method=method, data=body, headers=headers)
+    return res.status_code, {k.lower(): v for k, v in res.headers.items()}, res.get_data()
+
+
+def compared(reply: Reply) -> Reply:
+    status, headers, body = reply
+    return status, {k: v for k, v in headers.items() if k in COMPARED_HEADERS}, body
+
+
+JSON = {"Content-Type": "application/json"}
+
+
+@pytest.mark.unit
+class TestNativeRoutes:
+    @pytest.fixture
+    def asgi_app(self, app, appsvc_catalog) -> AsgiApp:
+        return AsgiApp(app)
+
+    @pytest.mark.parametrize(
+        "method, path, body, headers",
+        [
+            ("GET", "/api/apps/app-1", b"", {}),
+            ("GET", "/api/apps/app-1", b"", {"Accept-Encoding": "gzip"}),
+            ("GET", "/api/apps/app-unknown", b"", {}),
+            ("POST", "/api/apps/search", b"{}", JSON),
+            ("POST", "/api/apps/search", b'{"limit": 50}', {**JSON, "Accept-Encoding": "br, gzip"}),
+            # cookies other than a session one leave users anonymous
+            ("POST", "/api/apps/search", b"{}", {**JSON, "Cookie": "_ga=GA1.1.123"}),
+            ("POST", "/api/apps/search/acl", b'{"app_name": "game"}', JSON),
+            ("POST", "/api/apps/search/as-you-type", b'{"app_name": "game"}', JSON),
+            ("POST", "/api/apps/search/as-you-type", b'{"app_name": "game"}', {**JSON, "Cookie": "_ga=GA1.1.123"}),
+        ],
+    )
+    def test_replies_are_the_flask_ones(self, app, asgi_app, method, path, body, headers):
+        flask_reply = compared(flask_request(app, method, path, body, headers))
+        assert compared(asgi_request(asgi_app, method, path, body, headers)) == flask_reply
+
+    @pytest.mark.parametrize(
+        "path, body, headers",
+        [
+            ("/api/apps/search", b"{not json", JSON),
+            ("/api/apps/search", b"", JSON),
+            ("/api/apps/search", b"{}", {"Content-Type": "text/plain"}),
+            ("/api/apps/search", b"{}", {}),
+            ("/api/apps/search", b'{"app_name": "a"}', JSON),
+            ("/api/apps/search", b'{"cursor": "made-up"}', JSON),
+            ("/api/apps/search/acl", b"{not json", JSON),
+            ("/api/apps/search/acl", b'{"app_name": "a"}', JSON),
+            ("/api/apps/search/as-you-type", b"{not json", JSON),
+            ("/api/apps/search/as-you-type", b"{}", JSON),
+        ],
+    )
+    def test_errors_are_the_flask_ones(self, app, asgi_app, path, body, headers):
+        flask_reply = compared(flask_request(app, "POST", path, body, headers))
+        assert flask_reply[0] in (400, 415)
+        assert compared(asgi_request(asgi_app, "POST", path, body, headers)) == flask_reply
+
+    def test_not_modified(self, app, asgi_app):
+        _, headers, _ = flask_request(app, "GET", "/api/apps/app-1", b"", {})
+        conditional = {"If-None-Match": headers["etag"]}
+        flask_reply = compared(flask_request(app, "GET", "/api/apps/app-1", b"", conditional))
+        assert flask_reply[0] == 304
+        assert compared(asgi_request(asgi_app, "GET", "/api/apps/app-1", b"", conditional)) == flask_reply
+
+    def test_other_routes_are_served_by_flask(self, app, asgi_app):
+        body = json.dumps({"app_release_uuids": ["app-1"]}).encode()
+        status, _, data = asgi_request(asgi_app, "POST", "/api/apps/batch", body, JSON)
+        assert status == 200
+        assert list(json.loads(data)["apps"]) == ["app-1"]
+
+
+@pytest.mark.unit
+class TestHedged:
+    def test_cancelled_callers_cancel_the_first_call(self, monkeypatch):
+        monkeypatch.setattr(appsvc_async, "get_hedge_delay", lambda endpoint: 10)
+        calls: list[asyncio.Task] = []
+
+        async def fn() -> t.Any:
+            calls.append(asyncio.current_task())
+            await asyncio.sleep(10)
+
+        async def call() -> None:
+            caller = asyncio.ensure_future(appsvc_async.hedged("get_app_release", fn))
+            await asyncio.sleep(0.01)
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+            await asyncio.sleep(0)
+            assert len(calls) == 1 and calls[0].cancelled()
+
+        asyncio.run(call())
@@ -0,0 +1,186 @@
+import threading
+import time
+import typing as t
+
+import pytest
+
+import yagsvc.biz.app as biz_app
+from yagsvc.biz.cache import TTLCache
+from yagsvc.biz.errors import (
+    AppSvcException,
+    AppSvcNotFoundException,
+)
+from yagsvc.dto.app import SearchAppsRequestDTO
+
+
+def counters(cache: TTLCache) -> dict:
+    return cache.counters.snapshot()
+
+
+@pytest.mark.unit
+class TestTTLCache:
+    def test_get_put(self):
+        cache = TTLCache("test_cache", 10, 1000)
+        assert cache.get("a") is None
+        cache.put("a", 1, 10, 60, etag='"v1"', error="none")
+        entry = cache.get("a")
+        assert (entry.value, entry.etag, entry.meta) == (1, '"v1"', {"error": "none"})
+        assert entry.is_fresh()
+        assert counters(cache) == {"hits": 1, "misses": 1, "stale": 0, "evictions": 0}
+
+    def test_expired_entries_are_returned_as_stale(self):
+        cache = TTLCache("test_cache", 10, 1000)
+        cache.put("a", 1, 10, 0.01)
+        time.sleep(0.02)
+        entry = cache.get("a")
+        assert entry.value == 1 and not entry.is_fresh()
+        assert counters(cache)["stale"] == 1
+
+    def test_probes_arent_counted(self):
+        cache = TTLCache("test_cache", 10, 1000)
+        cache.put("a", 1, 10, 60)
+        assert cache.get("a", record=False).value == 1
+        assert cache.get("b", record=False) is None
+        assert counters(cache) == {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def test_evicts_least_recently_used_entries(self):
+        cache = TTLCache("test_cache", 2, 1000)
+        cache.put("a", 1, 10, 60)
+        cache.put("b", 2, 10, 60)
+        cache.get("a")
+        cache.put("c", 3, 10, 60)
+        assert cache.get("b", record=False) is None
+        assert cache.get("a", record=False) is not None
+        assert counters(cache)["evictions"] == 1
+
+    def test_evicts_past_max_bytes(self):
+        cache = TTLCache("test_cache", 10, 100)
+        cache.put("a", 1, 60, 60)
+        cache.put("b", 2, 60, 60)
+        assert cache.get("a", record=False) is None
+        assert cache.get_stats()["bytes"] == 60
+        # replacing an entry releases its bytes
+        cache.put("b", 3, 40, 60)
+        assert (cache.get_stats()["entries"], cache.get_stats()["bytes"]) == (1, 40)
+
+    def test_entries_larger_than_the_cache_arent_kept(self):
+        cache = TTLCache("test_cache", 10, 100)
+        assert cache.put("a", 1, 101, 60).value == 1
+        assert cache.get("a") is None
+
+    def test_invalidate_and_clear(self):
+        cache = TTLCache("test_cache", 10, 1000)
+        cache.put("a", 1, 10, 60)
+        cache.put("b", 2, 10, 60)
+        cache.invalidate("a")
+        assert cache.get("a", record=False) is None
+        cache.clear()
+        assert cache.get_stats()["entries"] == cache.get_stats()["bytes"] == 0
+
+
+@pytest.mark.unit
+class TestReleaseCache:
+    def test_expired_releases_are_revalidated(self, monkeypatch, appsvc_catalog):
+        monkeypatch.setattr(biz_app, "APP_RELEASE_CACHE_TTL", 0.01)
+        first = biz_app.get_app_release("app-1")
+        assert biz_app.release_cache.get("app-1", record=False).etag == '"app-1-v1"'
+        time.sleep(0.02)
+        revalidated = counters(biz_app.release_cache).get("revalidated", 0)
+        # appsvc replied 304: the cached body is served again
+        assert biz_app.get_app_release("app-1") is first
+        assert counters(biz_app.release_cache)["revalidated"] == revalidated + 1
+
+    def test_unknown_releases_are_cached(self, appsvc_catalog):
+        with pytest.raises(AppSvcNotFoundException):
+            biz_app.get_app_release("app-unknown")
+        entry = biz_app.release_cache.get("app-unknown", record=False)
+        assert entry.value is None and entry.is_fresh()
+        hits = counters(biz_app.release_cache)["hits"]
+        with pytest.raises(AppSvcNotFoundException) as e:
+            biz_app.get_app_release("app-unknown")
+        assert e.value.message == entry.meta["error"]
+        assert counters(biz_app.release_cache)["hits"] == hits + 1
+
+
+@pytest.mark.unit
+class TestSearchCache:
+    @pytest.fixture
+    def refreshes(self, monkeypatch, appsvc_catalog) -> t.Iterator[tuple[list, threading.Event]]:
+        """Calls to appsvc, which are held until the returned event is set."""
+        monkeypatch.setattr(biz_app, "SEARCH_CACHE_TTL", 0.01)
+        fetch_search_apps = biz_app.appsvc.fetch_search_apps
+        calls: list = []
+        release = threading.Event()
+        release.set()
+
+        def fetch(req):
+            calls.append(req)
+            release.wait(5)
+            return fetch_search_apps(req)
+
+        monkeypatch.setattr(biz_app.appsvc, "fetch_search_apps", fetch)
+        yield calls, release
+        release.set()
+        wait_for_refreshes()
+
+    def test_stale_hits_are_served_and_refreshed_once(self, refreshes):
+        calls, release = refreshes
+        req = SearchAppsRequestDTO(limit=3)
+        first = biz_app.fetch_search_apps(req, False)
+        time.sleep(0.02)
+        release.clear()
+        refreshed = counters(biz_app.search_cache).get("refreshes", 0)
+        # while the refresh is held, every stale hit is served the old reply
+        replies = run_concurrently(lambda: biz_app.fetch_search_apps(req, False), 8)
+        assert all(reply is first for reply in replies)
+        assert counters(biz_app.search_cache)["refreshes"] == refreshed + 1
+        release.set()
+        wait_for_refreshes()
+        assert len(calls) == 2
+        fresh = biz_app.fetch_search_apps(req, False)
+        assert fresh is not first and fresh.body == first.body
+
+    def test_failed_refreshes_keep_the_stale_entry(self, monkeypatch, refreshes):
+        calls, _ = refreshes
+        req = SearchAppsRequestDTO(limit=3)
+        first = biz_app.fetch_search_apps(req, False)
+        time.sleep(0.02)
+
+        def fail(req):
+            calls.append(req)
+            raise AppSvcException("appsvc search_apps: unavailable")
+
+        monkeypatch.setattr(biz_app.appsvc, "fetch_search_apps", fail)
+        errors = counters(biz_app.search_cache).get("refresh_errors", 0)
+        assert biz_app.fetch_search_apps(req, False) is first
+        wait_for_refreshes()
+        assert len(calls) == 2
+        assert counters(biz_app.search_cache)["refresh_errors"] == errors + 1
+        # the next stale hit is still served from the cache, and retries the refresh
+        assert biz_app.fetch_search_apps(req, False) is first
+        wait_for_refreshes()
+        assert len(calls) == 3
+
+
+def run_concurrently(fn: t.Callable[[], t.Any], n: int) -> list:
+    barrier = threading.Barrier(n)
+    results: list = [None] * n
+
+    def run(i: int) -> None:
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def wait_for_refreshes() -> None:
+    # keys are marked as refreshing before being submitted, and unmarked once done
+    deadline = time.monotonic() + 5
+    while biz_app._search_refreshing and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert not biz_app._search_refreshing
@@ -0,0 +1,107 @@
+import datetime
+import inspect
+import typing as t
+
+import pytest
+from marshmallow import (
+    Schema,
+    fields,
+    post_dump,
+)
+
+from yagsvc.dto.codec import (
+    DTO_MODULES,
+    _compile_schema,
+    _dump_hooks,
+    codec,
+)
+from yagsvc.services import appsvc
+from yagsvc.services.dto.appsvc import (
+    GetAppReleaseResponseDTO,
+    SearchAppsRequestOutDTO,
+    SearchAppsResponseDTO,
+)
+
+DTOS = [
+    dto
+    for module in DTO_MODULES
+    for _, dto in inspect.getmembers(module, inspect.isclass)
+    if dto.__module__ == module.__name__ and hasattr(dto, "Schema")
+]
+
+
+def sample(field: fields.Field, variant: str) -> t.Any:
+    # pylint: disable=too-many-return-statements
+    if variant == "nones":
+        return None
+    if isinstance(field, fields.Nested):
+        item = sample_dict(field.schema, variant)
+        return [item, {}] if field.many else item
+    if isinstance(field, fields.List):
+        return [sample(field.inner, variant), sample(field.inner, variant)]
+    if isinstance(field, fields.Dict):
+        return {"key": sample(field.value_field or fields.Raw(), variant)}
+    if isinstance(field, fields.Enum):
+        return next(iter(field.enum))
+    if isinstance(field, fields.DateTime):
+        return datetime.datetime(2000, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    if isinstance(field, fields.Date):
+        return datetime.date(2000, 1, 1)
+    if variant == "converted":
+        # values of another type than their fields', which the fields convert
+        return 1 if isinstance(field, fields.String) else "1"
+    if isinstance(field, fields.Boolean):
+        return True
+    if isinstance(field, fields.Number):
+        return 1
+    return "value"
+
+
+def sample_dict(schema: Schema, variant: str) -> dict:
+    return {name: sample(field, variant) for name, field in schema.fields.items()}
+
+
+@pytest.mark.unit
+class TestCodec:
+    @pytest.mark.parametrize("dto", DTOS, ids=lambda dto: dto.__name__)
+    @pytest.mark.parametrize("variant", ["values", "nones", "converted"])
+    def test_dict_dumps_are_the_schema_ones(self, dto, variant):
+        obj = sample_dict(dto.Schema(), variant)
+        try:
+            expected = dto.Schema().dump(obj)
+        except (TypeError, ValueError):
+            pytest.skip("the schema can't dump this sample either")
+        assert codec(dto).dump(obj) == expected
+
+    @pytest.mark.parametrize("dto", DTOS, ids=lambda dto: dto.__name__)
+    def test_missing_keys(self, dto):
+        try:
+            expected = dto.Schema().dump({})
+        except TypeError:
+            # marshmallow reads missing keys as attributes, e.g. dict.items for an items field
+            pytest.skip("the schema can't dump this sample either")
+        assert codec(dto).dump({}) == expected
+
+    def test_appsvc_replies(self, appsvc_catalog):
+        release = appsvc.get_app_release("app-1")
+        assert codec(GetAppReleaseResponseDTO).dump(release) == GetAppReleaseResponseDTO.Schema().dump(release)
+        reply = {"apps": appsvc_catalog.items[:20]}
+        assert codec(SearchAppsResponseDTO).dump(reply) == SearchAppsResponseDTO.Schema().dump(reply)
+
+    def test_none_of_omit_none_fields_is_left_out(self):
+        req = {"limit": 10, "after_value": None, "after_id": None}
+        assert "after_value" not in codec(SearchAppsRequestOutDTO).dump(req)
+        assert codec(SearchAppsRequestOutDTO).dump(req) == SearchAppsRequestOutDTO.Schema().dump(req)
+
+    def test_schemas_with_dump_hooks_of_their_own_arent_compiled(self):
+        class HookedSchema(Schema):
+            name = fields.String()
+
+            @post_dump
+            def upper(self, data: dict, **kwargs: t.Any) -> dict:
+                return {k: v.upper() for k, v in data.items()}
+
+        schema = HookedSchema()
+        assert _dump_hooks(schema) == {"upper"}
+        assert _compile_schema(schema)({"name": "a"}) == {"name": "A"}
+        assert _dump_hooks(SearchAppsRequestOutDTO.Schema()) == {"omit_none"}
@@ -0,0 +1,131 @@
+import gzip
+import os
+import subprocess
+import sys
+
+import brotli
+import pytest
+from flask import jsonify
+from werkzeug.http import (
+    parse_accept_header,
+    parse_etags,
+)
+
+from yagsvc.biz import compression
+
+PRECOMPRESS_STATIC = os.path.join(os.path.dirname(__file__), "..", "scripts", "precompress_static.py")
+
+CSS = b"body { margin: 0; padding: 0; }\n" * 100
+
+
+@pytest.mark.unit
+class TestNegotiate:
+    @pytest.mark.parametrize(
+        "accept_encoding, encoding",
+        [
+            ("br, gzip", "br"),
+            ("gzip, deflate, br", "br"),
+            ("gzip", "gzip"),
+            ("gzip;q=1, br;q=0.5", "gzip"),
+            ("br;q=0, gzip", "gzip"),
+            ("*", "br"),
+            ("identity", None),
+            ("", None),
+        ],
+    )
+    def test_choose_encoding(self, accept_encoding, encoding):
+        assert compression.choose_encoding(parse_accept_header(accept_encoding)) == encoding
+
+    def test_min_size(self):
+        accept = parse_accept_header("br, gzip")
+        assert compression.negotiate(accept, compression.COMPRESSION_MIN_SIZE - 1) is None
+        assert compression.negotiate(accept, compression.COMPRESSION_MIN_SIZE) == "br"
+
+    @pytest.mark.parametrize("encoding", [None, "br", "gzip"])
+    def test_etags_of_any_encoding_match(self, encoding):
+        if_none_match = parse_etags(f'"{compression.encoded_etag("abc", encoding)}"')
+        assert compression.etag_matches(if_none_match, "abc")
+        assert not compression.etag_matches(if_none_match, "abd")
+
+
+@pytest.mark.unit
+class TestCompressResponse:
+    BIG = {"apps": [f"app-{i}" for i in range(500)]}
+
+    @staticmethod
+    def compressed(app, body: dict, accept_encoding: str):
+        with app.test_request_context(headers={"Accept-Encoding": accept_encoding}):
+            res = jsonify(body)
+            res.set_etag("abc")
+            return compression.compress_response(res)
+
+    @pytest.mark.parametrize("encoding, decompress", [("br", brotli.decompress), ("gzip", gzip.decompress)])
+    def test_compressed(self, app, encoding, decompress):
+        res = self.compressed(app, self.BIG, encoding)
+        assert res.headers["Content-Encoding"] == encoding
+        assert res.get_etag() == (f"abc-{encoding}", False)
+        assert "Accept-Encoding" in res.vary
+        with app.test_request_context():
+            assert decompress(res.get_data()) == jsonify(self.BIG).get_data()
+
+    def test_identity(self, app):
+        res = self.compressed(app, self.BIG, "identity")
+        assert "Content-Encoding" not in res.headers
+        assert res.get_etag() == ("abc", False)
+        # caches must still tell apart clients which accept an encoding
+        assert "Accept-Encoding" in res.vary
+
+    def test_small_bodies_arent_compressed(self, app):
+        res = self.compressed(app, {"apps": []}, "br")
+        assert "Content-Encoding" not in res.headers
+        assert res.get_etag() == ("abc", False)
+
+
+@pytest.mark.unit
+class TestStatic:
+    @pytest.fixture
+    def static_folder(self, monkeypatch, app, tmp_path):
+        (tmp_path / "app.css").write_bytes(CSS)
+        (tmp_path / "app.css.br").write_bytes(brotli.compress(CSS))
+        (tmp_path / "logo.svg").write_bytes(b"<svg></svg>")
+        monkeypatch.setattr(app, "static_folder", str(tmp_path))
+        return tmp_path
+
+    def test_precompressed_variants(self, app, static_folder):
+        res = app.test_client().get("/api/static/app.css", headers={"Accept-Encoding": "br, gzip"})
+        assert res.headers["Content-Encoding"] == "br"
+        assert res.mimetype == "text/css"
+        assert "Accept-Encoding" in res.vary
+        assert brotli.decompress(res.get_data()) == CSS
+
+    def test_missing_variants(self, app, static_folder):
+        # no .gz variant: the file is sent as it is
+        res = app.test_client().get("/api/static/app.css", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in res.headers
+        assert res.get_data() == CSS
+        res = app.test_client().get("/api/static/logo.svg", headers={"Accept-Encoding": "br"})
+        assert "Content-Encoding" not in res.headers
+        assert res.mimetype == "image/svg+xml"
+
+    def test_versioned_urls_are_immutable(self, app, static_folder):
+        with app.test_request_context():
+            url = app.url_for("static", filename="app.css")
+        assert url.endswith(f"?v={compression.static_digest(str(static_folder / 'app.css'))}")
+        res = app.test_client().get(url)
+        assert res.cache_control.immutable and res.cache_control.public
+        assert res.cache_control.max_age == compression.STATIC_MAX_AGE
+        assert not app.test_client().get("/api/static/app.css").cache_control.immutable
+
+
+@pytest.mark.unit
+class TestPrecompressStatic:
+    def test_variants(self, tmp_path):
+        (tmp_path / "js").mkdir()
+        (tmp_path / "js" / "app.js").write_bytes(CSS)
+        # too small to get any smaller, and not compressible
+        (tmp_path / "tiny.css").write_bytes(b"a{}")
+        (tmp_path / "logo.png").write_bytes(CSS)
+        subprocess.run([sys.executable, PRECOMPRESS_STATIC, str(tmp_path)], check=True, capture_output=True)
+        assert brotli.decompress((tmp_path / "js" / "app.js.br").read_bytes()) == CSS
+        assert gzip.decompress((tmp_path / "js" / "app.js.gz").read_bytes()) == CSS
+        assert sorted(os.listdir(tmp_path)) == ["js", "logo.png", "tiny.css"]
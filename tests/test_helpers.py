@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from urllib3.exceptions import EmptyPoolError
+
+from yagsvc.biz.stats import Counters
+from yagsvc.services.appsvc import AppsvcClient
+from yagsvc.services.helpers import (
+    Bulkhead,
+    CircuitBreaker,
+    SingleFlight,
+    get_pooled_session,
+)
+
+
+def make_breaker(**kw) -> CircuitBreaker:
+    params = dict(window=4, min_calls=4, failure_rate=0.5, slow_call_secs=1, slow_call_rate=0.5, open_secs=0.05)
+    params.update(kw)
+    return CircuitBreaker("test_breaker", **params)
+
+
+@pytest.mark.unit
+class TestCircuitBreaker:
+    def test_stays_closed_below_min_calls(self):
+        breaker = make_breaker()
+        for _ in range(3):
+            assert breaker.allow()
+            breaker.record(True, 0)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_opens_on_failure_rate(self):
+        breaker = make_breaker()
+        for failed in [False, True, False, True]:
+            assert breaker.allow()
+            breaker.record(failed, 0)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.get_stats()["rejected"] == 1
+
+    def test_opens_on_slow_calls(self):
+        breaker = make_breaker()
+        for duration in [0, 2, 0, 2]:
+            breaker.allow()
+            breaker.record(False, duration)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_half_open_lets_a_single_probe_through(self):
+        breaker = make_breaker()
+        for _ in range(4):
+            breaker.allow()
+            breaker.record(True, 0)
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow()
+
+    def test_successful_probe_closes(self):
+        breaker = make_breaker()
+        for _ in range(4):
+            breaker.allow()
+            breaker.record(True, 0)
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record(False, 0)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        breaker = make_breaker()
+        for _ in range(4):
+            breaker.allow()
+            breaker.record(True, 0)
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.record(True, 0)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.get_stats()["opened"] == 2
+
+    def test_released_probe_lets_another_one_through(self):
+        breaker = make_breaker()
+        for _ in range(4):
+            breaker.allow()
+            breaker.record(True, 0)
+        time.sleep(0.06)
+        assert breaker.allow()
+        breaker.release()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+
+
+@pytest.mark.unit
+class TestBulkhead:
+    def test_caps_concurrent_calls(self):
+        bulkhead = Bulkhead("test_bulkhead", max_concurrent=2, max_wait=0.01)
+        with bulkhead.enter() as first, bulkhead.enter() as second, bulkhead.enter() as third:
+            assert (first, second, third) == (True, True, False)
+            assert bulkhead.get_stats()["active"] == 2
+        assert bulkhead.get_stats() == {"calls": 2, "rejected": 1, "active": 0, "max_concurrent": 2}
+
+    def test_waits_for_a_slot(self):
+        bulkhead = Bulkhead("test_bulkhead", max_concurrent=1, max_wait=1)
+        assert bulkhead.acquire()
+        threading.Timer(0.05, bulkhead.release).start()
+        with bulkhead.enter() as entered:
+            assert entered
+        assert bulkhead.get_stats()["rejected"] == 0
+
+    def test_slot_held_until_released(self):
+        bulkhead = Bulkhead("test_bulkhead", max_concurrent=1, max_wait=0.01)
+        assert bulkhead.acquire()
+        assert not bulkhead.acquire()
+        bulkhead.release()
+        assert bulkhead.acquire()
+
+
+def call_concurrently(single_flight: SingleFlight, key: str, fn, n: int) -> list:
+    """Outcomes (results or exceptions) of n concurrent single_flight.do(key, fn), fn returning once all of them wait."""
+    release = threading.Event()
+    calls = single_flight.counters.snapshot()["calls"]
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def do():
+        try:
+            return single_flight.do(key, leader_fn)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return e
+
+    with ThreadPoolExecutor(n) as executor:
+        futures = [executor.submit(do) for _ in range(n)]
+        while single_flight.counters.snapshot()["calls"] < calls + n:
+            time.sleep(0.001)
+        release.set()
+        return [future.result() for future in futures]
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_call(self):
+        single_flight = SingleFlight("test_single_flight")
+        upstream_calls = []
+        res = call_concurrently(single_flight, "k", lambda: upstream_calls.append(1) or object(), 8)
+        assert len(upstream_calls) == 1
+        assert all(r is res[0] for r in res)
+        stats = single_flight.get_stats()
+        assert (stats["calls"], stats["upstream_calls"], stats["saved"]) == (8, 1, 7)
+        assert stats["keys"] == {"k": {"calls": 8, "upstream_calls": 1, "saved": 7}}
+
+    def test_exceptions_are_raised_to_all_callers(self):
+        single_flight = SingleFlight("test_single_flight")
+        error = ValueError("upstream failed")
+
+        def fail():
+            raise error
+
+        assert call_concurrently(single_flight, "k", fail, 4) == [error] * 4
+        # the failed call isn't kept: the next one runs again
+        assert single_flight.do("k", lambda: 1) == 1
+
+    def test_keys_arent_shared(self):
+        single_flight = SingleFlight("test_single_flight")
+        assert single_flight.do("a", lambda: 1) == 1
+        assert single_flight.do("b", lambda: 2) == 2
+        assert single_flight.get_stats()["upstream_calls"] == 2
+
+    def test_tracks_most_recent_keys(self):
+        single_flight = SingleFlight("test_single_flight", max_tracked_keys=2)
+        for key in ["a", "b", "c"]:
+            call_concurrently(single_flight, key, lambda: None, 2)
+        assert list(single_flight.get_stats()["keys"]) == ["b", "c"]
+
+
+@pytest.mark.unit
+class TestPooledSession:
+    @pytest.fixture
+    def stats(self) -> Counters:
+        return Counters("test_pool", ["checkouts", "new_conns", "waits", "timeouts"])
+
+    @staticmethod
+    def url() -> str:
+        # served by the appsvc stub, see conftest
+        return f"{os.environ['APPSVC_URL']}/apps/app-1"
+
+    def test_connections_are_kept_alive(self, stats):
+        session = get_pooled_session(stats, pool_maxsize=2, pool_timeout=1)
+        for _ in range(3):
+            assert session.get(self.url()).status_code == 200
+        assert stats.snapshot() == {"checkouts": 3, "new_conns": 1, "waits": 0, "timeouts": 0}
+
+    def test_waits_for_a_free_connection(self, stats):
+        session = get_pooled_session(stats, pool_maxsize=1, pool_timeout=1)
+        # streamed replies hold their connection until closed
+        held = session.get(self.url(), stream=True)
+        threading.Timer(0.05, held.close).start()
+        assert session.get(self.url()).status_code == 200
+        assert stats.snapshot() == {"checkouts": 2, "new_conns": 1, "waits": 1, "timeouts": 0}
+
+    def test_waits_are_bounded(self, stats):
+        session = get_pooled_session(stats, pool_maxsize=1, pool_timeout=0.05)
+        held = session.get(self.url(), stream=True)
+        try:
+            with pytest.raises(EmptyPoolError):
+                session.get(self.url())
+        finally:
+            held.close()
+        assert stats.snapshot() == {"checkouts": 2, "new_conns": 1, "waits": 1, "timeouts": 1}
+
+    def test_client_hits(self):
+        client = AppsvcClient(os.environ["APPSVC_URL"], pool_maxsize=2)
+        try:
+            for _ in range(3):
+                client.get("get_app_release", "/apps/app-1")
+        finally:
+            client.close()
+        assert client.get_stats() == {"checkouts": 3, "new_conns": 1, "waits": 0, "timeouts": 0, "hits": 2}
@@ -0,0 +1,285 @@
+import datetime
+import decimal
+
+import pytest
+from flask import g
+from marshmallow import ValidationError
+
+from yagsvc.biz import (
+    account,
+    cursor,
+)
+from yagsvc.dto.account import (
+    AppsLibOpDTO,
+    GetLibraryRequestDTO,
+    LibraryItemPathDTO,
+    PatchUserRequestDTO,
+    UpdateUserRequestDTO,
+)
+from yagsvc.dto.codec import codec
+from yagsvc.models.account import UserDAO
+
+USER = {"id": 1, "email": None, "name": None, "tz": "UTC", "dob": datetime.date(2000, 1, 1), "is_active": True}
+ADDED_TS = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+ON_CONFLICT_MOVE = (
+    "ON CONFLICT (user_id, app_release_uuid) DO UPDATE SET position = excluded.position, metadata = excluded.metadata"
+)
+
+
+def library_row(n: int) -> dict:
+    return {"app_release_uuid": f"app-{n}", "added_ts": ADDED_TS - datetime.timedelta(minutes=n), "meta": None}
+
+
+@pytest.fixture
+def user_cache():
+    account.user_cache.clear()
+    yield account.user_cache
+    account.user_cache.clear()
+
+
+@pytest.mark.unit
+class TestLibraryDTOs:
+    @staticmethod
+    def load_apps_lib(apps_lib: dict) -> dict:
+        user = {"email": None, "name": None, "tz": "UTC", "dob": "2000-01-01", "apps_lib": apps_lib}
+        return codec(UpdateUserRequestDTO).load(data=user).apps_lib
+
+    @staticmethod
+    def load_op(op: dict) -> AppsLibOpDTO:
+        return codec(PatchUserRequestDTO).load(data={"apps_lib_ops": [op]}).apps_lib_ops[0]
+
+    @pytest.mark.parametrize(
+        "apps_lib",
+        [None, {}, {"sort": "name"}, {"apps": None}, {"apps": []}, {"apps": ["app-1", {"app_release_uuid": "app-2"}]}],
+    )
+    def test_apps_lists(self, apps_lib):
+        assert self.load_apps_lib(apps_lib) == apps_lib
+
+    @pytest.mark.parametrize(
+        "apps",
+        [
+            "app-1",
+            ["app-1", "app-1"],
+            ["app-1", {"app_release_uuid": "app-1", "fav": True}],
+            ["x" * 65],
+            [""],
+            [1],
+            [{"fav": True}],
+            [{"app_release_uuid": None}],
+        ],
+        ids=["not_a_list", "duplicates", "duplicates_with_metadata", "too_long", "empty", "number", "no_uuid", "null"],
+    )
+    def test_invalid_apps_lists(self, apps):
+        with pytest.raises(ValidationError):
+            self.load_apps_lib({"apps": apps})
+        with pytest.raises(ValidationError):
+            self.load_op({"op": "add", "path": "/apps", "value": apps})
+
+    @pytest.mark.parametrize(
+        "op",
+        [
+            {"op": "add", "path": "/apps/-", "value": "x" * 64},
+            {"op": "replace", "path": "/apps/0", "value": {"app_release_uuid": "app-1", "fav": True}},
+            {"op": "move", "path": "/apps/0", "from": "/apps/3"},
+            {"op": "move", "path": "/apps/0/tags", "from": "/apps/0/labels"},
+            {"op": "remove", "path": "/apps"},
+        ],
+    )
+    def test_item_ops(self, op):
+        assert self.load_op(op).path == op["path"]
+
+    @pytest.mark.parametrize(
+        "op",
+        [
+            {"op": "add", "path": "/apps/-", "value": "x" * 65},
+            {"op": "add", "path": "/apps/-", "value": 1},
+            {"op": "add", "path": "/apps/first", "value": "app-1"},
+            {"op": "replace", "path": "/apps/0/app_release_uuid", "value": "app-2"},
+            {"op": "move", "path": "/apps", "from": "/apps/0"},
+            {"op": "move", "path": "/apps/0", "from": "/sort"},
+            {"op": "move", "path": "/sort", "from": "/apps/0"},
+            {"op": "move", "path": "/apps/0/tags", "from": "/apps/1/tags"},
+        ],
+    )
+    def test_invalid_item_ops(self, op):
+        with pytest.raises(ValidationError):
+            self.load_op(op)
+
+    def test_item_paths(self):
+        assert codec(LibraryItemPathDTO).load(data={"app_release_uuid": "x" * 64}).app_release_uuid == "x" * 64
+        for app_release_uuid in ("", "x" * 65):
+            with pytest.raises(ValidationError):
+                codec(LibraryItemPathDTO).load(data={"app_release_uuid": app_release_uuid})
+
+    def test_page_requests(self):
+        # query strings may have other parameters
+        assert codec(GetLibraryRequestDTO).load(data={"v": "1"}).limit == 50
+        for limit in ("0", "101"):
+            with pytest.raises(ValidationError):
+                codec(GetLibraryRequestDTO).load(data={"limit": limit})
+
+    def test_invalid_item_paths_are_rejected_before_any_statement(self, monkeypatch, app, recorder, user_cache):
+        # sessions need a key, which only integration tests get from the environment
+        monkeypatch.setitem(app.config, "SECRET_KEY", "test")
+        account._cache_user(USER["id"], UserDAO(**USER))
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(USER["id"])
+        # requests of test clients share the app context of the app fixture, and so Flask-Login's user
+        g.pop("_login_user", None)
+        try:
+            for method in (client.put, client.delete):
+                assert method(f"/api/accounts/library/{'x' * 65}").status_code == 400
+        finally:
+            g.pop("_login_user", None)
+        assert not recorder.statements
+
+
+@pytest.mark.unit
+class TestGetLibrary:
+    PAGE = (
+        "SELECT accounts.library.app_release_uuid, accounts.library.added_ts, accounts.library.metadata "
+        "FROM accounts.library WHERE accounts.library.user_id = %(user_id_1)s"
+    )
+    ORDER = "ORDER BY accounts.library.added_ts DESC, accounts.library.app_release_uuid DESC"
+
+    def test_first_page(self, recorder):
+        recorder.replies = [[library_row(n) for n in range(3)]]
+        page = account.get_library(1, 2, None)
+        assert [item.app_release_uuid for item in page.items] == ["app-0", "app-1"]
+        assert cursor.decode(page.next_cursor, (datetime.datetime.fromisoformat, str)) == [
+            library_row(1)["added_ts"],
+            "app-1",
+        ]
+        # one more row than the page tells whether there is a next one
+        assert recorder.sql() == [f"{self.PAGE} {self.ORDER} LIMIT %(param_1)s"]
+        assert recorder.params()[0]["param_1"] == 3
+
+    def test_next_pages_start_after_the_cursor(self, recorder):
+        recorder.replies = [[library_row(n) for n in (1, 2)]]
+        page = account.get_library(1, 2, cursor.encode([ADDED_TS.isoformat(), "app-0"]))
+        assert [item.app_release_uuid for item in page.items] == ["app-1", "app-2"]
+        assert page.next_cursor is None
+        # an index range scan of library_user_id_added_ts_idx
+        assert recorder.sql() == [
+            f"{self.PAGE} AND (accounts.library.added_ts, accounts.library.app_release_uuid) < "
+            f"(%(param_1)s, %(param_2)s) {self.ORDER} LIMIT %(param_3)s"
+        ]
+        assert recorder.params()[0] == {"user_id_1": 1, "param_1": ADDED_TS, "param_2": "app-0", "param_3": 3}
+
+    @pytest.mark.parametrize(
+        "page_cursor", ["x", cursor.encode([ADDED_TS.isoformat()]), cursor.encode(["yesterday", "app-0"])]
+    )
+    def test_invalid_cursors(self, recorder, page_cursor):
+        with pytest.raises(ValidationError):
+            account.get_library(1, 2, page_cursor)
+        assert not recorder.statements
+
+
+@pytest.mark.unit
+class TestLibraryStatements:
+    """Each write of the library is one statement, which reads the positions and items at an index itself."""
+
+    @staticmethod
+    def patch(recorder, *ops: tuple) -> list[str]:
+        # the user row, locked first
+        recorder.replies = [[USER]]
+        account.patch_user(USER["id"], {}, [AppsLibOpDTO(*op) for op in ops])
+        lock, *sql = recorder.sql()
+        assert lock.endswith("FROM accounts.users WHERE accounts.users.id = %(id_1)s FOR UPDATE")
+        return sql
+
+    def test_add(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("add", "/apps/-", None, "app-1"))
+        assert sql.startswith(
+            "INSERT INTO accounts.library (user_id, app_release_uuid, position, metadata) VALUES (%(user_id)s, "
+            "%(app_release_uuid)s, coalesce((SELECT max(library_1.position) AS max_1 FROM accounts.library AS "
+            "library_1 WHERE library_1.user_id = %(user_id_1)s AND library_1.app_release_uuid != %(param_1)s) + "
+        )
+        assert sql.endswith(ON_CONFLICT_MOVE)
+
+    def test_add_at_an_index(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("add", "/apps/1", None, {"app_release_uuid": "app-2", "fav": True}))
+        # between the positions of the items at 0 and 1
+        assert "LIMIT %(param_2)s OFFSET %(param_3)s) + (SELECT library_1.position" in sql
+        assert sql.endswith(ON_CONFLICT_MOVE)
+        params = recorder.params()[1]
+        assert (params["param_3"], params["param_5"], params["param_6"]) == (0, 1, decimal.Decimal("0.5"))
+        assert params["metadata"] == {"fav": True}
+
+    def test_remove(self, recorder, user_cache):
+        assert self.patch(recorder, ("remove", "/apps/2")) == [
+            "DELETE FROM accounts.library WHERE accounts.library.user_id = %(user_id_1)s AND "
+            "accounts.library.app_release_uuid = (SELECT library_1.app_release_uuid FROM accounts.library AS library_1 "
+            "WHERE library_1.user_id = %(user_id_2)s ORDER BY library_1.position, library_1.app_release_uuid "
+            "LIMIT %(param_1)s OFFSET %(param_2)s)"
+        ]
+        assert recorder.params()[1]["param_2"] == 2
+
+    def test_move(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("move", "/apps/0", "/apps/2"))
+        assert sql.startswith("UPDATE accounts.library SET position=coalesce(")
+        # positions around the new index are those of the other items
+        assert "library_1.app_release_uuid != (SELECT library_2.app_release_uuid" in sql
+
+    def test_replace(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("replace", "/apps/1", None, "app-3"))
+        assert sql.startswith("WITH replaced AS (SELECT library_1.app_release_uuid AS app_release_uuid, ")
+        assert "removed AS (DELETE FROM accounts.library " in sql
+        assert "INSERT INTO accounts.library (user_id, app_release_uuid, position, metadata) SELECT " in sql
+        assert sql.endswith(f"FROM replaced {ON_CONFLICT_MOVE}")
+
+    def test_item_metadata(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("add", "/apps/0/fav", None, True))
+        assert sql.startswith("UPDATE accounts.library SET metadata=nullif(jsonb_set(")
+
+    def test_whole_list(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, ("add", "/apps", None, ["app-1", {"app_release_uuid": "app-2", "fav": True}]))
+        assert sql.startswith(
+            "WITH removed AS (DELETE FROM accounts.library WHERE accounts.library.user_id = %(user_id_1)s AND "
+            "(accounts.library.app_release_uuid NOT IN (__[POSTCOMPILE_app_release_uuid_1]))) "
+            "INSERT INTO accounts.library (user_id, app_release_uuid, position, metadata) VALUES "
+        )
+        # rows left as they are aren't rewritten
+        assert sql.endswith(
+            f"{ON_CONFLICT_MOVE} WHERE accounts.library.position != excluded.position OR "
+            "accounts.library.metadata IS DISTINCT FROM excluded.metadata"
+        )
+        params = recorder.params()[1]
+        assert params["app_release_uuid_1"] == ["app-1", "app-2"]
+        assert [(params[f"position_m{i}"], params[f"metadata_m{i}"]) for i in range(2)] == [
+            (0, None),
+            (1, {"fav": True}),
+        ]
+
+    def test_remove_whole_list(self, recorder, user_cache):
+        assert self.patch(recorder, ("remove", "/apps")) == [
+            "DELETE FROM accounts.library WHERE accounts.library.user_id = %(user_id_1)s AND "
+            "(accounts.library.app_release_uuid NOT IN (__[POSTCOMPILE_app_release_uuid_1]))"
+        ]
+
+    def test_ops_after_the_last_item(self, recorder, user_cache):
+        assert not self.patch(recorder, ("remove", "/apps/-"))
+
+    def test_one_statement_per_op(self, recorder, user_cache):
+        ops = [("add", "/apps/0", None, "app-1"), ("move", "/apps/-", "/apps/0"), ("remove", "/apps/0/fav")]
+        assert len(self.patch(recorder, *ops)) == 3
+
+    def test_put_item(self, recorder):
+        recorder.replies = [[{"added_ts": ADDED_TS}]]
+        item = account.put_library_item(1, "app-1", {"fav": True})
+        assert (item.app_release_uuid, item.added_ts, item.metadata) == ("app-1", ADDED_TS, {"fav": True})
+        (sql,) = recorder.sql()
+        assert sql.startswith("INSERT INTO accounts.library (user_id, app_release_uuid, position, metadata) VALUES ")
+        # items already there keep their position and date
+        assert sql.endswith(
+            "ON CONFLICT (user_id, app_release_uuid) DO UPDATE SET metadata = excluded.metadata "
+            "RETURNING accounts.library.added_ts"
+        )
+
+    def test_delete_item(self, recorder):
+        account.delete_library_item(1, "app-1")
+        assert recorder.sql() == [
+            "DELETE FROM accounts.library WHERE accounts.library.user_id = %(user_id_1)s AND "
+            "accounts.library.app_release_uuid = %(app_release_uuid_1)s"
+        ]
@@ -0,0 +1,29 @@
+import pytest
+
+from yagsvc.api import misc
+from yagsvc.services import appsvc
+from yagsvc.services.dto.appsvc import SearchAppsAclRequestDTO
+
+
+@pytest.mark.unit
+class TestMisc:
+    @pytest.mark.parametrize("path", ["/api/misc/stats", "/api/misc/metrics"])
+    def test_disabled_without_token(self, app, path):
+        assert app.test_client().get(path).status_code == 404
+
+    @pytest.mark.parametrize("path", ["/api/misc/stats", "/api/misc/metrics"])
+    @pytest.mark.parametrize("authorization", [None, "Bearer wrong", "secret", "Bearer sécret"])
+    def test_token_required(self, monkeypatch, app, path, authorization):
+        monkeypatch.setattr(misc, "MISC_API_TOKEN", "secret")
+        headers = {"Authorization": authorization} if authorization else {}
+        assert app.test_client().get(path, headers=headers).status_code == 401
+
+    def test_stats_dont_expose_payloads(self, monkeypatch, app, appsvc_catalog):
+        monkeypatch.setattr(misc, "MISC_API_TOKEN", "secret")
+        appsvc.search_apps_acl(SearchAppsAclRequestDTO(app_name="private term"))
+        res = app.test_client().get("/api/misc/stats", headers={"Authorization": "Bearer secret"})
+        assert res.status_code == 200
+        assert "private term" not in res.get_data(as_text=True)
+        # keys are tracked by label, whether they saved calls (and are part of the stats) or not
+        assert "search_apps_acl" in appsvc.single_flight._keys
+        assert not [key for key in appsvc.single_flight._keys if "private term" in key]
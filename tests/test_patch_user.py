@@ -0,0 +1,153 @@
+import datetime
+import re
+
+import pytest
+from marshmallow import ValidationError
+
+from yagsvc.biz import account
+from yagsvc.dto.account import (
+    APPS_LIB_OPS_MAX,
+    AppsLibOpDTO,
+    PatchUserRequestDTO,
+)
+from yagsvc.dto.codec import codec
+
+USER = {"id": 1, "email": None, "name": "Ann", "tz": "UTC", "dob": datetime.date(2000, 1, 1), "is_active": True}
+USER_COLUMNS = ", ".join(f"accounts.users.{name}" for name in USER)
+# the stored document, {} for nulls, which the first operation reads
+DOC = "SELECT coalesce(nullif(accounts.users.apps_lib, CAST(%(param_{0})s AS JSONB)), CAST(%(param_{1})s AS JSONB)) AS doc"
+
+
+@pytest.fixture
+def user_cache():
+    account.user_cache.clear()
+    yield account.user_cache
+    account.user_cache.clear()
+
+
+@pytest.mark.unit
+class TestPatchUserRequestDTO:
+    @staticmethod
+    def load(data: dict) -> PatchUserRequestDTO:
+        return codec(PatchUserRequestDTO).load(data=data)
+
+    def test_missing_fields(self):
+        req = self.load({"name": None})
+        assert (req.name, req.tz, req.apps_lib, req.apps_lib_ops) == (None, None, None, None)
+
+    @pytest.mark.parametrize("data", [{"tz": None}, {"dob": None}], ids=["tz", "dob"])
+    def test_columns_which_cant_be_null(self, data):
+        with pytest.raises(ValidationError):
+            self.load(data)
+
+    def test_apps_lib_or_apps_lib_ops(self):
+        op = {"op": "remove", "path": "/sort"}
+        assert self.load({"apps_lib": None, "apps_lib_ops": [op]}).apps_lib_ops == [AppsLibOpDTO("remove", "/sort")]
+        with pytest.raises(ValidationError, match="mutually exclusive"):
+            self.load({"apps_lib": {"sort": "name"}, "apps_lib_ops": [op]})
+
+    def test_most_ops_a_request_may_have(self):
+        ops = [{"op": "remove", "path": f"/key-{n}"} for n in range(APPS_LIB_OPS_MAX + 1)]
+        assert len(self.load({"apps_lib_ops": ops[:-1]}).apps_lib_ops) == APPS_LIB_OPS_MAX
+        with pytest.raises(ValidationError):
+            self.load({"apps_lib_ops": ops})
+
+    @pytest.mark.parametrize(
+        "op",
+        [
+            {"op": "copy", "path": "/sort", "from": "/order"},
+            {"op": "add", "path": "sort", "value": "name"},
+            {"op": "add", "path": "", "value": {}},
+            {"op": "move", "path": "/sort"},
+            {"op": "remove", "path": "/sort", "from": "/order"},
+        ],
+        ids=["unknown_op", "relative_path", "whole_document", "move_without_from", "from_without_move"],
+    )
+    def test_invalid_ops(self, op):
+        with pytest.raises(ValidationError):
+            self.load({"apps_lib_ops": [op]})
+
+    def test_ops(self):
+        op = self.load({"apps_lib_ops": [{"op": "move", "path": "/sort~1by", "from": "/order"}]}).apps_lib_ops[0]
+        assert (op.op, op.path, op.from_path, op.value) == ("move", "/sort~1by", "/order", None)
+
+
+@pytest.mark.unit
+class TestPatchStatements:
+    """Columns and operations on the stored apps_lib are one UPDATE, run by Postgres on the document as it is."""
+
+    @staticmethod
+    def patch(recorder, values: dict, *ops: tuple) -> list[str]:
+        recorder.replies = [[USER]]
+        user = account.patch_user(USER["id"], values, [AppsLibOpDTO(*op) for op in ops])
+        assert user.name == USER["name"]
+        return recorder.sql()
+
+    def test_columns(self, recorder, user_cache):
+        assert self.patch(recorder, {"name": "Ann", "tz": "UTC"}) == [
+            f"UPDATE accounts.users SET name=%(name)s, tz=%(tz)s WHERE accounts.users.id = %(id_1)s "
+            f"RETURNING {USER_COLUMNS}"
+        ]
+        # the user as the statement returned it, cached for the other requests of this worker
+        assert account.user_cache.get(USER["id"]).value == USER
+
+    @pytest.mark.parametrize(
+        "op, doc",
+        [
+            (("remove", "/sort"), "anon_2.doc #- %(param_1)s::TEXT[]"),
+            (
+                ("replace", "/sort", None, "name"),
+                "jsonb_set(anon_2.doc, %(param_1)s::TEXT[], CAST(%(param_2)s AS JSONB), false)",
+            ),
+            (
+                ("add", "/sort", None, "name"),
+                "jsonb_set(anon_2.doc, %(param_1)s::TEXT[], CAST(%(param_2)s AS JSONB), true)",
+            ),
+            (
+                ("add", "/tags/0", None, "rpg"),
+                "jsonb_insert(anon_2.doc, %(param_1)s::TEXT[], CAST(%(param_2)s AS JSONB))",
+            ),
+            (
+                ("add", "/tags/-", None, "rpg"),
+                "jsonb_set(anon_2.doc, %(param_1)s::TEXT[], jsonb_insert(coalesce(anon_2.doc #> %(param_1)s::TEXT[], "
+                "CAST(%(param_2)s AS JSONB)), %(param_3)s::TEXT[], CAST(%(param_4)s AS JSONB), true), true)",
+            ),
+            (
+                ("move", "/tags/0", "/tags/2"),
+                "coalesce(jsonb_insert(anon_2.doc #- %(param_1)s::TEXT[], %(param_2)s::TEXT[], "
+                "anon_2.doc #> %(param_3)s::TEXT[]), anon_2.doc)",
+            ),
+        ],
+        ids=["remove", "replace", "add", "insert", "append", "move"],
+    )
+    def test_ops(self, recorder, user_cache, op, doc):
+        (sql,) = self.patch(recorder, {}, op)
+        params = len(set(re.findall(r"%\(param_\d+\)s", doc)))
+        assert sql.startswith(
+            f"UPDATE accounts.users SET apps_lib=(SELECT anon_1.doc FROM (SELECT {doc} AS doc FROM "
+            f"({DOC.format(params + 1, params + 2)} LIMIT ALL OFFSET "
+        )
+        assert sql.endswith(f"WHERE accounts.users.id = %(id_1)s RETURNING {USER_COLUMNS}")
+
+    def test_statements_grow_linearly_with_ops(self, recorder, user_cache):
+        # moves read the document twice: inlined, each one would double the statement
+        sizes = []
+        for n in (8, 16, 32):
+            recorder.statements.clear()
+            (sql,) = self.patch(recorder, {}, *[("move", "/tags/0", "/tags/1")] * n)
+            assert sql.count("LIMIT ALL OFFSET") == n + 1
+            sizes.append(len(sql))
+        assert sizes[2] < 5 * sizes[0]
+
+    def test_columns_and_ops(self, recorder, user_cache):
+        (sql,) = self.patch(recorder, {"name": "Ann"}, ("remove", "/sort"), ("remove", "/order"))
+        assert sql.startswith(
+            "UPDATE accounts.users SET name=%(name)s, apps_lib=(SELECT anon_1.doc FROM (SELECT anon_2.doc #- "
+            "%(param_1)s::TEXT[] AS doc FROM (SELECT anon_3.doc #- %(param_2)s::TEXT[] AS doc FROM "
+        )
+
+    def test_library_ops_come_after_the_update(self, recorder, user_cache):
+        update, library = self.patch(recorder, {}, ("remove", "/sort"), ("remove", "/apps/0"))
+        # which locks the user row, as the SELECT ... FOR UPDATE of library ops alone does
+        assert update.startswith("UPDATE accounts.users SET apps_lib=")
+        assert library.startswith("DELETE FROM accounts.library ")
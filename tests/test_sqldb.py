@@ -0,0 +1,118 @@
+import typing as t
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import (
+    create_engine,
+    text,
+)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from yagsvc.biz import (
+    account,
+    metrics,
+)
+from yagsvc.models.account import UserDAO
+from yagsvc.sqldb import (
+    REPLICA_BIND,
+    replica_bind_arguments,
+    sqldb,
+)
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.unit
+class TestPoolMetrics:
+    BIND = "test_pool"
+
+    @pytest.fixture
+    def engine(self, tmp_path) -> t.Iterator[t.Any]:
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=metrics.InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+            pool_logging_name=self.BIND,
+        )
+        metrics._observe_pool(engine, self.BIND)
+        yield engine
+        engine.dispose()
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "checkouts": sample("yagsvc_db_pool_events_total", bind=self.BIND, event="checkout"),
+            "connects": sample("yagsvc_db_pool_events_total", bind=self.BIND, event="connect"),
+            "checked_out": sample("yagsvc_db_pool_connections", bind=self.BIND, state="checked_out"),
+            "open": sample("yagsvc_db_pool_connections", bind=self.BIND, state="open"),
+            "waits": sample("yagsvc_db_pool_checkout_wait_seconds_count", bind=self.BIND),
+            "waited": sample("yagsvc_db_pool_checkout_wait_seconds_sum", bind=self.BIND),
+        }
+
+    def test_checkouts(self, engine):
+        before = self.stats()
+        for _ in range(2):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                assert self.stats()["checked_out"] == before["checked_out"] + 1
+        after = self.stats()
+        assert after["checkouts"] == before["checkouts"] + 2
+        # the connection is reused
+        assert after["connects"] == before["connects"] + 1
+        assert after["open"] == before["open"] + 1
+        assert after["checked_out"] == before["checked_out"]
+        engine.dispose()
+        assert self.stats()["open"] == before["open"]
+
+    def test_waits_for_a_connection(self, engine):
+        with engine.connect():
+            before = self.stats()
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+        after = self.stats()
+        assert after["waits"] == before["waits"] + 1
+        assert after["waited"] - before["waited"] >= 0.05
+        assert after["checkouts"] == before["checkouts"]
+
+
+@pytest.mark.unit
+class TestReplicaRouting:
+    @pytest.fixture
+    def replica(self, monkeypatch, app) -> t.Any:
+        replica = create_engine("sqlite://")
+        monkeypatch.setitem(sqldb.engines, REPLICA_BIND, replica)
+        return replica
+
+    @pytest.fixture
+    def gets(self, monkeypatch, app, replica) -> list[tuple[int, t.Any]]:
+        """Users 1 and 2 on the primary, only user 1 on the replica (it lags); sessions get them without SQL."""
+        users = {None: {1, 2}, replica: {1}}
+        gets: list[tuple[int, t.Any]] = []
+
+        def get(entity, user_id, bind_arguments=None):
+            bind = (bind_arguments or {}).get("bind")
+            gets.append((user_id, bind))
+            return UserDAO(id=user_id, email=f"{user_id}@example.com") if user_id in users[bind] else None
+
+        monkeypatch.setattr(sqldb.session, "get", get)
+        account.user_cache.clear()
+        yield gets
+        account.user_cache.clear()
+
+    def test_bind_arguments(self, monkeypatch, app, replica):
+        assert replica_bind_arguments() == {"bind": replica}
+        monkeypatch.delitem(sqldb.engines, REPLICA_BIND)
+        assert replica_bind_arguments() == {}
+
+    def test_users_are_read_from_the_replica(self, gets, replica):
+        assert account.load_user(1).email == "1@example.com"
+        assert gets == [(1, replica)]
+
+    def test_users_missing_from_the_replica_are_read_from_the_primary(self, gets, replica):
+        assert account.load_user(2).email == "2@example.com"
+        assert gets == [(2, replica), (2, None)]
+        assert account.load_user(3) is None
+        assert gets[2:] == [(3, replica), (3, None)]
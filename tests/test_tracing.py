@@ -0,0 +1,133 @@
+import json
+import typing as t
+
+import pytest
+from opentelemetry.sdk.trace import (
+    ReadableSpan,
+    TracerProvider,
+)
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import (
+    ParentBased,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import (
+    INVALID_SPAN,
+    SpanKind,
+    StatusCode,
+)
+
+from yagsvc.biz import tracing
+
+SAMPLED_PARENT = {"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"}
+UNSAMPLED_PARENT = {"traceparent": "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00"}
+
+
+def enable_tracing(monkeypatch, sample_ratio: float = 1) -> InMemorySpanExporter:
+    """Spans of the tracer of yagsvc.biz.tracing go to the returned exporter, sampled as by gunicorn.config.py."""
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider(sampler=ParentBased(TraceIdRatioBased(sample_ratio)))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "OTEL_TRACE_ENABLED", True)
+    monkeypatch.setattr(tracing, "tracer", provider.get_tracer("yagsvc"))
+    return exporter
+
+
+def by_name(exporter: InMemorySpanExporter) -> dict[str, ReadableSpan]:
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+
+@pytest.mark.unit
+class TestTracing:
+    @pytest.fixture
+    def exporter(self, monkeypatch) -> InMemorySpanExporter:
+        return enable_tracing(monkeypatch)
+
+    def test_span_tree(self, exporter):
+        @tracing.traced
+        def work() -> None:
+            tracing.set_attribute("yagsvc.items", 3)
+            with tracing.span("appsvc search_apps", SpanKind.CLIENT, {"yagsvc.appsvc.endpoint": "search_apps"}):
+                pass
+
+        with tracing.server_span("POST", "/api/apps/search", lambda: SAMPLED_PARENT):
+            work()
+        spans = by_name(exporter)
+        server = spans["POST /api/apps/search"]
+        traced = spans[f"{__name__}.{work.__qualname__}"]
+        client = spans["appsvc search_apps"]
+        # the caller's trace is continued
+        assert server.context.trace_id == int(SAMPLED_PARENT["traceparent"].split("-")[1], 16)
+        assert server.kind == SpanKind.SERVER
+        assert dict(server.attributes) == {"http.request.method": "POST", "http.route": "/api/apps/search"}
+        assert traced.parent.span_id == server.context.span_id
+        assert traced.attributes["yagsvc.items"] == 3
+        assert client.parent.span_id == traced.context.span_id
+        assert client.kind == SpanKind.CLIENT
+        assert client.attributes["yagsvc.appsvc.endpoint"] == "search_apps"
+
+    def test_context_follows_bound_calls_and_requests(self, exporter):
+        headers: dict = {}
+        with tracing.span("parent") as parent:
+            bound = tracing.bind(lambda: tracing.span("child").__enter__())
+            tracing.inject(headers)
+        # ran out of the parent's context, as in a thread pool
+        child = bound()
+        child.end()
+        assert child.parent.span_id == parent.get_span_context().span_id
+        assert headers["traceparent"].split("-")[2] == f"{parent.get_span_context().span_id:016x}"
+
+    def test_sampler(self, monkeypatch):
+        exporter = enable_tracing(monkeypatch, sample_ratio=0)
+        for headers in [{}, UNSAMPLED_PARENT]:
+            with tracing.server_span("GET", "/api/apps/<uuid>", lambda: headers):
+                with tracing.span("child") as child:
+                    assert not child.is_recording()
+        assert not exporter.get_finished_spans()
+        # callers which kept their trace get it whole whatever the ratio
+        with tracing.server_span("GET", "/api/apps/<uuid>", lambda: SAMPLED_PARENT):
+            with tracing.span("child"):
+                pass
+        assert set(by_name(exporter)) == {"GET /api/apps/<uuid>", "child"}
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(tracing, "OTEL_TRACE_ENABLED", False)
+
+        def work() -> None:
+            pass
+
+        assert tracing.traced(work) is work
+        assert tracing.bind(work) is work
+        assert tracing.start_span("stream") is INVALID_SPAN
+        with tracing.span("span") as span, tracing.server_span("GET", "/", lambda: SAMPLED_PARENT) as server:
+            assert span is INVALID_SPAN and server is INVALID_SPAN
+            tracing.set_attribute("yagsvc.items", 3)
+        headers: dict = {}
+        tracing.inject(headers)
+        assert not headers
+
+
+@pytest.mark.unit
+class TestStreamSearchApps:
+    @pytest.fixture
+    def exporter(self, monkeypatch) -> InMemorySpanExporter:
+        return enable_tracing(monkeypatch)
+
+    def stream(self, app, body: dict) -> t.Any:
+        return app.test_client().post("/api/apps/search/stream", json=body, buffered=False)
+
+    def test_span_lasts_until_the_stream_ends(self, app, appsvc_catalog, exporter):
+        res = self.stream(app, {"app_name": "Game 1", "limit": 5})
+        assert "yagsvc.biz.app.stream_search_apps" not in by_name(exporter)
+        lines = res.get_data().splitlines()
+        res.close()
+        assert len(lines) == 5 and json.loads(lines[0])["id"]
+        spans = by_name(exporter)
+        stream = spans["yagsvc.biz.app.stream_search_apps"]
+        assert spans["appsvc search_apps"].parent.span_id == stream.context.span_id
+        assert stream.status.status_code == StatusCode.UNSET
+
+    def test_span_of_closed_streams(self, app, appsvc_catalog, exporter):
+        self.stream(app, {"app_name": "Game 1"}).close()
+        assert "yagsvc.biz.app.stream_search_apps" in by_name(exporter)
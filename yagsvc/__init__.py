@@ -14,11 +14,23 @@ from yagsvc.api.auth import login_manager
 from yagsvc.api.auth import reddit_bp as auth_reddit_bp
 from yagsvc.api.auth import twitch_bp as auth_twitch_bp
 from yagsvc.api.misc import bp as misc_bp
+from yagsvc.asgi import AsgiApp
 from yagsvc.biz import (
+    acl_index,
+    compression,
     errors,
     log_handler,
+    metrics,
+    tracing,
+)
+from yagsvc.dto import codec
+from yagsvc.sqldb import (
+    DEFAULT_BIND,
+    REPLICA_BIND,
+    engine_options,
+    replica_uri,
+    sqldb,
 )
-from yagsvc.sqldb import sqldb
 
 log = logging.getLogger("yagsvc")
 
@@ -28,17 +40,32 @@ BEHIND_PROXY = os.environ.get("BEHIND_PROXY", "false").lower() == "true"
 def create_app() -> Flask:
     app = Flask(__name__, static_url_path="/api/static")
     app.config.from_prefixed_env()
-    # composite config parameters
-    app.config["SQLALCHEMY_DATABASE_URI"] = (
-        f'postgresql://{os.environ["SQLDB_USERNAME"]}:{os.environ["SQLDB_PASSWORD"]}@{os.environ["SQLDB_HOST"]}:\
-        {os.environ["SQLDB_PORT"]}/{os.environ["SQLDB_DBNAME"]}'
-    )
+    # composite config parameters, unless set as a whole (FLASK_SQLALCHEMY_DATABASE_URI, e.g. by benchmarks)
+    if "SQLALCHEMY_DATABASE_URI" not in app.config:
+        app.config["SQLALCHEMY_DATABASE_URI"] = (
+            f'postgresql://{os.environ["SQLDB_USERNAME"]}:{os.environ["SQLDB_PASSWORD"]}@{os.environ["SQLDB_HOST"]}:\
+            {os.environ["SQLDB_PORT"]}/{os.environ["SQLDB_DBNAME"]}'
+        )
+    # connection pools of the primary and of the optional read replica, see yagsvc.sqldb
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(DEFAULT_BIND, metrics.InstrumentedQueuePool))
+    if replica_uri():
+        app.config.setdefault(
+            "SQLALCHEMY_BINDS",
+            {REPLICA_BIND: {"url": replica_uri(), **engine_options(REPLICA_BIND, metrics.InstrumentedQueuePool)}},
+        )
 
     # initialize flask extensions
     login_manager.init_app(app)
     sqldb.init_app(app)
+    metrics.init_app(app)
+    tracing.init_app(app)
     errors.init_app(app)
     log_handler.init_app(app)
+    acl_index.init_app(app)
+    compression.init_app(app)
+
+    # DTO schemas are built once per worker, before the first request
+    codec.precompile()
 
     if BEHIND_PROXY:
         app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1, x_prefix=1)
@@ -65,3 +92,11 @@ def create_app() -> Flask:
     """
 
     return app
+
+
+def create_asgi_app() -> AsgiApp:
+    """Serves the /api/apps/* routes on asyncio, the rest of create_app() through a WSGI bridge.
+
+    Run with an ASGI worker, e.g. GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+    """
+    return AsgiApp(create_app())
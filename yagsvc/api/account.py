@@ -10,9 +10,18 @@ from flask_login import (
 
 import yagsvc.biz.account as biz_account
 from yagsvc.dto.account import (
+    GetLibraryRequestDTO,
+    GetLibraryResponseDTO,
+    GetUserRequestDTO,
     GetUserResponseDTO,
+    LibraryItemPathDTO,
+    PatchUserRequestDTO,
+    PutLibraryItemRequestDTO,
+    PutLibraryItemResponseDTO,
     UpdateUserRequestDTO,
 )
+from yagsvc.dto.codec import codec
+from yagsvc.models.account import UserDAO
 
 bp = Blueprint("account", __name__, url_prefix="/api/accounts")
 
@@ -24,8 +33,13 @@ def get_user() -> Response:
     ---
     get:
         summary: Get user info.
+        description: apps_lib costs as much as the library is big, clients reading libraries from
+            /api/accounts/library leave it out with exclude=apps_lib.
         tags:
             - account
+        parameters:
+            - in: query
+              schema: GetUserRequestDTO
         responses:
             200:
                 content:
@@ -36,7 +50,7 @@ def get_user() -> Response:
     """
     user_id = int(current_user.get_id())
     user = biz_account.get_user(user_id)
-    return GetUserResponseDTO.Schema().dump(user)
+    return _user_response(user)
 
 
 @bp.route("/user", methods=["PUT"])
@@ -46,6 +60,7 @@ def update_user() -> Response:
     ---
     put:
         summary: Update user info.
+        description: apps_lib is left as it is when missing from the request (null clears it).
         tags:
             - account
         requestBody:
@@ -60,6 +75,154 @@ def update_user() -> Response:
                 description: Unauthorized user.
     """
     user_id = int(current_user.get_id())
-    user = UpdateUserRequestDTO.Schema().load(data=request.get_json())
-    biz_account.update_user(user_id, user)
+    data = request.get_json()
+    user = codec(UpdateUserRequestDTO).load(data=data)
+    # apps_lib is missing from GET replies with exclude=apps_lib, a missing apps_lib is left as it is
+    biz_account.update_user(user_id, user, "apps_lib" in data)
+    return "", 200
+
+
+@bp.route("/user", methods=["PATCH"])
+@login_required
+def patch_user() -> Response:
+    """
+    ---
+    patch:
+        summary: Update some of the user info.
+        description: Only the fields present in the request are updated. apps_lib_ops (add, remove, move, replace
+            JSON Patch operations) modify the stored apps_lib without sending it whole. The reply leaves apps_lib out
+            with exclude=apps_lib.
+        tags:
+            - account
+        parameters:
+            - in: query
+              schema: GetUserRequestDTO
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema: PatchUserRequestDTO
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: GetUserResponseDTO
+            400:
+                description: Invalid fields or operations.
+            401:
+                description: Unauthorized user.
+    """
+    user_id = int(current_user.get_id())
+    data = request.get_json()
+    req = codec(PatchUserRequestDTO).load(data=data)
+    # null is a value (e.g. clears name), a missing field is left as it is
+    values = {name: getattr(req, name) for name in ("email", "name", "tz", "apps_lib", "dob") if name in data}
+    user = biz_account.patch_user(user_id, values, req.apps_lib_ops or [])
+    return _user_response(user)
+
+
+def _user_response(user: UserDAO) -> dict:
+    req = codec(GetUserRequestDTO).load(data=request.args.to_dict())
+    # the apps_lib attribute is the stored document without its apps list, and isn't loaded
+    res = codec(GetUserResponseDTO).dump({name: getattr(user, name) for name in ("email", "name", "tz", "dob")})
+    if req.exclude == "apps_lib":
+        del res["apps_lib"]
+    else:
+        res["apps_lib"] = biz_account.get_apps_lib(user.id)
+    return res
+
+
+@bp.route("/library", methods=["GET"])
+@login_required
+def get_library() -> Response:
+    """
+    ---
+    get:
+        summary: Get a page of the user's library, most recently added apps first.
+        tags:
+            - account
+        parameters:
+            - in: query
+              schema: GetLibraryRequestDTO
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: GetLibraryResponseDTO
+            400:
+                description: Invalid limit or cursor.
+            401:
+                description: Unauthorized user.
+    """
+    user_id = int(current_user.get_id())
+    req = codec(GetLibraryRequestDTO).load(data=request.args.to_dict())
+    res = biz_account.get_library(user_id, req.limit, req.cursor)
+    return codec(GetLibraryResponseDTO).dump(res)
+
+
+@bp.route("/library/<app_release_uuid>", methods=["PUT"])
+@login_required
+def put_library_item(app_release_uuid: str) -> Response:
+    """
+    ---
+    put:
+        summary: Add an app release to the user's library, or replace its metadata.
+        tags:
+            - account
+        parameters:
+            - in: path
+              name: app_release_uuid
+              schema:
+                type: string
+                maxLength: 64
+              required: true
+        requestBody:
+            required: false
+            content:
+                application/json:
+                    schema: PutLibraryItemRequestDTO
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: PutLibraryItemResponseDTO
+            400:
+                description: Invalid app release uuid or metadata.
+            401:
+                description: Unauthorized user.
+    """
+    user_id = int(current_user.get_id())
+    item_path = codec(LibraryItemPathDTO).load(data={"app_release_uuid": app_release_uuid})
+    req = codec(PutLibraryItemRequestDTO).load(data=request.get_json(silent=True) or {})
+    item = biz_account.put_library_item(user_id, item_path.app_release_uuid, req.metadata)
+    return codec(PutLibraryItemResponseDTO).dump(item)
+
+
+@bp.route("/library/<app_release_uuid>", methods=["DELETE"])
+@login_required
+def delete_library_item(app_release_uuid: str) -> Response:
+    """
+    ---
+    delete:
+        summary: Remove an app release from the user's library.
+        tags:
+            - account
+        parameters:
+            - in: path
+              name: app_release_uuid
+              schema:
+                type: string
+                maxLength: 64
+              required: true
+        responses:
+            200:
+                description: App release is not in the library (anymore).
+            400:
+                description: Invalid app release uuid.
+            401:
+                description: Unauthorized user.
+    """
+    user_id = int(current_user.get_id())
+    item_path = codec(LibraryItemPathDTO).load(data={"app_release_uuid": app_release_uuid})
+    biz_account.delete_library_item(user_id, item_path.app_release_uuid)
     return "", 200
@@ -10,13 +10,20 @@ from flask import (
 )
 
 from yagsvc.api.account import (
+    delete_library_item,
+    get_library,
     get_user,
+    patch_user,
+    put_library_item,
     update_user,
 )
 from yagsvc.api.app import (
     get_app_release,
+    get_app_releases,
     search_apps,
     search_apps_acl,
+    search_apps_stream,
+    search_as_you_type,
 )
 from yagsvc.api.auth import (
     login_discord,
@@ -25,16 +32,32 @@ from yagsvc.api.auth import (
     login_twitch,
     logout,
 )
+from yagsvc.api.misc import (
+    get_metrics,
+    get_stats,
+)
 from yagsvc.dto.account import (
+    GetLibraryRequestDTO,
+    GetLibraryResponseDTO,
+    GetUserRequestDTO,
     GetUserResponseDTO,
+    PatchUserRequestDTO,
+    PutLibraryItemRequestDTO,
+    PutLibraryItemResponseDTO,
     UpdateUserRequestDTO,
 )
-from yagsvc.dto.app import SearchAppsRequestDTO
+from yagsvc.dto.app import (
+    GetAppReleasesRequestDTO,
+    GetAppReleasesResponseDTO,
+    SearchAppsPageResponseDTO,
+    SearchAppsRequestDTO,
+    SearchAsYouTypeRequestDTO,
+    SearchAsYouTypeResponseDTO,
+)
 from yagsvc.services.dto.appsvc import (
     GetAppReleaseResponseDTO,
     SearchAppsAclRequestDTO,
     SearchAppsAclResponseDTO,
-    SearchAppsResponseDTO,
 )
 
 spec = APISpec(
@@ -47,14 +70,24 @@ spec = APISpec(
 
 def setup_dtos() -> None:
     # account
+    spec.components.schema("GetUserRequestDTO", schema=GetUserRequestDTO.Schema())
     spec.components.schema("GetUserResponseDTO", schema=GetUserResponseDTO.Schema())
     spec.components.schema("UpdateUserRequestDTO", schema=UpdateUserRequestDTO.Schema())
+    spec.components.schema("PatchUserRequestDTO", schema=PatchUserRequestDTO.Schema())
+    spec.components.schema("GetLibraryRequestDTO", schema=GetLibraryRequestDTO.Schema())
+    spec.components.schema("GetLibraryResponseDTO", schema=GetLibraryResponseDTO.Schema())
+    spec.components.schema("PutLibraryItemRequestDTO", schema=PutLibraryItemRequestDTO.Schema())
+    spec.components.schema("PutLibraryItemResponseDTO", schema=PutLibraryItemResponseDTO.Schema())
     # app
     spec.components.schema("GetAppReleaseResponseDTO", schema=GetAppReleaseResponseDTO.Schema())
+    spec.components.schema("GetAppReleasesRequestDTO", schema=GetAppReleasesRequestDTO.Schema())
+    spec.components.schema("GetAppReleasesResponseDTO", schema=GetAppReleasesResponseDTO.Schema())
     spec.components.schema("SearchAppsRequestDTO", schema=SearchAppsRequestDTO.Schema())
-    spec.components.schema("SearchAppsResponseDTO", schema=SearchAppsResponseDTO.Schema())
+    spec.components.schema("SearchAppsPageResponseDTO", schema=SearchAppsPageResponseDTO.Schema())
     spec.components.schema("SearchAppsAclRequestDTO", schema=SearchAppsAclRequestDTO.Schema())
     spec.components.schema("SearchAppsAclResponseDTO", schema=SearchAppsAclResponseDTO.Schema())
+    spec.components.schema("SearchAsYouTypeRequestDTO", schema=SearchAsYouTypeRequestDTO.Schema())
+    spec.components.schema("SearchAsYouTypeResponseDTO", schema=SearchAsYouTypeResponseDTO.Schema())
 
 
 def setup_paths(app: Flask) -> None:
@@ -62,16 +95,26 @@ def setup_paths(app: Flask) -> None:
         # account
         spec.path(view=get_user)
         spec.path(view=update_user)
+        spec.path(view=patch_user)
+        spec.path(view=get_library)
+        spec.path(view=put_library_item)
+        spec.path(view=delete_library_item)
         # app
         spec.path(view=get_app_release)
+        spec.path(view=get_app_releases)
         spec.path(view=search_apps)
         spec.path(view=search_apps_acl)
+        spec.path(view=search_apps_stream)
+        spec.path(view=search_as_you_type)
         # auth
         spec.path(view=login_discord)
         spec.path(view=login_google)
         spec.path(view=login_reddit)
         spec.path(view=login_twitch)
         spec.path(view=logout)
+        # misc
+        spec.path(view=get_stats)
+        spec.path(view=get_metrics)
 
 
 def init_app(app: Flask) -> None:
@@ -1,16 +1,31 @@
+import json
+
 from flask import (
     Blueprint,
     Response,
     request,
 )
+from flask_login import current_user
 
 import yagsvc.biz.app as biz_app
-from yagsvc.dto.app import SearchAppsRequestDTO
+from yagsvc.api.http_cache import (
+    APP_RELEASE_MAX_AGE,
+    SEARCH_MAX_AGE,
+    cached_json,
+)
+from yagsvc.dto.app import (
+    GetAppReleasesRequestDTO,
+    GetAppReleasesResponseDTO,
+    SearchAppsPageResponseDTO,
+    SearchAppsRequestDTO,
+    SearchAsYouTypeRequestDTO,
+    SearchAsYouTypeResponseDTO,
+)
+from yagsvc.dto.codec import codec
 from yagsvc.services.dto.appsvc import (
-    GetAppReleaseResponseDTO,
     SearchAppsAclRequestDTO,
     SearchAppsAclResponseDTO,
-    SearchAppsResponseDTO,
+    SearchAppsResponseItem,
 )
 
 bp = Blueprint("app", __name__, url_prefix="/api/apps")
@@ -34,10 +49,37 @@ def get_app_release(app_release_uuid: str) -> Response:
                 content:
                     application/json:
                         schema: GetAppReleaseResponseDTO
+            304:
+                description: Not modified (If-None-Match matched the ETag).
             401:
                 description: Unauthorized user.
     """
-    return GetAppReleaseResponseDTO.Schema().dump(biz_app.get_app_release(app_release_uuid))
+    data, tag = biz_app.get_app_release_json(app_release_uuid)
+    return cached_json(data, public=True, max_age=APP_RELEASE_MAX_AGE, tag=tag)
+
+
+@bp.route("/batch", methods=["POST"])
+def get_app_releases() -> Response:
+    """
+    ---
+    post:
+        summary: Get details of several application releases at once.
+        tags:
+            - application
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema: GetAppReleasesRequestDTO
+        responses:
+            200:
+                description: Details of found releases, errors of the others, both keyed by app release UUID.
+                content:
+                    application/json:
+                        schema: GetAppReleasesResponseDTO
+    """
+    req: GetAppReleasesRequestDTO = codec(GetAppReleasesRequestDTO).load(data=request.get_json())
+    return codec(GetAppReleasesResponseDTO).dump(biz_app.get_app_releases(req.app_release_uuids))
 
 
 @bp.route("/search", methods=["POST"])
@@ -57,12 +99,52 @@ def search_apps() -> Response:
             200:
                 content:
                     application/json:
-                        schema: SearchAppsResponseDTO
+                        schema: SearchAppsPageResponseDTO
+            400:
+                description: Invalid request or cursor.
             401:
                 description: Unauthorized user.
     """
-    req: SearchAppsRequestDTO = SearchAppsRequestDTO.Schema().load(data=request.get_json())
-    return SearchAppsResponseDTO.Schema().dump(biz_app.search_apps(req))
+    req: SearchAppsRequestDTO = codec(SearchAppsRequestDTO).load(data=request.get_json())
+    res = biz_app.search_apps_passthrough(req)
+    if not isinstance(res, bytes):
+        res = codec(SearchAppsPageResponseDTO).dump(res)
+    # results depend on the user behind the session cookie (kids_mode)
+    return cached_json(res, public=current_user.is_anonymous, max_age=SEARCH_MAX_AGE, vary_cookie=True)
+
+
+@bp.route("/search/stream", methods=["POST"])
+def search_apps_stream() -> Response:
+    """
+    ---
+    post:
+        summary: Search applications, streaming results as they come.
+        description: Same search as /api/apps/search (except for next_cursor), results are sent as newline-delimited
+            JSON, one application per line, while appsvc is still sending the next ones.
+        tags:
+            - application
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema: SearchAppsRequestDTO
+        responses:
+            200:
+                content:
+                    application/x-ndjson:
+                        schema: SearchAppsResponseItem
+            401:
+                description: Unauthorized user.
+    """
+    req: SearchAppsRequestDTO = codec(SearchAppsRequestDTO).load(data=request.get_json())
+    # appsvc errors are raised here, before the response starts
+    batches = biz_app.stream_search_apps(req)
+    dump = codec(SearchAppsResponseItem).dump
+    lines = ("".join(json.dumps(dump(app), separators=(",", ":")) + "\n" for app in apps) for apps in batches)
+    res = Response(lines, mimetype="application/x-ndjson", headers={"Cache-Control": "no-store"})
+    # the appsvc stream is released however the response ends (read whole, client gone...)
+    res.call_on_close(batches.close)
+    return res
 
 
 @bp.route("/search/acl", methods=["POST"])
@@ -86,5 +168,37 @@ def search_apps_acl() -> Response:
             401:
                 description: Unauthorized user.
     """
-    req: SearchAppsAclRequestDTO = SearchAppsAclRequestDTO.Schema().load(data=request.get_json())
-    return SearchAppsAclResponseDTO.Schema().dump(biz_app.search_apps_acl(req))
+    req: SearchAppsAclRequestDTO = codec(SearchAppsAclRequestDTO).load(data=request.get_json())
+    res = codec(SearchAppsAclResponseDTO).dump(biz_app.search_apps_acl(req))
+    return cached_json(res, public=True, max_age=SEARCH_MAX_AGE)
+
+
+@bp.route("/search/as-you-type", methods=["POST"])
+def search_as_you_type() -> Response:
+    """
+    ---
+    post:
+        summary: "Search helper: auto-complete list and first search page at once."
+        description: Both are fetched concurrently, each with its own timeout. A side which failed or timed out is
+            null, with its error in errors (keyed acl or search), the other one is returned anyway.
+        tags:
+            - application
+        requestBody:
+            required: true
+            content:
+                application/json:
+                    schema: SearchAsYouTypeRequestDTO
+        responses:
+            200:
+                content:
+                    application/json:
+                        schema: SearchAsYouTypeResponseDTO
+            401:
+                description: Unauthorized user.
+    """
+    req: SearchAsYouTypeRequestDTO = codec(SearchAsYouTypeRequestDTO).load(data=request.get_json())
+    res = codec(SearchAsYouTypeResponseDTO).dump(biz_app.search_as_you_type(req, biz_app.is_kids_mode()))
+    # partial replies are not kept, the next identical request may get both sides
+    return cached_json(
+        res, public=current_user.is_anonymous, max_age=0 if res["errors"] else SEARCH_MAX_AGE, vary_cookie=True
+    )
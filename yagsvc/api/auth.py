@@ -41,6 +41,7 @@ from flask_login import (
 )
 from sqlalchemy.orm.exc import NoResultFound
 
+import yagsvc.biz.account as biz_account
 from yagsvc.models.account import UserDAO
 from yagsvc.models.auth import FlaskDanceOauth
 from yagsvc.sqldb import sqldb
@@ -49,8 +50,8 @@ login_manager = LoginManager()
 
 
 @login_manager.user_loader
-def load_user(user_id: str) -> UserDAO:
-    return UserDAO.query.get(user_id)
+def load_user(user_id: str) -> t.Optional[UserDAO]:
+    return biz_account.load_user(int(user_id))
 
 
 @login_manager.unauthorized_handler
@@ -0,0 +1,52 @@
+import os
+import typing as t
+
+from flask import (
+    Response,
+    jsonify,
+    request,
+)
+
+from yagsvc.biz import compression
+
+# app releases are the same for everyone, search results depend on the user (kids_mode)
+APP_RELEASE_MAX_AGE = int(os.environ.get("HTTP_CACHE_APP_RELEASE_MAX_AGE", "300"))
+SEARCH_MAX_AGE = int(os.environ.get("HTTP_CACHE_SEARCH_MAX_AGE", "30"))
+
+
+def cache_control(public: bool, max_age: int) -> str:
+    if public:
+        return f"public, max-age={max_age}"
+    # authenticated users: browser only, always revalidated
+    return "private, no-cache"
+
+
+def cached_json(
+    body: t.Union[dict, bytes],
+    public: bool,
+    max_age: int,
+    vary_cookie: bool = False,
+    tag: t.Optional[str] = None,
+) -> Response:
+    """JSON response with a strong ETag and caching headers, turned into a bodyless 304 on If-None-Match hits.
+
+    Conditional requests are only honored for GET/HEAD, POST responses just carry the validator.
+    The ETag gets an encoding suffix when the body is compressed later on (see biz.compression), those are matched too.
+    Bytes are sent as they are, e.g. passed through appsvc replies, along with their ETag when it is known already.
+    """
+    res = Response(body, mimetype="application/json") if isinstance(body, bytes) else jsonify(body)
+    data = res.get_data()
+    tag = tag or compression.etag(data)
+    res.set_etag(tag)
+    res.headers["Cache-Control"] = cache_control(public, max_age)
+    if vary_cookie:
+        res.vary.add("Cookie")
+    if request.method in ("GET", "HEAD") and compression.etag_matches(request.if_none_match, tag):
+        res.set_etag(compression.encoded_etag(tag, compression.negotiate(request.accept_encodings, len(data))))
+        res.vary.add("Accept-Encoding")
+        res.status_code = 304
+        res.set_data(b"")
+        # validators only, no representation headers
+        del res.headers["Content-Type"]
+        del res.headers["Content-Length"]
+    return res
@@ -1,3 +1,66 @@
-from flask import Blueprint
+import hmac
+import os
+from http import HTTPStatus
+
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    jsonify,
+    request,
+)
+
+from yagsvc.biz import (
+    metrics,
+    stats,
+)
+
+# bearer token required by /api/misc requests (e.g. Prometheus scrapes), the endpoints are disabled without it
+MISC_API_TOKEN = os.environ.get("MISC_API_TOKEN")
 
 bp = Blueprint("misc", __name__, url_prefix="/api/misc")
+
+
+@bp.before_request
+def check_token() -> None:
+    if not MISC_API_TOKEN:
+        abort(HTTPStatus.NOT_FOUND)
+    expected = f"Bearer {MISC_API_TOKEN}".encode()
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+        abort(HTTPStatus.UNAUTHORIZED)
+
+
+@bp.route("/stats", methods=["GET"])
+def get_stats() -> Response:
+    """
+    ---
+    get:
+        summary: Get per-worker runtime stats (connection pools, caches).
+        tags:
+            - misc
+        responses:
+            200:
+                description: Stats of the worker process which served the request.
+            401:
+                description: Authorization isn't "Bearer <MISC_API_TOKEN>".
+    """
+    return jsonify(stats.collect())
+
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics() -> Response:
+    """
+    ---
+    get:
+        summary: Get Prometheus metrics (request and appsvc call latencies, DB pool and component counters).
+        tags:
+            - misc
+        responses:
+            200:
+                description: Metrics of all workers when PROMETHEUS_MULTIPROC_DIR is set, of the serving one otherwise.
+                content:
+                    text/plain: {}
+            401:
+                description: Authorization isn't "Bearer <MISC_API_TOKEN>".
+    """
+    return metrics.metrics_response()
@@ -0,0 +1,259 @@
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import time
+import typing as t
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask
+from flask_login import current_user
+from marshmallow import ValidationError
+from werkzeug.datastructures import Accept
+from werkzeug.exceptions import (
+    BadRequest,
+    HTTPException,
+    UnsupportedMediaType,
+)
+from werkzeug.http import (
+    parse_accept_header,
+    parse_etags,
+    parse_options_header,
+)
+from werkzeug.test import EnvironBuilder
+
+import yagsvc.biz.app as biz_app
+from yagsvc.api import http_cache
+from yagsvc.biz import (
+    compression,
+    metrics,
+    tracing,
+)
+from yagsvc.biz.errors import (
+    ERROR_UNKNOWN,
+    BizException,
+)
+from yagsvc.dto.app import (
+    SearchAppsPageResponseDTO,
+    SearchAppsRequestDTO,
+    SearchAsYouTypeRequestDTO,
+    SearchAsYouTypeResponseDTO,
+)
+from yagsvc.dto.codec import (
+    codec,
+    dumps,
+)
+from yagsvc.services import appsvc_async
+from yagsvc.services.dto.appsvc import (
+    SearchAppsAclRequestDTO,
+    SearchAppsAclResponseDTO,
+)
+
+log = logging.getLogger("yagsvc")
+
+Scope = dict[str, t.Any]
+Receive = t.Callable[[], t.Awaitable[dict]]
+Send = t.Callable[[dict], t.Awaitable[None]]
+# a dict to encode, an encoded body, or an encoded body along with its ETag
+Reply = t.Union[dict, bytes, tuple[bytes, str]]
+
+APP_RELEASE_PATH = re.compile(r"^/api/apps/(?P<app_release_uuid>[^/]+)$")
+# rules of the mirrored Flask views, both serving modes report the same metrics series
+NATIVE_ROUTES = {
+    "get_app_release": "/api/apps/<app_release_uuid>",
+    "search_apps": "/api/apps/search",
+    "search_apps_acl": "/api/apps/search/acl",
+    "search_as_you_type": "/api/apps/search/as-you-type",
+}
+
+
+class AsgiApp:
+    """ASGI entry point: serves the /api/apps/* routes on asyncio, hands every other request to the Flask app.
+
+    Flask requests still run one per thread (see asgiref.wsgi.WsgiToAsgi), the native routes only need a thread
+    to resolve kids_mode for requests carrying a session cookie.
+    """
+
+    def __init__(self, flask_app: Flask) -> None:
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] == "http":
+            method, path = scope["method"], scope["path"]
+            if method == "POST" and path == "/api/apps/search":
+                await self.handle(
+                    self.search_apps, scope, receive, send, max_age=http_cache.SEARCH_MAX_AGE, per_user=True
+                )
+                return
+            if method == "POST" and path == "/api/apps/search/acl":
+                await self.handle(self.search_apps_acl, scope, receive, send, max_age=http_cache.SEARCH_MAX_AGE)
+                return
+            if method == "POST" and path == "/api/apps/search/as-you-type":
+                await self.handle(
+                    self.search_as_you_type, scope, receive, send, max_age=http_cache.SEARCH_MAX_AGE, per_user=True
+                )
+                return
+            if method == "GET" and APP_RELEASE_PATH.match(path):
+                await self.handle(self.get_app_release, scope, receive, send, max_age=http_cache.APP_RELEASE_MAX_AGE)
+                return
+        # a blank context per request, asgiref's executors would otherwise leak into the next request of the connection
+        await asyncio.create_task(self.wsgi_app(scope, receive, send), context=contextvars.Context())
+
+    async def lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await appsvc_async.close_clients()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def get_app_release(self, scope: Scope, body: bytes, kids_mode: bool) -> tuple[bytes, str]:
+        # pylint: disable=unused-argument
+        # routed here by APP_RELEASE_PATH: the uuid is the last segment
+        return await biz_app.get_app_release_json_async(scope["path"].rsplit("/", 1)[1])
+
+    async def search_apps(self, scope: Scope, body: bytes, kids_mode: bool) -> t.Union[dict, bytes]:
+        req: SearchAppsRequestDTO = codec(SearchAppsRequestDTO).load(data=_json(scope, body))
+        res = biz_app.search_apps_page(req, await biz_app.fetch_search_apps_async(req, kids_mode))
+        return res if isinstance(res, bytes) else codec(SearchAppsPageResponseDTO).dump(res)
+
+    async def search_apps_acl(self, scope: Scope, body: bytes, kids_mode: bool) -> dict:
+        # pylint: disable=unused-argument
+        req: SearchAppsAclRequestDTO = codec(SearchAppsAclRequestDTO).load(data=_json(scope, body))
+        return codec(SearchAppsAclResponseDTO).dump(await biz_app.search_apps_acl_async(req))
+
+    async def search_as_you_type(self, scope: Scope, body: bytes, kids_mode: bool) -> dict:
+        req: SearchAsYouTypeRequestDTO = codec(SearchAsYouTypeRequestDTO).load(data=_json(scope, body))
+        res = await biz_app.search_as_you_type_async(req, kids_mode)
+        return codec(SearchAsYouTypeResponseDTO).dump(res)
+
+    async def user(self, scope: Scope) -> tuple[bool, bool]:
+        """Whether the user behind the session cookie is anonymous, and kids_mode."""
+        cookie = _header(scope, b"cookie")
+        if cookie is None:
+            # anonymous users never need the (blocking) session and user lookup
+            return True, False
+        return await asyncio.to_thread(self._user, cookie.decode("latin-1"))
+
+    def _user(self, cookie: str) -> tuple[bool, bool]:
+        environ = EnvironBuilder(headers={"Cookie": cookie}).get_environ()
+        with self.flask_app.request_context(environ):
+            # cookies other than a valid session one (e.g. analytics) leave users anonymous, as in the Flask views
+            return current_user.is_anonymous, biz_app.is_kids_mode()
+
+    async def handle(
+        self,
+        handler: t.Callable[[Scope, bytes, bool], t.Awaitable[Reply]],
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        *,
+        max_age: int,
+        per_user: bool = False,
+    ) -> None:
+        """Serves the reply of handler with the headers and errors of the mirrored Flask view.
+
+        With per_user, replies depend on the user behind the session cookie (kids_mode): only anonymous ones are public.
+        """
+        started = time.perf_counter()
+        route = NATIVE_ROUTES[handler.__name__]
+        with tracing.server_span(scope["method"], route, lambda: _headers(scope)) as span:
+            body = b""
+            while True:
+                message = await receive()
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            # responses and errors mirror the ones of the Flask app (see biz.errors, biz.compression and api.http_cache)
+            headers = [(b"content-type", b"application/json")]
+            try:
+                anonymous, kids_mode = await self.user(scope) if per_user else (True, False)
+                res = await handler(scope, body, kids_mode)
+                if isinstance(res, tuple):
+                    data, etag = res
+                else:
+                    # byte-identical to Flask's jsonify, so both serving modes produce the same ETags
+                    data = res if isinstance(res, bytes) else dumps(res)
+                    etag = compression.etag(data)
+                status = 200
+                accept_encoding = _header(scope, b"accept-encoding")
+                encoding = compression.negotiate(
+                    parse_accept_header(accept_encoding.decode("latin-1") if accept_encoding else None, Accept),
+                    len(data),
+                )
+                headers += [
+                    (b"etag", f'"{compression.encoded_etag(etag, encoding)}"'.encode()),
+                    # partial replies (see search_as_you_type) are not kept, like in the Flask app
+                    (b"cache-control", http_cache.cache_control(anonymous, 0 if _partial(res) else max_age).encode()),
+                    (b"vary", b"Cookie, Accept-Encoding" if per_user else b"Accept-Encoding"),
+                ]
+                if_none_match = _header(scope, b"if-none-match")
+                if (
+                    scope["method"] == "GET"
+                    and if_none_match
+                    and compression.etag_matches(parse_etags(if_none_match.decode("latin-1")), etag)
+                ):
+                    # validators only, no representation headers
+                    data, status, headers = b"", 304, headers[1:]
+                elif encoding:
+                    data = compression.compress(data, encoding)
+                    headers.append((b"content-encoding", encoding.encode()))
+            except HTTPException as e:
+                # rendered by werkzeug, as the Flask error handlers do (see biz.errors)
+                error = e.get_response()
+                data, status = error.get_data(), error.status_code
+                headers = [
+                    (k.lower().encode("latin-1"), v.encode("latin-1"))
+                    for k, v in error.headers.items()
+                    if k != "Content-Length"
+                ]
+            except ValidationError as e:
+                error = json.dumps({"code": 1400, "message": e.messages})
+                data, status = error.encode(), 400
+                log.error(error)
+            except BizException as e:
+                error = json.dumps({"code": e.code, "message": e.message})
+                data, status = error.encode(), 409
+                log.error(error)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                data, status = json.dumps({"code": ERROR_UNKNOWN[0], "message": ERROR_UNKNOWN[1]}).encode(), 500
+                log.exception(e)
+            if status != 304:
+                headers.append((b"content-length", str(len(data)).encode()))
+            span.set_attribute("http.response.status_code", status)
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": data})
+        metrics.observe_request(scope["method"], route, status, time.perf_counter() - started)
+
+
+def _header(scope: Scope, name: bytes) -> t.Optional[bytes]:
+    return next((v for k, v in scope["headers"] if k == name), None)
+
+
+def _json(scope: Scope, body: bytes) -> t.Any:
+    """Request body decoded like Flask's request.get_json(), failing with the same errors."""
+    content_type = _header(scope, b"content-type")
+    mimetype, _ = parse_options_header(content_type.decode("latin-1") if content_type else None)
+    if not (mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))):
+        raise UnsupportedMediaType(
+            "Did not attempt to load JSON data because the request Content-Type was not 'application/json'."
+        )
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise BadRequest() from e
+
+
+def _partial(res: Reply) -> bool:
+    return isinstance(res, dict) and bool(res.get("errors"))
+
+
+def _headers(scope: Scope) -> dict[str, str]:
+    return {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
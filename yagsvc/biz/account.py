@@ -1,22 +1,433 @@
+import datetime
+import decimal
+import os
+import typing as t
+
+from flask_login import current_user
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    Text,
+    cast,
+    delete,
+    false,
+    func,
+    literal,
+    or_,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    JSONB,
+    Insert,
+    insert,
+)
+from sqlalchemy.orm import aliased
+
+from yagsvc.biz import (
+    cursor,
+    tracing,
+)
+from yagsvc.biz.cache import TTLCache
 from yagsvc.biz.misc import log_input_output
-from yagsvc.dto.account import UpdateUserRequestDTO
-from yagsvc.models.account import UserDAO
-from yagsvc.sqldb import sqldb
+from yagsvc.dto.account import (
+    APPS,
+    AppsLibOp,
+    AppsLibOpDTO,
+    GetLibraryResponseDTO,
+    LibraryItemDC,
+    PutLibraryItemResponseDTO,
+    UpdateUserRequestDTO,
+    json_pointer,
+)
+from yagsvc.models.account import (
+    LibraryItemDAO,
+    UserDAO,
+)
+from yagsvc.sqldb import (
+    replica_bind_arguments,
+    sqldb,
+)
+
+# per worker: an update is seen right away by the worker which served it, by the others once their entry expires
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# entries are sized 1, so max_bytes bounds the number of entries as well: users are cached without apps_lib, the
+# only column of unbounded size
+user_cache = TTLCache("user_cache", USER_CACHE_MAX_ENTRIES, USER_CACHE_MAX_ENTRIES)
+
+# columns of users as they are loaded (apps_lib is deferred) and cached
+_USER_COLUMNS = [c for c in UserDAO.__table__.columns if c.key != UserDAO.apps_lib.key]
+
+
+@tracing.traced
+def load_user(user_id: int) -> t.Optional[UserDAO]:
+    """Returns the user for Flask-Login, from the cache when possible.
+
+    Cached users are rebuilt as transient (session-less) UserDAO objects, without apps_lib: they are meant to be read,
+    not updated. Users are read from the replica, if any, or from the primary when the replica doesn't have them yet
+    (sign-ups).
+    """
+    entry = user_cache.get(user_id)
+    if entry and entry.is_fresh():
+        return UserDAO(**entry.value) if entry.value is not None else None
+    user = sqldb.session.get(UserDAO, user_id, bind_arguments=replica_bind_arguments())
+    if user is None:
+        user = sqldb.session.get(UserDAO, user_id)
+    _cache_user(user_id, user)
+    return user
+
+
+def _cache_user(user_id: int, user: t.Optional[UserDAO]) -> None:
+    values = {c.key: getattr(user, c.key) for c in _USER_COLUMNS} if user is not None else None
+    user_cache.put(user_id, values, 1, USER_CACHE_TTL)
 
 
+@tracing.traced
 def get_user(user_id: int) -> UserDAO:
-    return UserDAO.query.filter_by(id=user_id).first()
+    # the user behind the session was already loaded by Flask-Login
+    if current_user.is_authenticated and current_user.id == user_id:
+        return current_user
+    return sqldb.session.scalars(select(UserDAO).filter_by(id=user_id), bind_arguments=replica_bind_arguments()).first()
+
+
+@tracing.traced
+def get_apps_lib(user_id: int) -> t.Optional[dict]:
+    """The user's apps_lib as clients know it: the apps_lib column, with the library items as its apps list.
+
+    Items are app release uuids, or objects with an app_release_uuid key when they have metadata, in position order. Costs
+    as much as the library is big, unlike get_library. Read from the primary, like get_library.
+    """
+    doc = sqldb.session.execute(select(UserDAO.apps_lib).where(UserDAO.id == user_id)).scalar()
+    rows = sqldb.session.execute(
+        select(LibraryItemDAO.app_release_uuid, LibraryItemDAO.meta)
+        .where(LibraryItemDAO.user_id == user_id)
+        .order_by(LibraryItemDAO.position, LibraryItemDAO.app_release_uuid)
+    ).all()
+    if doc is None and not rows:
+        return None
+    apps = [
+        {"app_release_uuid": row.app_release_uuid, **row.meta} if row.meta else row.app_release_uuid for row in rows
+    ]
+    return {**(doc if isinstance(doc, dict) else {}), APPS: apps}
+
+
+@log_input_output
+@tracing.traced
+def update_user(user_id: int, user: UpdateUserRequestDTO, with_apps_lib: bool = True) -> None:
+    """Rewrites the user's columns; apps_lib (and so the library) only with_apps_lib, i.e. when it was sent."""
+    values: dict[t.Any, t.Any] = {
+        UserDAO.email: user.email,
+        UserDAO.name: user.name,
+        UserDAO.tz: user.tz,
+        UserDAO.dob: user.dob,
+    }
+    if with_apps_lib:
+        values[UserDAO.apps_lib] = _apps_lib_doc(user.apps_lib)
+    sqldb.session.query(UserDAO).filter(UserDAO.id == user_id).update(values)
+    if with_apps_lib:
+        _write_library(user_id, user.apps_lib)
+    sqldb.session.commit()
+    # read back from the primary: the replica may lag, this worker must serve the update right away
+    _cache_user(user_id, sqldb.session.get(UserDAO, user_id, populate_existing=True))
+
+
+@log_input_output
+@tracing.traced
+def patch_user(user_id: int, values: dict[str, t.Any], apps_lib_ops: t.Sequence[AppsLibOpDTO]) -> UserDAO:
+    """Updates the given columns only and applies apps_lib_ops, without reading or rewriting apps_lib as a whole.
+
+    Operations on the apps_lib column run on the server, in one UPDATE statement, on the document as it is when the
+    statement runs, so concurrent patches don't overwrite each other. Operations on the apps list touch the library
+    rows they are about, the user row being locked meanwhile (see _patch_library). Operations whose path or from
+    doesn't exist leave apps_lib as it is.
+    """
+    library_ops = [op for op in apps_lib_ops if json_pointer(op.path)[0] == APPS]
+    doc_ops = [op for op in apps_lib_ops if json_pointer(op.path)[0] != APPS]
+    columns = dict(values)
+    if "apps_lib" in values:
+        columns["apps_lib"] = _apps_lib_doc(values["apps_lib"])
+    if doc_ops:
+        columns["apps_lib"] = _patch_apps_lib(doc_ops)
+    if not columns and not library_ops:
+        return get_user(user_id)
+    if columns:
+        stmt = update(UserDAO).where(UserDAO.id == user_id).values(columns).returning(*_USER_COLUMNS)
+    else:
+        # the user row is locked all the same, so that concurrent patches of a library are serialized
+        stmt = select(*_USER_COLUMNS).where(UserDAO.id == user_id).with_for_update()
+    row = sqldb.session.execute(stmt).one()
+    if "apps_lib" in values:
+        _write_library(user_id, values["apps_lib"])
+    for op in library_ops:
+        _patch_library(user_id, op)
+    sqldb.session.commit()
+    user = UserDAO(**row._asdict())  # pylint: disable=protected-access
+    _cache_user(user_id, user)
+    return user
+
+
+def _patch_apps_lib(ops: t.Sequence[AppsLibOpDTO]) -> ColumnElement:
+    # each operation reads the document of the previous one from a derived table, so that referencing it more than
+    # once (move, append) doesn't make the statement grow exponentially with the number of operations; OFFSET 0 keeps
+    # the planner from pulling the derived tables up, which would inline the expressions again.
+    doc = select(_object(UserDAO.apps_lib).label("doc")).correlate(UserDAO).offset(0).subquery().c.doc
+    for op in ops:
+        path = json_pointer(op.path)
+        from_path = json_pointer(op.from_path) if op.from_path is not None else []
+        doc = select(_patch_op(doc, op, path, from_path).label("doc")).offset(0).subquery().c.doc
+    return select(doc).scalar_subquery()
+
+
+def _patch_op(doc: ColumnElement, op: AppsLibOpDTO, path: list[str], from_path: list[str]) -> ColumnElement:
+    """op run on doc, at path (and from from_path), which are op's or relative to an item of the apps list."""
+    if op.op == AppsLibOp.REMOVE:
+        return doc.op("#-", return_type=JSONB)(_text_array(path))
+    if op.op == AppsLibOp.REPLACE:
+        return func.jsonb_set(doc, _text_array(path), _jsonb(op.value), false())
+    if op.op == AppsLibOp.MOVE:
+        value = doc.op("#>", return_type=JSONB)(_text_array(from_path))
+        # a missing from makes value NULL, and so the (strict) jsonb functions, hence the coalesce
+        return func.coalesce(_insert(doc.op("#-", return_type=JSONB)(_text_array(from_path)), path, value), doc)
+    if path[-1] == "-" or path[-1].isdigit():
+        return _insert(doc, path, _jsonb(op.value))
+    return func.jsonb_set(doc, _text_array(path), _jsonb(op.value), true())
+
+
+def _insert(doc: ColumnElement, path: list[str], value: ColumnElement) -> ColumnElement:
+    """Inserts value into an array, before the element at path or at its end (-), like JSON Patch does."""
+    if path[-1] != "-":
+        return func.jsonb_insert(doc, _text_array(path), value)
+    # appending creates the array when it's missing
+    parent = _text_array(path[:-1])
+    array = func.coalesce(doc.op("#>", return_type=JSONB)(parent), _jsonb([]))
+    return func.jsonb_set(doc, parent, func.jsonb_insert(array, _text_array(["-1"]), value, true()), true())
+
+
+def _text_array(path: list[str]) -> ColumnElement:
+    return literal(path, ARRAY(Text))
+
+
+def _jsonb(value: t.Any) -> ColumnElement:
+    return cast(value, JSONB)
+
+
+def _object(column: ColumnElement) -> ColumnElement:
+    """The document of a JSONB column, {} for nulls (SQL NULL or JSON null, depending on how they were written)."""
+    return func.coalesce(func.nullif(column, _jsonb(JSONB.NULL)), _jsonb({}))
+
+
+@tracing.traced
+def get_library(user_id: int, limit: int, page_cursor: t.Optional[str]) -> GetLibraryResponseDTO:
+    """A page of the user's library, most recently added first.
+
+    Pages start after the cursor's (added_ts, app_release_uuid) in library_user_id_added_ts_idx order, so any page
+    costs the same, however big the library. Read from the primary: users expect the items they just added.
+    """
+    query = select(LibraryItemDAO.app_release_uuid, LibraryItemDAO.added_ts, LibraryItemDAO.meta).where(
+        LibraryItemDAO.user_id == user_id
+    )
+    if page_cursor:
+        added_ts, app_release_uuid = cursor.decode(page_cursor, (datetime.datetime.fromisoformat, str))
+        query = query.where(
+            tuple_(LibraryItemDAO.added_ts, LibraryItemDAO.app_release_uuid) < tuple_(added_ts, app_release_uuid)
+        )
+    # one more row tells whether there is a next page
+    rows = sqldb.session.execute(
+        query.order_by(LibraryItemDAO.added_ts.desc(), LibraryItemDAO.app_release_uuid.desc()).limit(limit + 1)
+    ).all()
+    items = [LibraryItemDC(row.app_release_uuid, row.added_ts, row.meta) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = cursor.encode([items[-1].added_ts.isoformat(), items[-1].app_release_uuid])
+    return GetLibraryResponseDTO(items, next_cursor)
 
 
 @log_input_output
-def update_user(user_id: int, user: UpdateUserRequestDTO) -> None:
-    sqldb.session.query(UserDAO).filter(UserDAO.id == user_id).update(
-        {
-            UserDAO.email: user.email,
-            UserDAO.name: user.name,
-            UserDAO.tz: user.tz,
-            UserDAO.apps_lib: user.apps_lib,
-            UserDAO.dob: user.dob,
-        }
+@tracing.traced
+def put_library_item(user_id: int, app_release_uuid: str, metadata: t.Optional[dict]) -> PutLibraryItemResponseDTO:
+    """Adds an app release to the user's library, or replaces its metadata when it's already there."""
+    stmt = insert(LibraryItemDAO).values(
+        user_id=user_id,
+        app_release_uuid=app_release_uuid,
+        position=_position_at(user_id, "-", literal(app_release_uuid)),
+        meta=metadata,
     )
+    added_ts = sqldb.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LibraryItemDAO.user_id, LibraryItemDAO.app_release_uuid],
+            set_={LibraryItemDAO.meta: stmt.excluded[LibraryItemDAO.meta.name]},
+        ).returning(LibraryItemDAO.added_ts)
+    ).scalar_one()
     sqldb.session.commit()
+    return PutLibraryItemResponseDTO(app_release_uuid, added_ts, metadata)
+
+
+@log_input_output
+@tracing.traced
+def delete_library_item(user_id: int, app_release_uuid: str) -> None:
+    sqldb.session.execute(
+        delete(LibraryItemDAO).where(
+            LibraryItemDAO.user_id == user_id, LibraryItemDAO.app_release_uuid == app_release_uuid
+        )
+    )
+    sqldb.session.commit()
+
+
+# The apps list of apps_lib is the user's library rows, in position order (see get_apps_lib): the apps_lib column keeps
+# the rest of the document. Writes of the list as a whole rewrite the library, the other ones touch the rows they are
+# about. Each write is one statement, positions and the items at an index are read by the statement itself.
+
+
+def _apps_lib_doc(apps_lib: t.Optional[dict]) -> t.Optional[dict]:
+    """What the apps_lib column stores of apps_lib."""
+    return {k: v for k, v in apps_lib.items() if k != APPS} if apps_lib is not None else None
+
+
+def _library_item(item: t.Any) -> tuple[str, t.Optional[dict]]:
+    """App release uuid and metadata of an item of the apps list, see dto.account.is_library_item."""
+    if isinstance(item, str):
+        return item, None
+    return item["app_release_uuid"], {k: v for k, v in item.items() if k != "app_release_uuid"} or None
+
+
+def _write_library(user_id: int, apps_lib: t.Optional[dict]) -> None:
+    """Makes the user's library rows the items of apps_lib; the dates of the items already there are kept."""
+    # distinct app releases, see dto.account.is_library
+    items = [_library_item(item) for item in (apps_lib or {}).get(APPS) or []]
+    removed = delete(LibraryItemDAO).where(
+        LibraryItemDAO.user_id == user_id,
+        LibraryItemDAO.app_release_uuid.not_in([app_release_uuid for app_release_uuid, _ in items]),
+    )
+    if not items:
+        sqldb.session.execute(removed)
+        return
+    stmt = insert(LibraryItemDAO).values(
+        [
+            {"user_id": user_id, "app_release_uuid": app_release_uuid, "position": i, "meta": metadata}
+            for i, (app_release_uuid, metadata) in enumerate(items)
+        ]
+    )
+    excluded_position, excluded_meta = (
+        stmt.excluded[LibraryItemDAO.position.name],
+        stmt.excluded[LibraryItemDAO.meta.name],
+    )
+    sqldb.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[LibraryItemDAO.user_id, LibraryItemDAO.app_release_uuid],
+            set_={LibraryItemDAO.position: excluded_position, LibraryItemDAO.meta: excluded_meta},
+            # rows left as they are aren't rewritten
+            where=or_(
+                LibraryItemDAO.position != excluded_position, LibraryItemDAO.meta.is_distinct_from(excluded_meta)
+            ),
+        ).add_cte(removed.cte("removed"))
+    )
+
+
+def _patch_library(user_id: int, op: AppsLibOpDTO) -> None:
+    """Runs op, whose path is in the apps list (see dto.account.AppsLibOpDTO.validate_library_path), on the rows.
+
+    An item added or moved to an index gets a position between those of the items around it (after the last item at
+    the end), the others keep theirs. Adding an item already there moves it.
+    """
+    path = json_pointer(op.path)[1:]
+    from_path = json_pointer(op.from_path)[1:] if op.from_path is not None else []
+    if not path:
+        _write_library(user_id, {APPS: op.value} if op.op != AppsLibOp.REMOVE else None)
+        return
+    stmt: t.Any
+    # index of the item op is about, unless it adds one
+    at = (from_path or path)[0]
+    if op.op == AppsLibOp.ADD and len(path) == 1:
+        app_release_uuid, metadata = _library_item(op.value)
+        stmt = _upsert_library_item(
+            user_id, app_release_uuid, _position_at(user_id, path[0], literal(app_release_uuid)), metadata
+        )
+    elif at == "-":
+        # there is no item after the last one
+        return
+    elif op.op == AppsLibOp.REPLACE and len(path) == 1:
+        stmt = _replace_library_item(user_id, at, *_library_item(op.value))
+    else:
+        item = _item_at(user_id, at)
+        where = LibraryItemDAO.user_id == user_id, LibraryItemDAO.app_release_uuid == item
+        if len(path) > 1:
+            # metadata of the item, patched as a document of its own
+            meta = _patch_op(_object(LibraryItemDAO.meta), op, path[1:], from_path[1:])
+            stmt = update(LibraryItemDAO).where(*where).values(meta=func.nullif(meta, _jsonb({})))
+        elif op.op == AppsLibOp.REMOVE:
+            stmt = delete(LibraryItemDAO).where(*where)
+        else:
+            stmt = update(LibraryItemDAO).where(*where).values(position=_position_at(user_id, path[0], item))
+    sqldb.session.execute(stmt)
+
+
+def _items(user_id: int) -> tuple[t.Any, Select]:
+    """The user's library rows, in apps list order, as a table of their own: statements on the library read it."""
+    items = aliased(LibraryItemDAO)
+    return items, select(items).where(items.user_id == user_id).order_by(items.position, items.app_release_uuid)
+
+
+def _item_at(user_id: int, index: str) -> ColumnElement:
+    """The app release uuid of the item at index of the apps list, NULL past the last item."""
+    items, query = _items(user_id)
+    return query.with_only_columns(items.app_release_uuid).offset(int(index)).limit(1).scalar_subquery()
+
+
+def _position_at(user_id: int, index: str, but: ColumnElement) -> ColumnElement:
+    """The position putting an item at index (- after the last one) of the apps list without the item but."""
+    items, query = _items(user_id)
+    others = query.where(items.app_release_uuid != but)
+    last = others.with_only_columns(func.max(items.position)).order_by(None).scalar_subquery()
+    after_last = func.coalesce(last + 1, 0)
+    if index == "-":
+        return after_last
+    after = others.with_only_columns(items.position).offset(int(index)).limit(1).scalar_subquery()
+    if index == "0":
+        return func.coalesce(after - 1, after_last)
+    before = others.with_only_columns(items.position).offset(int(index) - 1).limit(1).scalar_subquery()
+    # exact: numeric products have the scale of both factors, unlike quotients
+    return func.coalesce((before + after) * literal(decimal.Decimal("0.5")), after_last)
+
+
+def _replace_library_item(user_id: int, index: str, app_release_uuid: str, metadata: t.Optional[dict]) -> Insert:
+    """Replaces the item at index with app_release_uuid, which takes its position (moving it if it's elsewhere)."""
+    items, query = _items(user_id)
+    replaced = (
+        query.with_only_columns(items.app_release_uuid, items.position).offset(int(index)).limit(1).cte("replaced")
+    )
+    removed = delete(LibraryItemDAO).where(
+        LibraryItemDAO.user_id == user_id,
+        LibraryItemDAO.app_release_uuid.in_(select(replaced.c.app_release_uuid)),
+        LibraryItemDAO.app_release_uuid != app_release_uuid,
+    )
+    stmt = insert(LibraryItemDAO).from_select(
+        [LibraryItemDAO.user_id, LibraryItemDAO.app_release_uuid, LibraryItemDAO.position, LibraryItemDAO.meta],
+        select(literal(user_id), literal(app_release_uuid), replaced.c.position, literal(metadata, JSONB)),
+    )
+    return _on_conflict_move(stmt).add_cte(removed.cte("removed"))
+
+
+def _upsert_library_item(
+    user_id: int, app_release_uuid: str, position: ColumnElement, metadata: t.Optional[dict]
+) -> Insert:
+    return _on_conflict_move(
+        insert(LibraryItemDAO).values(
+            user_id=user_id, app_release_uuid=app_release_uuid, position=position, meta=metadata
+        )
+    )
+
+
+def _on_conflict_move(stmt: Insert) -> Insert:
+    """stmt, whose items already in the library get its position and metadata."""
+    return stmt.on_conflict_do_update(
+        index_elements=[LibraryItemDAO.user_id, LibraryItemDAO.app_release_uuid],
+        set_={
+            LibraryItemDAO.position: stmt.excluded[LibraryItemDAO.position.name],
+            LibraryItemDAO.meta: stmt.excluded[LibraryItemDAO.meta.name],
+        },
+    )
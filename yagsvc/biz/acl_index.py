@@ -0,0 +1,239 @@
+import bisect
+import os
+import threading
+import time
+import typing as t
+
+from flask import Flask
+
+from yagsvc.biz import stats
+from yagsvc.biz.errors import AppSvcNotFoundException
+from yagsvc.biz.misc import log
+from yagsvc.services import appsvc
+from yagsvc.services.dto.appsvc import (
+    SearchAppsAclRequestDTO,
+    SearchAppsOrderBy,
+    SearchAppsRequestOutDTO,
+)
+
+ACL_INDEX_ENABLED = os.environ.get("ACL_INDEX_ENABLED", "false").lower() == "true"
+ACL_INDEX_REFRESH_INTERVAL = float(os.environ.get("ACL_INDEX_REFRESH_INTERVAL", "300"))
+# refreshes list the whole catalog again that often, dropping the releases appsvc doesn't have anymore
+ACL_INDEX_FULL_REFRESH_INTERVAL = float(os.environ.get("ACL_INDEX_FULL_REFRESH_INTERVAL", "3600"))
+# an index which failed to refresh for that long is not trusted anymore
+ACL_INDEX_MAX_AGE = float(os.environ.get("ACL_INDEX_MAX_AGE", "900"))
+ACL_INDEX_PAGE_SIZE = int(os.environ.get("ACL_INDEX_PAGE_SIZE", "100"))
+ACL_INDEX_LIMIT = int(os.environ.get("ACL_INDEX_LIMIT", "10"))
+
+
+def normalize(term: str) -> str:
+    return " ".join(term.casefold().split())
+
+
+class PrefixIndex:
+    """Immutable sorted-array prefix index over (normalized term -> display term)."""
+
+    def __init__(self, terms: t.Mapping[str, str]) -> None:
+        self.keys = sorted(terms)
+        self.values = [terms[k] for k in self.keys]
+
+    def lookup(self, prefix: str, limit: int) -> list[str]:
+        prefix = normalize(prefix)
+        res: list[str] = []
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix) and len(res) < limit:
+            if self.values[i] not in res:
+                res.append(self.values[i])
+            i += 1
+        return res
+
+
+class _ModeIndex:
+    def __init__(self) -> None:
+        self.release_ids: set[str] = set()
+        self.app_names: dict[str, str] = {}
+        # (alternative names, company names) of the releases whose details are known
+        self.details: dict[str, tuple[list[str], list[str]]] = {}
+        # (names, companies) indexes, only built once the details of every release are known
+        self.indexes: t.Optional[tuple[PrefixIndex, PrefixIndex]] = None
+        # search page (offset or keyset) where the crawl which failed last stopped, releases after it aren't all known
+        self.resume: t.Optional[dict[str, t.Any]] = None
+
+    def add_release(self, release_id: str, name: str) -> None:
+        self.release_ids.add(release_id)
+        self.app_names[release_id] = name
+
+    def add_details(self, release_id: str, details: t.Optional[dict]) -> None:
+        """Adds the alternative and company names of a release, details are None when appsvc doesn't have it anymore."""
+        details = details or {}
+        self.details[release_id] = (
+            details.get("alternative_names") or [],
+            [company["name"] for company in details.get("companies") or []],
+        )
+
+    def missing_details(self) -> set[str]:
+        return self.release_ids - self.details.keys()
+
+    def rebuild(self) -> None:
+        if self.missing_details():
+            return
+        names: dict[str, str] = {}
+        companies: dict[str, str] = {}
+        for release_id in self.release_ids:
+            alternative_names, company_names = self.details[release_id]
+            for name in [self.app_names[release_id], *alternative_names]:
+                names.setdefault(normalize(name), name)
+            for company in company_names:
+                companies.setdefault(normalize(company), company)
+        # readers keep using the previous indexes until the reference swap
+        self.indexes = (PrefixIndex(names), PrefixIndex(companies))
+
+
+class AclIndex:
+    """Optional in-process autocomplete engine for search_apps_acl, one per kids_mode.
+
+    App names come from paging through appsvc search results, first fully, then incrementally from the newest
+    releases. Alternative and company names aren't part of search results: the refresh fetches the details of every
+    release it hasn't seen yet. lookup returns None whenever the index can't answer as appsvc would (cold, stale,
+    missing details, unsupported query) and the caller falls back to appsvc.
+    """
+
+    def __init__(self) -> None:
+        self.modes = {False: _ModeIndex(), True: _ModeIndex()}
+        self.loaded_at: t.Optional[float] = None
+        self.fully_loaded_at: t.Optional[float] = None
+        self.counters = stats.Counters("acl_index", ["hits", "fallbacks", "refreshes", "refresh_errors", "details"])
+        self._lock = threading.Lock()
+        stats.register("acl_index", self.get_stats)
+
+    def is_ready(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < ACL_INDEX_MAX_AGE
+
+    def lookup(self, req: SearchAppsAclRequestDTO) -> t.Optional[list[str]]:
+        indexes = self.modes[req.kids_mode].indexes
+        res = None
+        if indexes is not None and self.is_ready():
+            names_index, companies_index = indexes
+            if req.app_name and not req.company_name:
+                res = names_index.lookup(req.app_name, ACL_INDEX_LIMIT)
+            elif req.company_name and not req.app_name:
+                res = companies_index.lookup(req.company_name, ACL_INDEX_LIMIT)
+        self.counters.inc("fallbacks" if res is None else "hits")
+        return res
+
+    def refresh(self) -> None:
+        """Pages through the newest releases until an already indexed one shows up (full load on first call).
+
+        A crawl which failed is resumed first, from the page where it stopped, so that no release is skipped: those
+        after an indexed one are all known once it completes. The details of the releases new to the index are fetched
+        afterwards, the indexes are rebuilt (and the index marked loaded) once all are known. Every
+        ACL_INDEX_FULL_REFRESH_INTERVAL, the whole catalog is listed again instead.
+        """
+        now = time.monotonic()
+        full = self.fully_loaded_at is not None and now - self.fully_loaded_at >= ACL_INDEX_FULL_REFRESH_INTERVAL
+        for kids_mode, mode in list(self.modes.items()):
+            if full:
+                self._reload(kids_mode, mode)
+                continue
+            if mode.resume is not None:
+                self._crawl(kids_mode, mode, mode.resume)
+            self._crawl(kids_mode, mode, {})
+        self._fetch_details()
+        with self._lock:
+            for mode in self.modes.values():
+                mode.rebuild()
+        self.loaded_at = time.monotonic()
+        if full or self.fully_loaded_at is None:
+            self.fully_loaded_at = now
+        self.counters.inc("refreshes")
+
+    def _reload(self, kids_mode: bool, mode: _ModeIndex) -> None:
+        """Lists the whole catalog into a new index which replaces mode, the details of known releases are kept."""
+        fresh = _ModeIndex()
+        self._crawl(kids_mode, fresh, {})
+        with self._lock:
+            fresh.details = {release_id: d for release_id, d in mode.details.items() if release_id in fresh.release_ids}
+            fresh.indexes = mode.indexes
+            self.modes[kids_mode] = fresh
+
+    def _crawl(self, kids_mode: bool, mode: _ModeIndex, page: dict[str, t.Any]) -> None:
+        """Adds the releases from page on, newest first, until an indexed one shows up or the last page.
+
+        Offsets shift as releases are added: crawls resumed at an offset don't stop at indexed releases.
+        """
+        stop_at_known = "offset" not in page
+        while True:
+            mode.resume = page
+            apps = appsvc.search_apps(
+                SearchAppsRequestOutDTO(
+                    kids_mode=kids_mode, limit=ACL_INDEX_PAGE_SIZE, order_by=SearchAppsOrderBy.TS_ADDED, **page
+                ),
+                bulkhead=appsvc.ACL_INDEX_BULKHEAD,
+            )["apps"]
+            known = False
+            with self._lock:
+                for app in apps:
+                    known = known or app["id"] in mode.release_ids
+                    mode.add_release(app["id"], app["name"])
+            if (known and stop_at_known) or len(apps) < ACL_INDEX_PAGE_SIZE:
+                break
+            # keyset pages (releases added meanwhile don't shift them), offsets for appsvc versions without ts_added
+            if apps[-1].get("ts_added") is not None:
+                page = {"after_value": apps[-1]["ts_added"], "after_id": apps[-1]["id"]}
+            else:
+                page = {"offset": page.get("offset", 0) + ACL_INDEX_PAGE_SIZE}
+        mode.resume = None
+
+    def _fetch_details(self) -> None:
+        with self._lock:
+            missing = set().union(*(mode.missing_details() for mode in self.modes.values()))
+        # one at a time
+        for release_id in sorted(missing):
+            try:
+                details = appsvc.fetch_app_release(release_id, bulkhead=appsvc.APP_RELEASE_BATCH_BULKHEAD).body
+            except AppSvcNotFoundException:
+                details = None
+            self.counters.inc("details")
+            self._add_details(release_id, details)
+
+    def add_release_details(self, details: dict) -> None:
+        """Picks up the names of release details fetched for clients, e.g. alternative names changed meanwhile."""
+        if self.loaded_at is None:
+            return
+        self._add_details(details["uuid"], details)
+
+    def _add_details(self, release_id: str, details: t.Optional[dict]) -> None:
+        with self._lock:
+            for mode in self.modes.values():
+                if release_id in mode.release_ids:
+                    mode.add_details(release_id, details)
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["ready"] = self.is_ready()
+        for kids_mode, mode in self.modes.items():
+            prefix = "kids_" if kids_mode else ""
+            names_index, companies_index = mode.indexes or (PrefixIndex({}), PrefixIndex({}))
+            res[f"{prefix}names"] = len(names_index.keys)
+            res[f"{prefix}companies"] = len(companies_index.keys)
+            with self._lock:
+                res[f"{prefix}missing_details"] = len(mode.missing_details())
+        return res
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.counters.inc("refresh_errors")
+                log.warning("acl index refresh failed: %s", e)
+            time.sleep(ACL_INDEX_REFRESH_INTERVAL)
+
+
+acl_index = AclIndex()
+
+
+def init_app(app: Flask) -> None:
+    # pylint: disable=unused-argument
+    if ACL_INDEX_ENABLED:
+        threading.Thread(target=acl_index.run, name="acl_index", daemon=True).start()
@@ -1,42 +1,636 @@
+import asyncio
 import datetime
+import json
+import os
+import re
+import threading
+import time
+import typing as t
+from concurrent.futures import Future
+from functools import partial
 
 from dateutil.relativedelta import relativedelta
 from flask_login import (
     AnonymousUserMixin,
     current_user,
 )
+from marshmallow import ValidationError
+from opentelemetry.trace import (
+    Span,
+    Status,
+    StatusCode,
+)
 
-from yagsvc.dto.app import SearchAppsRequestDTO
-from yagsvc.services import appsvc
+from yagsvc.biz import (
+    compression,
+    cursor,
+    stats,
+    tracing,
+)
+from yagsvc.biz.acl_index import (
+    acl_index,
+    normalize,
+)
+from yagsvc.biz.cache import (
+    CacheEntry,
+    TTLCache,
+)
+from yagsvc.biz.errors import (
+    ERROR_APPSVC,
+    ERROR_UNKNOWN,
+    AppSvcNotFoundException,
+    BizException,
+)
+from yagsvc.biz.misc import (
+    APP_RELEASE_BATCH_WORKERS,
+    SEARCH_AS_YOU_TYPE_WORKERS,
+    SEARCH_CACHE_REFRESH_WORKERS,
+    get_executor,
+    log,
+)
+from yagsvc.biz.prefetch import release_prefetcher
+from yagsvc.dto.app import (
+    SearchAppsRequestDTO,
+    SearchAsYouTypeRequestDTO,
+)
+from yagsvc.dto.codec import (
+    codec,
+    dumps,
+)
+from yagsvc.services import (
+    appsvc,
+    appsvc_async,
+)
 from yagsvc.services.dto.appsvc import (
     GetAppReleaseResponseDTO,
     SearchAppsAclRequestDTO,
-    SearchAppsAclResponseDTO,
+    SearchAppsOrderBy,
     SearchAppsRequestOutDTO,
     SearchAppsResponseDTO,
 )
 
+APP_RELEASE_CACHE_TTL = float(os.environ.get("APP_RELEASE_CACHE_TTL", "300"))
+APP_RELEASE_CACHE_NEGATIVE_TTL = float(os.environ.get("APP_RELEASE_CACHE_NEGATIVE_TTL", "30"))
+APP_RELEASE_CACHE_MAX_ENTRIES = int(os.environ.get("APP_RELEASE_CACHE_MAX_ENTRIES", "2000"))
+APP_RELEASE_CACHE_MAX_BYTES = int(os.environ.get("APP_RELEASE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 
-def get_app_release(app_release_uuid: str) -> GetAppReleaseResponseDTO:
-    return appsvc.get_app_release(app_release_uuid)
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "30"))
+# how long past its TTL an entry may still be served while a single background refresh runs
+SEARCH_CACHE_STALE_TTL = float(os.environ.get("SEARCH_CACHE_STALE_TTL", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "500"))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 
+ACL_CACHE_TTL = float(os.environ.get("ACL_CACHE_TTL", "60"))
+ACL_CACHE_MAX_ENTRIES = int(os.environ.get("ACL_CACHE_MAX_ENTRIES", "5000"))
+ACL_CACHE_MAX_BYTES = int(os.environ.get("ACL_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# most names appsvc returns per ACL request, shorter replies then hold every match of their term (see _cached_acl):
+# 0 never assumes it
+ACL_UPSTREAM_LIMIT = int(os.environ.get("ACL_UPSTREAM_LIMIT", "0"))
 
-def search_apps(req: SearchAppsRequestDTO) -> SearchAppsResponseDTO:
+# search as you type: each side gets its own deadline, the reply doesn't wait for a side past it
+SEARCH_AS_YOU_TYPE_ACL_TIMEOUT = float(os.environ.get("SEARCH_AS_YOU_TYPE_ACL_TIMEOUT", "0.3"))
+SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT = float(os.environ.get("SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT", "1"))
+
+T = t.TypeVar("T")
+
+release_cache = TTLCache("app_release_cache", APP_RELEASE_CACHE_MAX_ENTRIES, APP_RELEASE_CACHE_MAX_BYTES)
+search_cache = TTLCache("search_cache", SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES)
+acl_cache = TTLCache("acl_cache", ACL_CACHE_MAX_ENTRIES, ACL_CACHE_MAX_BYTES)
+# set once an ACL reply contradicts ACL_UPSTREAM_LIMIT: no reply is narrowed anymore
+_acl_narrowing_off = threading.Event()
+_search_refreshing: set[str] = set()
+_search_refreshing_lock = threading.Lock()
+search_as_you_type_stats = stats.Counters(
+    "search_as_you_type", ["calls", "acl_timeouts", "search_timeouts", "acl_errors", "search_errors"]
+)
+stats.register("search_as_you_type", search_as_you_type_stats.snapshot)
+
+
+@tracing.traced
+def get_app_release(app_release_uuid: str, bulkhead: t.Optional[str] = None) -> GetAppReleaseResponseDTO:
+    return _app_release_entry(app_release_uuid, bulkhead).value
+
+
+@tracing.traced
+def get_app_release_json(app_release_uuid: str) -> tuple[bytes, str]:
+    """Release as served to clients, along with its ETag: both are computed once per cached release."""
+    entry = _app_release_entry(app_release_uuid)
+    return entry.meta["json"], entry.meta["json_etag"]
+
+
+@tracing.traced
+async def get_app_release_json_async(app_release_uuid: str) -> tuple[bytes, str]:
+    entry = await _app_release_entry_async(app_release_uuid)
+    return entry.meta["json"], entry.meta["json_etag"]
+
+
+def _app_release_entry(app_release_uuid: str, bulkhead: t.Optional[str] = None) -> CacheEntry:
+    entry = release_cache.get(app_release_uuid)
+    if entry and entry.is_fresh():
+        return _cached_app_release(app_release_uuid, entry)
+    etag, last_modified = _release_validators(entry)
+    try:
+        res = appsvc.fetch_app_release(app_release_uuid, etag, last_modified, bulkhead)
+    except AppSvcNotFoundException as e:
+        _cache_app_release_not_found(app_release_uuid, e)
+        raise
+    return _cache_app_release(app_release_uuid, entry, res)
+
+
+async def _app_release_entry_async(app_release_uuid: str) -> CacheEntry:
+    entry = release_cache.get(app_release_uuid)
+    if entry and entry.is_fresh():
+        return _cached_app_release(app_release_uuid, entry)
+    etag, last_modified = _release_validators(entry)
+    try:
+        res = await appsvc_async.fetch_app_release(app_release_uuid, etag, last_modified)
+    except AppSvcNotFoundException as e:
+        _cache_app_release_not_found(app_release_uuid, e)
+        raise
+    return _cache_app_release(app_release_uuid, entry, res)
+
+
+@tracing.traced
+def get_app_releases(app_release_uuids: list[str]) -> dict:
+    """Releases by uuid, and the errors of those which couldn't be fetched (see GetAppReleasesResponseDTO)."""
+    res: dict = {"apps": {}, "errors": {}}
+    misses = []
+    for app_release_uuid in dict.fromkeys(app_release_uuids):
+        entry = release_cache.get(app_release_uuid)
+        if entry and entry.is_fresh():
+            _set_app_releases_item(res, app_release_uuid, partial(_cached_app_release_body, app_release_uuid, entry))
+        else:
+            misses.append(app_release_uuid)
+    # cache misses are fetched in parallel
+    executor = get_executor("app_release_batch", APP_RELEASE_BATCH_WORKERS)
+    futures = {
+        app_release_uuid: executor.submit(
+            tracing.bind(get_app_release), app_release_uuid, appsvc.APP_RELEASE_BATCH_BULKHEAD
+        )
+        for app_release_uuid in misses
+    }
+    for app_release_uuid, future in futures.items():
+        _set_app_releases_item(res, app_release_uuid, future.result)
+    return res
+
+
+def _set_app_releases_item(res: dict, app_release_uuid: str, get: t.Callable[[], GetAppReleaseResponseDTO]) -> None:
+    try:
+        res["apps"][app_release_uuid] = get()
+    except BizException as e:
+        res["errors"][app_release_uuid] = {"code": e.code, "message": e.message}
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        log.exception(e)
+        res["errors"][app_release_uuid] = {"code": ERROR_UNKNOWN[0], "message": ERROR_UNKNOWN[1]}
+
+
+def _cached_app_release(app_release_uuid: str, entry: CacheEntry) -> CacheEntry:
+    if entry.value is None:
+        raise AppSvcNotFoundException(entry.meta["error"])
+    # only releases found count as used prefetches
+    release_prefetcher.record_hit(app_release_uuid)
+    return entry
+
+
+def _cached_app_release_body(app_release_uuid: str, entry: CacheEntry) -> GetAppReleaseResponseDTO:
+    return _cached_app_release(app_release_uuid, entry).value
+
+
+def _prefetch_app_release(app_release_uuid: str) -> GetAppReleaseResponseDTO:
+    return get_app_release(app_release_uuid, appsvc.APP_RELEASE_BATCH_BULKHEAD)
+
+
+def _is_release_cached(app_release_uuid: str) -> bool:
+    entry = release_cache.get(app_release_uuid, record=False)
+    return entry is not None and entry.is_fresh()
+
+
+def _release_validators(entry: t.Optional[CacheEntry]) -> tuple[t.Optional[str], t.Optional[str]]:
+    # expired (but not negative) entries are revalidated upstream using their validators
+    if entry is None or entry.value is None:
+        return None, None
+    return entry.etag, entry.last_modified
+
+
+def _cache_app_release_not_found(app_release_uuid: str, e: AppSvcNotFoundException) -> None:
+    # bots probing random uuids are answered locally for a while
+    release_cache.put(app_release_uuid, None, len(e.message or ""), APP_RELEASE_CACHE_NEGATIVE_TTL, error=e.message)
+
+
+def _cache_app_release(app_release_uuid: str, entry: t.Optional[CacheEntry], res: appsvc.AppsvcResponse) -> CacheEntry:
+    # res may be shared with concurrent callers (see appsvc.single_flight), it is never mutated
+    if res.not_modified and entry is not None:
+        release_cache.counters.inc("revalidated")
+        body, size, meta = entry.value, entry.size, entry.meta
+    else:
+        acl_index.add_release_details(res.body)
+        # the reply of GET /api/apps/<uuid> is encoded once, If-None-Match hits then cost a lookup
+        data = dumps(codec(GetAppReleaseResponseDTO).dump(res.body))
+        body, size, meta = res.body, res.size + len(data), {"json": data, "json_etag": compression.etag(data)}
+    return release_cache.put(app_release_uuid, body, size, APP_RELEASE_CACHE_TTL, res.etag, res.last_modified, **meta)
+
+
+def is_kids_mode() -> bool:
+    if isinstance(current_user, AnonymousUserMixin):
+        return False
     now_date = datetime.datetime.now().date()
-    kids_mode = False
-    if not isinstance(current_user, AnonymousUserMixin):
-        kids_mode = relativedelta(now_date, current_user.dob).years < 10
+    return relativedelta(now_date, current_user.dob).years < 10
+
+
+@tracing.traced
+def search_apps(req: SearchAppsRequestDTO) -> SearchAppsResponseDTO:
+    return fetch_search_apps(req, is_kids_mode()).body
+
+
+@tracing.traced
+def search_apps_passthrough(req: SearchAppsRequestDTO) -> t.Union[bytes, dict]:
+    return search_apps_page(req, fetch_search_apps(req, is_kids_mode()))
+
+
+def search_apps_page(req: SearchAppsRequestDTO, res: appsvc.AppsvcResponse) -> t.Union[bytes, dict]:
+    """Search reply for clients, with its next_cursor (see SearchAppsPageResponseDTO).
+
+    appsvc reply bytes when they can be sent to clients as they are (see appsvc.passthrough), the reply otherwise.
+    Passed through replies aren't decoded whole: the cursor and the apps to prefetch are read from their bytes.
+    """
+    raw = appsvc.passthrough(res, SearchAppsResponseDTO)
+    if raw is not None:
+        try:
+            next_cursor = _next_search_cursor(req, raw.count(_SEARCH_APP_ID_KEY), lambda: _last_json_array_item(raw))
+        except ValueError:
+            log.warning("search reply not shaped as expected, decoding it")
+        else:
+            _prefetch_search_apps(json.loads(m.group(1)) for m in _SEARCH_APP_ID.finditer(raw))
+            # appsvc replies are JSON objects: the key is appended rather than decoding and re-encoding the whole reply
+            head = raw.rstrip()[:-1].rstrip()
+            sep = b"" if head.endswith(b"{") else b","
+            return head + sep + b'"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+    apps = res.body.get("apps") or []
+    _prefetch_search_apps(app["id"] for app in apps)
+    return {**res.body, "next_cursor": _next_search_cursor(req, len(apps), lambda: apps[-1])}
+
+
+def _prefetch_search_apps(app_release_uuids: t.Iterator[str]) -> None:
+    # clicks on the first apps of the page then find their details cached
+    release_prefetcher.prefetch(app_release_uuids, _is_release_cached, _prefetch_app_release)
+
+
+def _next_search_cursor(req: SearchAppsRequestDTO, count: int, last_app: t.Callable[[], dict]) -> t.Optional[str]:
+    """Cursor of the page after count apps, none on the last page or when appsvc doesn't send the order_by values."""
+    if not count or count < req.limit or req.order_by is None:
+        return None
+    # items carry the order_by values under the same names
+    last = last_app()
+    if last.get(req.order_by) is None:
+        return None
+    return cursor.encode([req.order_by, last[req.order_by], last["id"]])
+
+
+# search items have a single "id" key, which JSON strings can't hold unescaped: it's counted to count them
+_SEARCH_APP_ID_KEY = b'"id":'
+_SEARCH_APP_ID = re.compile(rb'"id":\s*("(?:[^"\\]|\\.)*")')
+_QUOTE, _BACKSLASH, _OPEN, _CLOSE = b'"\\{}'
 
-    return appsvc.search_apps(
-        SearchAppsRequestOutDTO(
+
+def _last_json_array_item(raw: bytes) -> dict:
+    """Last object of the array ending the JSON object raw (e.g. {"apps": [..., {...}]}), decoded alone.
+
+    The array is scanned from its end, skipping strings, up to the brace opening that object.
+    """
+    head = raw.rstrip()
+    for closing in (b"}", b"]", b"}"):
+        if not head.endswith(closing):
+            raise ValueError(f"JSON doesn't end with an object in an array: {raw[-32:]!r}")
+        end = len(head) - 1
+        head = head[:-1].rstrip()
+    head = raw[: end + 1]
+    depth, i = 0, end
+    while i >= 0:
+        c = head[i]
+        if c == _QUOTE:
+            i = _json_string_start(head, i)
+        elif c == _CLOSE:
+            depth += 1
+        elif c == _OPEN:
+            depth -= 1
+            if depth == 0:
+                return json.loads(head[i:])
+        i -= 1
+    raise ValueError("unbalanced JSON object")
+
+
+def _json_string_start(raw: bytes, end: int) -> int:
+    """Position of the quote opening the JSON string closed by the one at end."""
+    i = end
+    while True:
+        i = raw.rfind(b'"', 0, i)
+        if i < 0:
+            raise ValueError("unterminated JSON string")
+        # quotes preceded by an odd number of backslashes are escaped
+        j = i
+        while j > 0 and raw[j - 1] == _BACKSLASH:
+            j -= 1
+        if (i - j) % 2 == 0:
+            return i
+
+
+def stream_search_apps(req: SearchAppsRequestDTO) -> t.Generator[list[dict], None, None]:
+    """Apps of a search, a list of them at a time, as they come in from appsvc; callers must close the generator.
+
+    Cache hits are returned at once. Streamed replies aren't cached: they are never held whole. The span lasts until
+    the generator is exhausted or closed.
+    """
+    stream = _stream_search_apps(req, tracing.start_span(f"{__name__}.stream_search_apps"))
+    # appsvc errors are raised here, see appsvc.stream_search_apps
+    next(stream)
+    return stream
+
+
+def _stream_search_apps(req: SearchAppsRequestDTO, span: Span) -> t.Generator[list[dict], None, None]:
+    stream: t.Optional[t.Generator[list[dict], None, None]] = None
+    try:
+        with tracing.use_span(span):
+            out_req = _search_apps_out_req(req, is_kids_mode())
+            _, cached = _cached_search(out_req)
+            if cached is not None:
+                stream = (apps for apps in [cached.body["apps"]])
+            else:
+                stream = appsvc.stream_search_apps(out_req)
+        yield []
+        yield from stream
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR))
+        raise
+    finally:
+        if stream is not None:
+            stream.close()
+        span.end()
+
+
+@tracing.traced
+def fetch_search_apps(req: SearchAppsRequestDTO, kids_mode: bool) -> appsvc.AppsvcResponse:
+    out_req = _search_apps_out_req(req, kids_mode)
+    key, cached = _cached_search(out_req)
+    if cached is not None:
+        return cached
+    return _fetch_search(key, out_req)
+
+
+@tracing.traced
+async def fetch_search_apps_async(req: SearchAppsRequestDTO, kids_mode: bool) -> appsvc.AppsvcResponse:
+    out_req = _search_apps_out_req(req, kids_mode)
+    key, cached = _cached_search(out_req)
+    if cached is not None:
+        return cached
+    res = await appsvc_async.fetch_search_apps(out_req)
+    return _cache_search(key, res)
+
+
+def _search_apps_out_req(req: SearchAppsRequestDTO, kids_mode: bool) -> SearchAppsRequestOutDTO:
+    if not req.cursor:
+        return SearchAppsRequestOutDTO(
             app_name=req.app_name,
             kids_mode=kids_mode,
             offset=req.offset,
             limit=req.limit,
             order_by=req.order_by,
         )
+    # pages start after the last app of the previous one: as fast as the first page, and not shifted by new releases
+    order_by, after_value, after_id = cursor.decode(req.cursor, (SearchAppsOrderBy, lambda v: v, str))
+    if order_by != req.order_by:
+        raise ValidationError({"cursor": ["Cursor of another order_by."]})
+    return SearchAppsRequestOutDTO(
+        app_name=req.app_name,
+        kids_mode=kids_mode,
+        limit=req.limit,
+        order_by=req.order_by,
+        after_value=after_value,
+        after_id=after_id,
     )
 
 
-def search_apps_acl(req: SearchAppsAclRequestDTO) -> SearchAppsAclResponseDTO:
-    return appsvc.search_apps_acl(req)
+def _cached_search(req: SearchAppsRequestOutDTO) -> tuple[str, t.Optional[appsvc.AppsvcResponse]]:
+    # kids_mode is part of the key, adult and kids results never mix
+    key = json.dumps(codec(SearchAppsRequestOutDTO).dump(req), sort_keys=True)
+    entry = search_cache.get(key)
+    if entry:
+        if entry.is_fresh():
+            return key, entry.value
+        if time.monotonic() < entry.meta["stale_until"]:
+            _refresh_search_in_background(key, req)
+            return key, entry.value
+    return key, None
+
+
+def _fetch_search(key: str, req: SearchAppsRequestOutDTO) -> appsvc.AppsvcResponse:
+    return _cache_search(key, appsvc.fetch_search_apps(req))
+
+
+def _cache_search(key: str, res: appsvc.AppsvcResponse) -> appsvc.AppsvcResponse:
+    # whole replies are cached, so hits can still be passed through without being decoded
+    search_cache.put(
+        key,
+        res,
+        res.size,
+        SEARCH_CACHE_TTL,
+        stale_until=time.monotonic() + SEARCH_CACHE_TTL + SEARCH_CACHE_STALE_TTL,
+    )
+    return res
+
+
+def _refresh_search_in_background(key: str, req: SearchAppsRequestOutDTO) -> None:
+    with _search_refreshing_lock:
+        if key in _search_refreshing:
+            return
+        _search_refreshing.add(key)
+    search_cache.counters.inc("refreshes")
+    get_executor("search_cache_refresh", SEARCH_CACHE_REFRESH_WORKERS).submit(_refresh_search, key, req)
+
+
+@tracing.traced
+def _refresh_search(key: str, req: SearchAppsRequestOutDTO) -> None:
+    try:
+        _fetch_search(key, req)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # the stale entry keeps being served, the next request past its TTL will retry
+        search_cache.counters.inc("refresh_errors")
+        log.warning("search cache refresh failed: %s", e)
+    finally:
+        with _search_refreshing_lock:
+            _search_refreshing.discard(key)
+
+
+@tracing.traced
+def search_apps_acl(req: SearchAppsAclRequestDTO) -> dict:
+    acl = acl_index.lookup(req)
+    if acl is None:
+        acl = _cached_acl(req)
+    if acl is not None:
+        return {"acl": acl}
+    return _cache_acl(req, appsvc.search_apps_acl(req))
+
+
+@tracing.traced
+async def search_apps_acl_async(req: SearchAppsAclRequestDTO) -> dict:
+    acl = acl_index.lookup(req)
+    if acl is None:
+        acl = _cached_acl(req)
+    if acl is not None:
+        return {"acl": acl}
+    return _cache_acl(req, await appsvc_async.search_apps_acl(req))
+
+
+def _acl_key(req: SearchAppsAclRequestDTO) -> tuple[tuple, str]:
+    """Cache key of req without its term, and its term: app_name, or company_name when looking up companies."""
+    if req.app_name:
+        return (req.kids_mode, "app_name", req.company_name), req.app_name
+    return (req.kids_mode, "company_name", None), req.company_name or ""
+
+
+def _cached_acl(req: SearchAppsAclRequestDTO) -> t.Optional[list[str]]:
+    """ACL of req from the cached reply of its term or, when it was complete, of a prefix of it.
+
+    Typing "pin", "pink", "pinkp" then only sends the first request upstream, provided appsvc replies are (up to
+    ACL_UPSTREAM_LIMIT) names which start with the term, compared as the ACL index does (acl_index.normalize), in an
+    order which doesn't depend on the term: a longer term only ever drops names, so a reply with fewer than
+    ACL_UPSTREAM_LIMIT names holds every match of all the terms it prefixes, in the order appsvc would have sent them.
+    Complete replies are cached a second time under their normalized term, for those lookups.
+    """
+    key, term = _acl_key(req)
+    entry = acl_cache.get((key, term))
+    if entry and entry.is_fresh():
+        return entry.value
+    if _acl_narrowing_off.is_set():
+        return None
+    prefix = normalize(term)
+    for n in range(len(prefix), 0, -1):
+        entry = acl_cache.get((key, "complete", prefix[:n]), record=False)
+        if entry is None or not entry.is_fresh():
+            continue
+        acl_cache.counters.inc("narrowed")
+        return [name for name in entry.value if normalize(name).startswith(prefix)]
+    return None
+
+
+def _cache_acl(req: SearchAppsAclRequestDTO, res: dict) -> dict:
+    key, term = _acl_key(req)
+    acl = res["acl"]
+    size = sum(len(name) for name in acl) + 100
+    acl_cache.put((key, term), acl, size, ACL_CACHE_TTL)
+    if _is_acl_complete(term, acl):
+        acl_cache.put((key, "complete", normalize(term)), acl, size, ACL_CACHE_TTL)
+    return res
+
+
+def _is_acl_complete(term: str, acl: list[str]) -> bool:
+    """Whether acl, the reply of term, is known to hold every match of term (see _cached_acl)."""
+    if ACL_UPSTREAM_LIMIT <= 0 or _acl_narrowing_off.is_set():
+        return False
+    prefix = normalize(term)
+    if len(acl) <= ACL_UPSTREAM_LIMIT and all(normalize(name).startswith(prefix) for name in acl):
+        return len(acl) < ACL_UPSTREAM_LIMIT
+    # appsvc doesn't reply as ACL_UPSTREAM_LIMIT assumes (anymore): replies cached as complete are ignored as well
+    if not _acl_narrowing_off.is_set():
+        _acl_narrowing_off.set()
+        acl_cache.counters.inc("narrowing_off")
+        log.warning("ACL reply of %r doesn't match ACL_UPSTREAM_LIMIT=%s, narrowing disabled", term, ACL_UPSTREAM_LIMIT)
+    return False
+
+
+@tracing.traced
+def search_as_you_type(req: SearchAsYouTypeRequestDTO, kids_mode: bool) -> dict:
+    """ACL and first search page of a prefix, fetched concurrently (see SearchAsYouTypeResponseDTO).
+
+    A side which failed or is still running past its timeout is reported in errors, the other one is returned anyway.
+    Calls past their timeout keep running in the background and fill the caches for the next keystrokes.
+    """
+    acl_req, search_req = _search_as_you_type_reqs(req, kids_mode)
+    search_as_you_type_stats.inc("calls")
+    started = time.monotonic()
+    executor = get_executor("search_as_you_type", SEARCH_AS_YOU_TYPE_WORKERS)
+    acl = executor.submit(tracing.bind(search_apps_acl), acl_req)
+    search = executor.submit(tracing.bind(fetch_search_apps), search_req, kids_mode)
+    return _search_as_you_type_res(
+        search_req,
+        lambda: _result_by(acl, started + SEARCH_AS_YOU_TYPE_ACL_TIMEOUT),
+        lambda: _result_by(search, started + SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT),
+    )
+
+
+@tracing.traced
+async def search_as_you_type_async(req: SearchAsYouTypeRequestDTO, kids_mode: bool) -> dict:
+    acl_req, search_req = _search_as_you_type_reqs(req, kids_mode)
+    search_as_you_type_stats.inc("calls")
+    acl, search = await asyncio.gather(
+        _within(search_apps_acl_async(acl_req), SEARCH_AS_YOU_TYPE_ACL_TIMEOUT),
+        _within(fetch_search_apps_async(search_req, kids_mode), SEARCH_AS_YOU_TYPE_SEARCH_TIMEOUT),
+        return_exceptions=True,
+    )
+    return _search_as_you_type_res(search_req, lambda: _result(acl), lambda: _result(search))
+
+
+def _search_as_you_type_reqs(
+    req: SearchAsYouTypeRequestDTO, kids_mode: bool
+) -> tuple[SearchAppsAclRequestDTO, SearchAppsRequestDTO]:
+    # kids_mode is resolved once by the caller: pool threads and tasks have no request context
+    return (
+        SearchAppsAclRequestDTO(app_name=req.app_name, kids_mode=kids_mode),
+        SearchAppsRequestDTO(app_name=req.app_name, limit=req.limit, order_by=req.order_by),
+    )
+
+
+def _result_by(future: Future, deadline: float) -> t.Any:
+    try:
+        return future.result(max(0, deadline - time.monotonic()))
+    except TimeoutError:
+        # a call still queued behind busy workers is dropped, one already running fills the caches
+        future.cancel()
+        raise
+
+
+async def _within(coro: t.Awaitable[T], timeout: float) -> T:
+    # shielded: a call past its timeout isn't cancelled, its reply still ends up in the caches
+    task = asyncio.ensure_future(coro)
+    # errors of calls nobody waits for anymore are expected, they are retrieved so asyncio doesn't log them
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+
+def _result(value: t.Union[T, BaseException]) -> T:
+    if isinstance(value, BaseException):
+        raise value
+    return value
+
+
+def _search_as_you_type_res(
+    search_req: SearchAppsRequestDTO,
+    get_acl: t.Callable[[], dict],
+    get_search: t.Callable[[], appsvc.AppsvcResponse],
+) -> dict:
+    res: dict = {"acl": None, "apps": None, "next_cursor": None, "errors": {}}
+    acl = _search_as_you_type_side(res, "acl", get_acl)
+    if acl is not None:
+        res["acl"] = acl["acl"]
+    search = _search_as_you_type_side(res, "search", get_search)
+    if search is not None:
+        res["apps"] = search.body["apps"]
+        apps = res["apps"] or []
+        res["next_cursor"] = _next_search_cursor(search_req, len(apps), lambda: apps[-1])
+    return res
+
+
+def _search_as_you_type_side(res: dict, side: str, get: t.Callable[[], t.Any]) -> t.Any:
+    try:
+        return get()
+    except TimeoutError:
+        search_as_you_type_stats.inc(f"{side}_timeouts")
+        res["errors"][side] = {"code": ERROR_APPSVC[0], "message": f"{ERROR_APPSVC[1]}: {side} timed out"}
+    except BizException as e:
+        search_as_you_type_stats.inc(f"{side}_errors")
+        res["errors"][side] = {"code": e.code, "message": e.message}
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        search_as_you_type_stats.inc(f"{side}_errors")
+        log.exception(e)
+        res["errors"][side] = {"code": ERROR_UNKNOWN[0], "message": ERROR_UNKNOWN[1]}
+    return None
@@ -0,0 +1,105 @@
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from dataclasses import (
+    dataclass,
+    field,
+)
+
+from yagsvc.biz import (
+    stats,
+    tracing,
+)
+
+
+@dataclass
+class CacheEntry:
+    value: t.Any
+    size: int
+    expires_at: float
+    etag: t.Optional[str] = None
+    last_modified: t.Optional[str] = None
+    meta: dict = field(default_factory=dict)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class TTLCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction bounded by entry count and total size.
+
+    Expired entries are not dropped on lookup: they are still returned (counted as stale) so that callers can
+    revalidate them upstream using the stored validators. Only LRU pressure evicts entries.
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.counters = stats.Counters(name, ["hits", "misses", "stale", "evictions"])
+        self._entries: OrderedDict[t.Hashable, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        stats.register(name, self.get_stats)
+
+    def get(self, key: t.Hashable, record: bool = True) -> t.Optional[CacheEntry]:
+        """Entry of key, if any; record=False for probes, which aren't counted as hits or misses."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if record:
+                    self.counters.inc("misses")
+                    tracing.set_attribute(f"yagsvc.{self.name}", "miss")
+                return None
+            self._entries.move_to_end(key)
+        if not record:
+            return entry
+        outcome = "hits" if entry.is_fresh() else "stale"
+        self.counters.inc(outcome)
+        tracing.set_attribute(f"yagsvc.{self.name}", "hit" if outcome == "hits" else "stale")
+        return entry
+
+    def put(
+        self,
+        key: t.Hashable,
+        value: t.Any,
+        size: int,
+        ttl: float,
+        etag: t.Optional[str] = None,
+        last_modified: t.Optional[str] = None,
+        **meta: t.Any,
+    ) -> CacheEntry:
+        entry = CacheEntry(value, size, time.monotonic() + ttl, etag, last_modified, meta)
+        if size > self.max_bytes:
+            # never cached, but callers still get a usable entry
+            return entry
+        with self._lock:
+            prev = self._entries.pop(key, None)
+            if prev is not None:
+                self._bytes -= prev.size
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.counters.inc("evictions")
+        return entry
+
+    def invalidate(self, key: t.Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        with self._lock:
+            res["entries"] = len(self._entries)
+            res["bytes"] = self._bytes
+        return res
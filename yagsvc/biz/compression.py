@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import typing as t
+from functools import lru_cache
+
+import brotli
+from flask import (
+    Flask,
+    Response,
+    request,
+    send_from_directory,
+)
+from werkzeug.datastructures import (
+    Accept,
+    ETags,
+)
+from werkzeug.security import safe_join
+
+from yagsvc.biz import stats
+
+# smaller bodies don't fit in fewer TCP segments once compressed, it's not worth the CPU
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+# only applied to versioned (?v=<digest>) static URLs, see static_url_defaults
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+
+# precompressed variants are generated at build time by scripts/precompress_static.py
+STATIC_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+counters = stats.Counters("compression", ["responses", "bytes_in", "bytes_out"])
+stats.register("compression", counters.snapshot)
+
+
+def choose_encoding(accept_encodings: Accept) -> t.Optional[str]:
+    br, gz = accept_encodings["br"], accept_encodings["gzip"]
+    if br and br >= gz:
+        return "br"
+    if gz:
+        return "gzip"
+    return None
+
+
+def negotiate(accept_encodings: Accept, size: int) -> t.Optional[str]:
+    if size < COMPRESSION_MIN_SIZE:
+        return None
+    return choose_encoding(accept_encodings)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        res = brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY)
+    else:
+        res = gzip.compress(data, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+    counters.inc("responses")
+    counters.inc("bytes_in", len(data))
+    counters.inc("bytes_out", len(res))
+    return res
+
+
+def etag(data: bytes) -> str:
+    return hashlib.sha1(data, usedforsecurity=False).hexdigest()
+
+
+def encoded_etag(etag: str, encoding: t.Optional[str]) -> str:
+    # strong validators must differ between representations of different encodings
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def etag_matches(if_none_match: ETags, etag: str) -> bool:
+    # clients send back the validator of the representation they got, whatever its encoding
+    return any(if_none_match.contains(encoded_etag(etag, e)) for e in (None, *STATIC_SUFFIXES))
+
+
+def compress_response(res: Response) -> Response:
+    if (
+        res.status_code != 200
+        or res.mimetype != "application/json"
+        or res.direct_passthrough
+        or res.is_streamed
+        or "Content-Encoding" in res.headers
+    ):
+        return res
+    res.vary.add("Accept-Encoding")
+    data = res.get_data()
+    encoding = negotiate(request.accept_encodings, len(data))
+    if encoding is None:
+        return res
+    res.set_data(compress(data, encoding))
+    res.headers["Content-Encoding"] = encoding
+    etag, weak = res.get_etag()
+    if etag:
+        res.set_etag(encoded_etag(etag, encoding), weak)
+    return res
+
+
+@lru_cache(maxsize=None)
+def static_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(), usedforsecurity=False).hexdigest()[:12]
+
+
+def init_app(app: Flask) -> None:
+    """Compresses JSON responses and serves precompressed, versioned static files."""
+
+    app.after_request(compress_response)
+
+    @app.url_defaults
+    def static_url_defaults(endpoint: str, values: dict) -> None:
+        # content-addressed URLs may be cached forever
+        if endpoint == "static" and "filename" in values:
+            path = safe_join(app.static_folder, values["filename"])
+            if path and os.path.isfile(path):
+                values["v"] = static_digest(path)
+
+    def send_static_file(filename: str) -> Response:
+        encoding = choose_encoding(request.accept_encodings)
+        variant = filename + STATIC_SUFFIXES[encoding] if encoding else None
+        variant_path = safe_join(app.static_folder, variant) if variant else None
+        if variant_path and os.path.isfile(variant_path):
+            res = send_from_directory(app.static_folder, variant, mimetype=mimetypes.guess_type(filename)[0])
+            res.headers["Content-Encoding"] = encoding
+        else:
+            res = app.send_static_file(filename)
+        res.vary.add("Accept-Encoding")
+        if request.args.get("v"):
+            res.cache_control.no_cache = None
+            res.cache_control.public = True
+            res.cache_control.max_age = STATIC_MAX_AGE
+            res.cache_control.immutable = True
+        return res
+
+    app.view_functions["static"] = send_static_file
@@ -0,0 +1,25 @@
+import base64
+import binascii
+import json
+import typing as t
+
+from marshmallow import ValidationError
+
+
+def encode(values: t.Sequence[t.Any]) -> str:
+    """Opaque keyset pagination cursor: the sort key of the last item of a page, the next one starts after it."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode(cursor: str, types: t.Sequence[t.Callable[[t.Any], t.Any]]) -> list:
+    """Sort key of a cursor made by encode, each value converted by its type.
+
+    Cursors clients made up are rejected as invalid requests (400).
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [type_(value) for type_, value in zip(types, values)]
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValidationError({"cursor": ["Invalid cursor."]}) from e
@@ -37,6 +37,10 @@ class AppSvcException(BizException):
         super().__init__(code, message)
 
 
+class AppSvcNotFoundException(AppSvcException):
+    """appsvc replied 404, reported to clients exactly like any other appsvc error."""
+
+
 def init_app(app: Flask) -> None:
     """Inits error handlers.
 
@@ -29,4 +29,6 @@ def init_app(app: Flask) -> None:
 
     # talkative modules:
     logging.getLogger("oauth2").setLevel(logging.INFO)
+    logging.getLogger("httpcore").setLevel(logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.INFO)
     # logging.getLogger("sqlalchemy").setLevel(logging.DEBUG)
@@ -0,0 +1,140 @@
+import os
+import time
+import typing as t
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+)
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import (
+    ConnectionPoolEntry,
+    QueuePool,
+)
+
+from yagsvc.sqldb import (
+    DEFAULT_BIND,
+    sqldb,
+)
+
+# set (by runtime/bin/cmd.sh) for workers to share their values through files, see prometheus_client.multiprocess
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# appsvc calls are expected to be faster than the routes calling them
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+http_request_duration = Histogram(
+    "yagsvc_http_request_duration_seconds",
+    "Duration of requests by route.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+appsvc_request_duration = Histogram(
+    "yagsvc_appsvc_request_duration_seconds",
+    "Duration of appsvc calls by endpoint, status is error when no reply was received.",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+db_pool_events = Counter(
+    "yagsvc_db_pool_events",
+    "SQLAlchemy connection pool checkouts and new connections.",
+    ["bind", "event"],
+)
+db_pool_connections = Gauge(
+    "yagsvc_db_pool_connections",
+    "Open and checked out connections of SQLAlchemy connection pools.",
+    ["bind", "state"],
+    multiprocess_mode="livesum",
+)
+db_pool_checkout_wait = Histogram(
+    "yagsvc_db_pool_checkout_wait_seconds",
+    "Time spent getting a connection from SQLAlchemy connection pools, opening one included.",
+    ["bind"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+# every stats.Counters counter (connection pools, caches, breakers...) is exported as well
+events = Counter("yagsvc_events", "Counters of yagsvc components, see /api/misc/stats.", ["component", "event"])
+
+
+def observe_request(method: str, route: str, status: int, duration: float) -> None:
+    http_request_duration.labels(method, route, str(status)).observe(duration)
+
+
+def observe_appsvc(endpoint: str, status: str, duration: float) -> None:
+    appsvc_request_duration.labels(endpoint, status).observe(duration)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool timing checkouts, which wait for a connection once all of them are in use."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.labels(self.logging_name or DEFAULT_BIND).observe(time.perf_counter() - started)
+
+
+def generate() -> bytes:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app: Flask) -> None:
+    """Times blueprint routes and observes DB pools, must come after sqldb.init_app."""
+
+    @app.before_request
+    def start_timer() -> None:
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe(res: Response) -> Response:
+        started = g.pop("metrics_started", None)
+        if started is not None and request.blueprint is not None:
+            # the rule, not the path: app release uuids would make one series per release
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            observe_request(request.method, route, res.status_code, time.perf_counter() - started)
+        return res
+
+    with app.app_context():
+        engines = dict(sqldb.engines)
+    for key, engine in engines.items():
+        _observe_pool(engine, key or DEFAULT_BIND)
+
+
+def _observe_pool(engine: t.Any, bind: str) -> None:
+    checkouts, connects = db_pool_events.labels(bind, "checkout"), db_pool_events.labels(bind, "connect")
+    checked_out, opened = db_pool_connections.labels(bind, "checked_out"), db_pool_connections.labels(bind, "open")
+
+    def on_checkout(*_: t.Any) -> None:
+        checkouts.inc()
+        checked_out.inc()
+
+    def on_connect(*_: t.Any) -> None:
+        connects.inc()
+        opened.inc()
+
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", lambda *_: checked_out.dec())
+    event.listen(engine, "connect", on_connect)
+    event.listen(engine, "close", lambda *_: opened.dec())
+    event.listen(engine, "close_detached", lambda *_: opened.dec())
+
+
+def metrics_response() -> Response:
+    return Response(generate(), content_type=CONTENT_TYPE_LATEST)
@@ -1,8 +1,21 @@
 import logging
+import os
+import threading
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
 
 log = logging.getLogger("yagsvc")
 
+GUNICORN_NUM_THREADS = int(os.environ.get("GUNICORN_NUM_THREADS", "5"))
+# thread pools of a worker (see get_executor), their threads call appsvc along with gunicorn's
+APP_RELEASE_BATCH_WORKERS = int(os.environ.get("APP_RELEASE_BATCH_WORKERS", "8"))
+SEARCH_CACHE_REFRESH_WORKERS = int(os.environ.get("SEARCH_CACHE_REFRESH_WORKERS", "2"))
+SEARCH_AS_YOU_TYPE_WORKERS = int(os.environ.get("SEARCH_AS_YOU_TYPE_WORKERS", "8"))
+RELEASE_PREFETCH_WORKERS = int(os.environ.get("RELEASE_PREFETCH_WORKERS", "2"))
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
 
 @t.no_type_check
 def log_input_output(func):
@@ -20,3 +33,25 @@ def log_input_output(func):
         return result
 
     return wrap
+
+
+def get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    """Returns a named, lazily created thread pool owned by the current worker process."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+
+
+def _drop_executors() -> None:
+    # threads are not inherited by forked children, their pools must be recreated
+    global _executors_lock
+    _executors.clear()
+    _executors_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_drop_executors)
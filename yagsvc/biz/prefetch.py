@@ -0,0 +1,129 @@
+import itertools
+import os
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from yagsvc.biz import stats
+from yagsvc.biz.misc import (
+    RELEASE_PREFETCH_WORKERS,
+    get_executor,
+    log,
+)
+
+RELEASE_PREFETCH_ENABLED = os.environ.get("RELEASE_PREFETCH_ENABLED", "false").lower() == "true"
+# first apps of each search page whose details are fetched ahead of clicks
+RELEASE_PREFETCH_TOP_N = int(os.environ.get("RELEASE_PREFETCH_TOP_N", "3"))
+# prefetches waiting for or running on the pool, the others are dropped
+RELEASE_PREFETCH_MAX_PENDING = int(os.environ.get("RELEASE_PREFETCH_MAX_PENDING", "50"))
+# appsvc calls per second (and burst) spent on prefetching, per worker
+RELEASE_PREFETCH_RATE = float(os.environ.get("RELEASE_PREFETCH_RATE", "5"))
+RELEASE_PREFETCH_BURST = int(os.environ.get("RELEASE_PREFETCH_BURST", "10"))
+# prefetched releases remembered until a client asks for them, to measure how useful prefetching is
+RELEASE_PREFETCH_TRACKED = int(os.environ.get("RELEASE_PREFETCH_TRACKED", "2000"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, at most burst of them saved up."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class ReleasePrefetcher:
+    """Warms the release cache with the details of the first apps of search pages, before clients click them.
+
+    Prefetches run on a small pool of their own, never delaying the search reply, and are bounded by
+    RELEASE_PREFETCH_MAX_PENDING and a token bucket. Releases found in the cache already are skipped. A prefetched
+    release is counted as used the first time a client request is served from its cache entry: used / prefetched is
+    the share of prefetches which saved a client an appsvc call.
+    """
+
+    def __init__(self) -> None:
+        self.bucket = TokenBucket(RELEASE_PREFETCH_RATE, RELEASE_PREFETCH_BURST)
+        self.counters = stats.Counters(
+            "release_prefetch", ["prefetched", "used", "cached", "rate_limited", "dropped", "errors"]
+        )
+        self._pending = 0
+        self._prefetched: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        stats.register("release_prefetch", self.get_stats)
+
+    def prefetch(
+        self, app_release_uuids: t.Iterable[str], is_cached: t.Callable[[str], bool], fetch: t.Callable[[str], t.Any]
+    ) -> None:
+        if not RELEASE_PREFETCH_ENABLED:
+            return
+        for app_release_uuid in itertools.islice(app_release_uuids, RELEASE_PREFETCH_TOP_N):
+            if is_cached(app_release_uuid):
+                self.counters.inc("cached")
+                continue
+            with self._lock:
+                if self._pending >= RELEASE_PREFETCH_MAX_PENDING:
+                    self.counters.inc("dropped")
+                    continue
+                self._pending += 1
+            get_executor("release_prefetch", RELEASE_PREFETCH_WORKERS).submit(
+                self._prefetch, app_release_uuid, is_cached, fetch
+            )
+
+    def _prefetch(
+        self, app_release_uuid: str, is_cached: t.Callable[[str], bool], fetch: t.Callable[[str], t.Any]
+    ) -> None:
+        try:
+            # the release may have been fetched while this one was queued
+            if is_cached(app_release_uuid):
+                self.counters.inc("cached")
+                return
+            # tokens are only spent on appsvc calls
+            if not self.bucket.try_acquire():
+                self.counters.inc("rate_limited")
+                return
+            fetch(app_release_uuid)
+            self.counters.inc("prefetched")
+            with self._lock:
+                self._prefetched[app_release_uuid] = None
+                self._prefetched.move_to_end(app_release_uuid)
+                while len(self._prefetched) > RELEASE_PREFETCH_TRACKED:
+                    self._prefetched.popitem(last=False)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # not found releases are cached (negatively) as well, clients get the same error without calling appsvc
+            self.counters.inc("errors")
+            log.warning("release prefetch of %s failed: %s", app_release_uuid, e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def record_hit(self, app_release_uuid: str) -> None:
+        """To be called when a client request is served a release found in the release cache."""
+        if not RELEASE_PREFETCH_ENABLED:
+            return
+        with self._lock:
+            if app_release_uuid not in self._prefetched:
+                return
+            del self._prefetched[app_release_uuid]
+        self.counters.inc("used")
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["pending"] = self._pending
+        res["usefulness"] = res["used"] / res["prefetched"] if res["prefetched"] else None
+        return res
+
+
+release_prefetcher = ReleasePrefetcher()
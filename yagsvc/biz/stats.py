@@ -0,0 +1,36 @@
+import threading
+import typing as t
+
+from yagsvc.biz import metrics
+
+_collectors: dict[str, t.Callable[[], dict]] = {}
+
+
+class Counters:
+    """Thread-safe set of named monotonic counters owned by a single component, also exported as metrics."""
+
+    def __init__(self, component: str, names: t.Iterable[str]) -> None:
+        self.component = component
+        self._lock = threading.Lock()
+        self._values: dict[str, int] = {name: 0 for name in names}
+        self._exported = {name: metrics.events.labels(component, name) for name in self._values}
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+            exported = self._exported.get(name)
+            if exported is None:
+                exported = self._exported[name] = metrics.events.labels(self.component, name)
+        exported.inc(value)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._values)
+
+
+def register(name: str, collector: t.Callable[[], dict]) -> None:
+    _collectors[name] = collector
+
+
+def collect() -> dict[str, dict]:
+    return {name: collector() for name, collector in _collectors.items()}
@@ -0,0 +1,183 @@
+import contextlib
+import functools
+import inspect
+import os
+import typing as t
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+)
+from opentelemetry import (
+    context,
+    propagate,
+    trace,
+)
+from opentelemetry.trace import (
+    SpanKind,
+    Status,
+    StatusCode,
+)
+from sqlalchemy import event
+
+from yagsvc.sqldb import sqldb
+
+# the TracerProvider (and its head-based sampler) is set up by runtime/conf/gunicorn.config.py in each worker
+OTEL_TRACE_ENABLED = os.environ.get("OTEL_TRACE_ENABLED", "false").lower() == "true"
+
+tracer = trace.get_tracer("yagsvc")
+
+# what span() returns when tracing is disabled: one shared no-op context manager, no allocation per call
+_NO_SPAN = contextlib.nullcontext(trace.INVALID_SPAN)
+
+F = t.TypeVar("F", bound=t.Callable[..., t.Any])
+
+
+def traced(func: F) -> F:
+    """Runs func (sync or async) in a span named after it; returns func as it is when tracing is disabled."""
+    if not OTEL_TRACE_ENABLED:
+        return func
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrap(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            with tracer.start_as_current_span(name):
+                return await func(*args, **kwargs)
+
+        return t.cast(F, async_wrap)
+
+    @functools.wraps(func)
+    def wrap(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        with tracer.start_as_current_span(name):
+            return func(*args, **kwargs)
+
+    return t.cast(F, wrap)
+
+
+def span(
+    name: str, kind: SpanKind = SpanKind.INTERNAL, attributes: t.Optional[dict] = None
+) -> t.ContextManager[trace.Span]:
+    if not OTEL_TRACE_ENABLED:
+        return _NO_SPAN
+    return tracer.start_as_current_span(name, kind=kind, attributes=attributes)
+
+
+def start_span(name: str) -> trace.Span:
+    """A span which isn't made current, ended by the caller: for work outliving the call which starts it (streams)."""
+    if not OTEL_TRACE_ENABLED:
+        return trace.INVALID_SPAN
+    return tracer.start_span(name)
+
+
+def use_span(current: trace.Span) -> t.ContextManager[trace.Span]:
+    """Makes a span of start_span current meanwhile, without ending it nor recording exceptions."""
+    if not OTEL_TRACE_ENABLED:
+        return _NO_SPAN
+    return trace.use_span(current, record_exception=False, set_status_on_exception=False)
+
+
+def set_attribute(key: str, value: t.Any) -> None:
+    """Sets an attribute of the current span, if it's sampled."""
+    if not OTEL_TRACE_ENABLED:
+        return
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.set_attribute(key, value)
+
+
+def inject(headers: dict) -> None:
+    """Adds the trace context (traceparent) to headers of an outgoing request."""
+    if OTEL_TRACE_ENABLED:
+        propagate.inject(headers)
+
+
+def bind(fn: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
+    """fn running in the current trace context, for calls handed to thread pools (contexts don't follow threads)."""
+    if not OTEL_TRACE_ENABLED:
+        return fn
+    ctx = context.get_current()
+
+    @functools.wraps(fn)
+    def wrap(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        token = context.attach(ctx)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            context.detach(token)
+
+    return wrap
+
+
+def server_span(method: str, route: str, headers: t.Callable[[], t.Mapping[str, str]]) -> t.ContextManager[trace.Span]:
+    """Root span of a request, a child of the caller's span when headers carry a trace context."""
+    if not OTEL_TRACE_ENABLED:
+        return _NO_SPAN
+    return tracer.start_as_current_span(
+        f"{method} {route}",
+        context=propagate.extract(headers()),
+        kind=SpanKind.SERVER,
+        attributes={"http.request.method": method, "http.route": route},
+    )
+
+
+def init_app(app: Flask) -> None:
+    """Wraps blueprint routes and SQL queries in spans, must come after sqldb.init_app."""
+    if not OTEL_TRACE_ENABLED:
+        return
+
+    @app.before_request
+    def start_span() -> None:
+        if request.blueprint is None:
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        cm = server_span(request.method, route, lambda: request.headers)
+        cm.__enter__()  # pylint: disable=unnecessary-dunder-call
+        g.trace_span = cm
+
+    @app.after_request
+    def set_status(res: Response) -> Response:
+        if "trace_span" in g:
+            set_attribute("http.response.status_code", res.status_code)
+        return res
+
+    @app.teardown_request
+    def end_span(exc: t.Optional[BaseException]) -> None:
+        cm = g.pop("trace_span", None)
+        if cm is not None:
+            cm.__exit__(type(exc) if exc else None, exc, exc.__traceback__ if exc else None)
+
+    with app.app_context():
+        engines = list(sqldb.engines.values())
+    for engine in engines:
+        _trace_queries(engine)
+
+
+def _trace_queries(engine: t.Any) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_span(conn: t.Any, cursor: t.Any, statement: str, *_: t.Any) -> None:
+        # statements are parametrized, values never end up in spans
+        query_span = tracer.start_span(
+            statement.split(None, 1)[0] if statement else "query",
+            kind=SpanKind.CLIENT,
+            attributes={"db.system": engine.dialect.name, "db.statement": statement},
+        )
+        conn.info.setdefault("trace_spans", []).append(query_span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query_span(conn: t.Any, *_: t.Any) -> None:
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def fail_query_span(ctx: t.Any) -> None:
+        spans = ctx.connection.info.get("trace_spans") if ctx.connection is not None else None
+        if spans:
+            query_span = spans.pop()
+            query_span.record_exception(ctx.original_exception)
+            query_span.set_status(Status(StatusCode.ERROR))
+            query_span.end()
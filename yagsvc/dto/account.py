@@ -1,19 +1,80 @@
 import datetime
+import re
 import typing as t
+from dataclasses import field
+from enum import StrEnum
 
-from marshmallow import Schema
+from marshmallow import (
+    EXCLUDE,
+    Schema,
+    ValidationError,
+    validate,
+    validates_schema,
+)
 from marshmallow_dataclass import dataclass
 
+# operations are nested subqueries of one statement, which SQLAlchemy compiles recursively
+APPS_LIB_OPS_MAX = 50
+LIBRARY_PAGE_MAX_SIZE = 100
+# the key of apps_lib whose items are the library's
+APPS = "apps"
+# accounts.library.app_release_uuid is a VARCHAR(64)
+APP_RELEASE_UUID_MAX_LENGTH = 64
+LIBRARY_ITEM_ERROR = (
+    f"apps items are app release uuids (at most {APP_RELEASE_UUID_MAX_LENGTH} characters) or objects with one as "
+    "app_release_uuid"
+)
+LIBRARY_ERROR = f"apps must be a list of items of distinct app releases: {LIBRARY_ITEM_ERROR}"
+
+
+def json_pointer(pointer: str) -> list[str]:
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer.split("/")[1:]]
+
+
+def is_app_release_uuid(value: t.Any) -> bool:
+    return isinstance(value, str) and 0 < len(value) <= APP_RELEASE_UUID_MAX_LENGTH
+
+
+def is_library_item(value: t.Any) -> bool:
+    """Items of apps_lib's apps list are app release uuids, or objects with an app_release_uuid key and metadata."""
+    return is_app_release_uuid(value) or (
+        isinstance(value, dict) and is_app_release_uuid(value.get("app_release_uuid"))
+    )
+
+
+def is_library(value: t.Any) -> bool:
+    """A list of items of distinct app releases: each of them is a library row."""
+    if not isinstance(value, list) or not all(is_library_item(item) for item in value):
+        return False
+    app_release_uuids = {item if isinstance(item, str) else item["app_release_uuid"] for item in value}
+    return len(app_release_uuids) == len(value)
+
+
+def validate_apps_lib_items(apps_lib: t.Optional[dict]) -> None:
+    if apps_lib and apps_lib.get(APPS) is not None and not is_library(apps_lib[APPS]):
+        raise ValidationError(LIBRARY_ERROR)
+
 
 @dataclass
 class UserDC:
     email: t.Optional[str]
     name: t.Optional[str]
     tz: str
-    apps_lib: t.Optional[dict]
+    apps_lib: t.Optional[dict] = field(metadata={"validate": validate_apps_lib_items})
     dob: datetime.date
 
 
+@dataclass
+class GetUserRequestDTO:
+    # apps_lib costs as much as the library is big, clients reading it from /api/accounts/library leave it out
+    exclude: t.Optional[str] = field(default=None, metadata={"validate": validate.OneOf(["apps_lib"])})
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+    class Meta:
+        # query strings may have other parameters, e.g. cache busters
+        unknown = EXCLUDE
+
+
 @dataclass
 class GetUserResponseDTO(UserDC):
     Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
@@ -22,3 +83,122 @@ class GetUserResponseDTO(UserDC):
 @dataclass
 class UpdateUserRequestDTO(UserDC):
     Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+class AppsLibOp(StrEnum):
+    ADD = "add"
+    REMOVE = "remove"
+    MOVE = "move"
+    REPLACE = "replace"
+
+
+@dataclass
+class AppsLibOpDTO:
+    """A JSON Patch (RFC 6902) operation on apps_lib, paths are JSON pointers (e.g. /apps/-, /apps/3)."""
+
+    op: AppsLibOp = field(metadata={"by_value": True})
+    path: str = field(metadata={"validate": validate.Regexp(r"^(/[^/]*)+$")})
+    from_path: t.Optional[str] = field(
+        default=None, metadata={"data_key": "from", "validate": validate.Regexp(r"^(/[^/]*)+$")}
+    )
+    value: t.Any = None
+
+    @validates_schema
+    def validate_from_path(self, data: dict, **_: t.Any) -> None:
+        if (data["op"] == AppsLibOp.MOVE) != (data.get("from_path") is not None):
+            raise ValidationError("from is required by move operations, and only by them", "from")
+
+    @validates_schema
+    def validate_library_path(self, data: dict, **_: t.Any) -> None:
+        """Items of the apps list are library rows: operations on them must keep the list one of items."""
+        path = json_pointer(data["path"])
+        from_path = json_pointer(data["from_path"]) if data.get("from_path") is not None else None
+        if path[0] != APPS:
+            if from_path and from_path[0] == APPS:
+                raise ValidationError("items can only be moved within the apps list", "from")
+            return
+        if len(path) == 1:
+            if from_path is not None:
+                raise ValidationError("the apps list can only be added, replaced or removed as a whole", "path")
+            if data["op"] != AppsLibOp.REMOVE and not is_library(data.get("value")):
+                raise ValidationError(LIBRARY_ERROR, "value")
+            return
+        if not re.fullmatch(r"0|[1-9][0-9]*|-", path[1]):
+            raise ValidationError("apps elements are pointed at by their index, or - after the last one", "path")
+        if len(path) == 2:
+            if from_path is not None and len(from_path) != 2:
+                raise ValidationError("only items can be moved to the apps list", "from")
+            if data["op"] in (AppsLibOp.ADD, AppsLibOp.REPLACE) and not is_library_item(data.get("value")):
+                raise ValidationError(LIBRARY_ITEM_ERROR, "value")
+            return
+        # metadata of an item
+        if path[2] == "app_release_uuid":
+            raise ValidationError("the app release of an item can only be replaced with the whole item", "path")
+        if from_path is not None and from_path[:2] != path[:2]:
+            raise ValidationError("metadata can only be moved within the same item", "from")
+
+
+@dataclass
+class PatchUserRequestDTO:
+    """Fields missing from the request are left as they are, apps_lib_ops are applied to the stored apps_lib."""
+
+    email: t.Optional[str] = None
+    name: t.Optional[str] = None
+    tz: t.Optional[str] = field(default=None, metadata={"allow_none": False})
+    apps_lib: t.Optional[dict] = field(default=None, metadata={"validate": validate_apps_lib_items})
+    dob: t.Optional[datetime.date] = field(default=None, metadata={"allow_none": False})
+    apps_lib_ops: t.Optional[list[AppsLibOpDTO]] = field(
+        default=None, metadata={"validate": validate.Length(max=APPS_LIB_OPS_MAX)}
+    )
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+    @validates_schema
+    def validate_apps_lib(self, data: dict, **_: t.Any) -> None:
+        if data.get("apps_lib") is not None and data.get("apps_lib_ops"):
+            raise ValidationError("apps_lib and apps_lib_ops are mutually exclusive", "apps_lib_ops")
+
+
+@dataclass
+class GetLibraryRequestDTO:
+    limit: int = field(default=50, metadata={"validate": validate.Range(min=1, max=LIBRARY_PAGE_MAX_SIZE)})
+    # next_cursor of the previous page, none for the first one
+    cursor: t.Optional[str] = None
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+    class Meta:
+        unknown = EXCLUDE
+
+
+@dataclass
+class LibraryItemDC:
+    app_release_uuid: str
+    added_ts: datetime.datetime
+    metadata: t.Optional[dict] = None
+
+
+@dataclass
+class GetLibraryResponseDTO:
+    """Library items, most recently added first; next_cursor is none on the last page."""
+
+    items: list[LibraryItemDC]
+    next_cursor: t.Optional[str] = None
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class LibraryItemPathDTO:
+    """The path parameter of /api/accounts/library/<app_release_uuid>."""
+
+    app_release_uuid: str = field(metadata={"validate": validate.Length(min=1, max=APP_RELEASE_UUID_MAX_LENGTH)})
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class PutLibraryItemRequestDTO:
+    metadata: t.Optional[dict] = None
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class PutLibraryItemResponseDTO(LibraryItemDC):
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
@@ -7,7 +7,14 @@ from marshmallow import (
 )
 from marshmallow_dataclass import dataclass
 
-from yagsvc.services.dto.appsvc import SearchAppsOrderBy
+from yagsvc.services.dto.appsvc import (
+    GetAppReleaseResponseDTO,
+    SearchAppsOrderBy,
+    SearchAppsResponseDTO,
+    SearchAppsResponseItem,
+)
+
+APP_RELEASES_BATCH_MAX_SIZE = 100
 
 
 @dataclass
@@ -16,4 +23,52 @@ class SearchAppsRequestDTO:
     offset: int = 0
     limit: int = 100
     order_by: t.Optional[SearchAppsOrderBy] = field(default=SearchAppsOrderBy.TS_ADDED, metadata={"by_value": True})
+    # next_cursor of the previous page (same app_name and order_by), offset is ignored when set
+    cursor: t.Optional[str] = None
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class SearchAppsPageResponseDTO(SearchAppsResponseDTO):
+    # none on the last page
+    next_cursor: t.Optional[str] = None
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class SearchAsYouTypeRequestDTO:
+    app_name: str = field(metadata={"validate": validate.Length(min=3)})
+    # size of the first search page
+    limit: int = 20
+    order_by: t.Optional[SearchAppsOrderBy] = field(default=SearchAppsOrderBy.TS_ADDED, metadata={"by_value": True})
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class GetAppReleasesRequestDTO:
+    app_release_uuids: list[str] = field(metadata={"validate": validate.Length(min=1, max=APP_RELEASES_BATCH_MAX_SIZE)})
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class ErrorDC:
+    code: int
+    message: t.Any
+
+
+@dataclass
+class GetAppReleasesResponseDTO:
+    apps: dict[str, GetAppReleaseResponseDTO] = field(default_factory=dict)
+    errors: dict[str, ErrorDC] = field(default_factory=dict)
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
+
+
+@dataclass
+class SearchAsYouTypeResponseDTO:
+    """ACL and first search page of a prefix, a side which failed or timed out is none and has its error in errors."""
+
+    acl: t.Optional[list[str]] = None
+    apps: t.Optional[list[SearchAppsResponseItem]] = None
+    next_cursor: t.Optional[str] = None
+    errors: dict[str, ErrorDC] = field(default_factory=dict)
     Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
@@ -0,0 +1,161 @@
+import inspect
+import json
+import threading
+import types
+import typing as t
+
+from marshmallow import (
+    Schema,
+    fields,
+    missing,
+)
+
+import yagsvc.dto.account
+import yagsvc.dto.app
+import yagsvc.services.dto.appsvc
+
+DTO_MODULES = (yagsvc.dto.account, yagsvc.dto.app, yagsvc.services.dto.appsvc)
+
+Dumper = t.Callable[[t.Any], t.Any]
+FieldDumper = t.Callable[[t.Any, t.Optional[str], t.Any], t.Any]
+
+# values of these types are dumped as they are by their fields
+_IDENTITY_TYPES: dict[t.Type[fields.Field], type] = {
+    fields.String: str,
+    fields.Integer: int,
+    fields.Float: float,
+    fields.Boolean: bool,
+}
+
+
+class DTO(t.Protocol):
+    """Dataclass of the DTO modules, with the Schema marshmallow_dataclass generates for it."""
+
+    Schema: t.ClassVar[t.Type[Schema]]  # pylint: disable=invalid-name
+
+
+class Codec:
+    """Schema of a DTO built once, with a dump path specialized for dicts (e.g. appsvc replies).
+
+    The schema stays the source of truth: loads (and so validation) go through it, dumps of anything but dicts too,
+    and the specialized path falls back to its fields for every value it can't copy as is.
+    """
+
+    def __init__(self, dto: t.Type[DTO]) -> None:
+        self.dto = dto
+        self.schema: Schema = dto.Schema()
+        self._dump = _compile_schema(self.schema)
+
+    def load(self, data: t.Any) -> t.Any:
+        return self.schema.load(data)
+
+    def dump(self, obj: t.Any) -> t.Any:
+        return self._dump(obj)
+
+
+_codecs: dict[t.Type[DTO], Codec] = {}
+_codecs_lock = threading.Lock()
+
+
+def codec(dto: t.Type[DTO]) -> Codec:
+    res = _codecs.get(dto)
+    if res is None:
+        # marshmallow_dataclass builds the Schema classes on first use, which isn't thread-safe
+        with _codecs_lock:
+            res = _codecs.get(dto)
+            if res is None:
+                res = _codecs[dto] = Codec(dto)
+    return res
+
+
+def dumps(data: t.Any) -> bytes:
+    """Dumped data as JSON, byte for byte the body of Flask's jsonify (outside debug mode)."""
+    return (json.dumps(data, separators=(",", ":"), sort_keys=True) + "\n").encode()
+
+
+def precompile(modules: t.Iterable[types.ModuleType] = DTO_MODULES) -> None:
+    """Builds the codecs of all DTOs of modules upfront, so no request pays for it."""
+    for module in modules:
+        for _, obj in inspect.getmembers(module, inspect.isclass):
+            if obj.__module__ == module.__name__ and hasattr(obj, "Schema"):
+                codec(obj)
+
+
+def _compile_schema(schema: Schema) -> Dumper:
+    # pylint: disable=protected-access
+    hooks = _dump_hooks(schema)
+    if hooks - {"omit_none"}:
+        # the dump hooks of the schema are its own, only OmitNone's is done here as well
+        return schema.dump
+    plan = []
+    for attr_name, field in schema.dump_fields.items():
+        attr = field.attribute or attr_name
+        if "." in attr or not field._CHECK_ATTRIBUTE:
+            # dotted attributes and computed fields (Method, Function): nothing to gain
+            return schema.dump
+        omit_none = bool(hooks) and bool(field.metadata.get("omit_none"))
+        plan.append((attr, field.data_key or attr_name, field.dump_default, _compile_field(field), omit_none))
+
+    def dump(obj: t.Any) -> t.Any:
+        if type(obj) is not dict:  # pylint: disable=unidiomatic-typecheck
+            return schema.dump(obj)
+        res: dict = {}
+        for attr, key, default, dump_value, omit_none in plan:
+            value = obj.get(attr, missing)
+            if value is missing:
+                value = default() if callable(default) else default
+                if value is missing:
+                    continue
+            value = dump_value(value, attr, obj)
+            if value is None and omit_none:
+                continue
+            res[key] = value
+        return res
+
+    return dump
+
+
+def _dump_hooks(schema: Schema) -> set[str]:
+    """Names of the pre_dump and post_dump methods of schema.
+
+    marshmallow 3 keys its hooks by (tag, pass_many) and lists their names, marshmallow 4 keys them by tag and lists
+    (name, pass_many, kwargs) tuples.
+    """
+    # pylint: disable=protected-access
+    hooks: dict[t.Any, list[t.Any]] = schema._hooks
+    res: set[str] = set()
+    for key, entries in hooks.items():
+        if (key[0] if isinstance(key, tuple) else key) in ("pre_dump", "post_dump"):
+            res.update(entry[0] if isinstance(entry, tuple) else entry for entry in entries)
+    return res
+
+
+def _compile_field(field: fields.Field) -> FieldDumper:
+    # pylint: disable=protected-access
+    identity_type = _IDENTITY_TYPES.get(type(field))
+    if identity_type is not None and not getattr(field, "as_string", False):
+        return lambda v, attr, obj: (
+            # exact types only: subclasses (e.g. bool for Integer) are serialized by the field
+            v
+            if v is None or type(v) is identity_type  # noqa: E721 pylint: disable=unidiomatic-typecheck
+            else field._serialize(v, attr, obj)
+        )
+    if type(field) is fields.Raw:  # pylint: disable=unidiomatic-typecheck
+        return lambda v, attr, obj: v
+    if isinstance(field, fields.Nested):
+        nested = _compile_schema(field.schema)
+        if field.many or field.schema.many:
+            return lambda v, attr, obj: None if v is None else [nested(i) for i in v]
+        return lambda v, attr, obj: None if v is None else nested(v)
+    if type(field) is fields.List:  # pylint: disable=unidiomatic-typecheck
+        inner = _compile_field(field.inner)
+        return lambda v, attr, obj: None if v is None else [inner(i, attr, obj) for i in v]
+    if type(field) is fields.Dict:  # pylint: disable=unidiomatic-typecheck
+        if field.key_field is None and field.value_field is None:
+            return lambda v, attr, obj: None if v is None else dict(v)
+        key = _compile_field(field.key_field) if field.key_field else lambda k, attr, obj: k
+        value = _compile_field(field.value_field) if field.value_field else lambda v, attr, obj: v
+        return lambda v, attr, obj: (
+            None if v is None else {key(k, None, None): value(i, None, None) for k, i in v.items()}
+        )
+    return field._serialize
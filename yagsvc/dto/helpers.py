@@ -0,0 +1,27 @@
+import typing as t
+
+from marshmallow import (
+    fields,
+    post_dump,
+)
+
+# field metadata of optional fields left out of dumps when they are None (see OmitNone)
+OMIT_NONE = {"metadata": {"omit_none": True}}
+
+
+class OmitNone:
+    """Base of DTOs with OMIT_NONE fields: their None values aren't dumped, e.g. for peers telling null from missing.
+
+    yagsvc.dto.codec leaves them out the same way.
+    """
+
+    # marshmallow_dataclass makes omit_none a hook of the DTO's schema, self is the schema when it runs
+    dump_fields: t.ClassVar[dict[str, fields.Field]]
+
+    @post_dump
+    def omit_none(self, data: dict, **_: t.Any) -> dict:
+        for name, field in self.dump_fields.items():
+            key = field.data_key or name
+            if field.metadata.get("omit_none") and key in data and data[key] is None:
+                del data[key]
+        return data
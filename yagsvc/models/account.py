@@ -3,12 +3,18 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Numeric,
     String,
+    func,
 )
 from sqlalchemy.dialects.postgresql import (
     DATE,
     JSONB,
 )
+from sqlalchemy.orm import deferred
 
 from yagsvc.sqldb import sqldb
 
@@ -20,6 +26,30 @@ class UserDAO(UserMixin, sqldb.Model):
     email = Column(String(256), unique=False)
     name = Column(String(256), unique=False)
     tz = Column(String, nullable=False, server_default="UTC")
-    apps_lib = Column(JSONB)
+    # apps_lib without its apps list, whose items are LibraryItemDAO rows (see biz.account.get_apps_lib); only loaded
+    # when read, users being loaded on every authenticated request
+    apps_lib = deferred(Column(JSONB))
     dob = Column(DATE, nullable=False, server_default="1970-01-01")
     is_active = Column(Boolean, nullable=False, server_default="TRUE")
+
+
+class LibraryItemDAO(sqldb.Model):
+    """An app release of a user's library, see scripts/migrations/001_library.sql."""
+
+    __tablename__ = "library"
+    __table_args__ = (
+        # pages of a library, most recently added first
+        Index("library_user_id_added_ts_idx", "user_id", "added_ts", "app_release_uuid"),
+        # the apps list of apps_lib
+        Index("library_user_id_position_idx", "user_id", "position", "app_release_uuid"),
+        # owners of a release
+        Index("library_app_release_uuid_idx", "app_release_uuid"),
+        {"schema": "accounts"},
+    )
+    user_id = Column(BigInteger, ForeignKey(UserDAO.id, ondelete="CASCADE"), primary_key=True)
+    app_release_uuid = Column(String(64), primary_key=True)
+    added_ts = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # order of the item in the apps list of apps_lib, see biz.account._position_at
+    position = Column(Numeric, nullable=False)
+    # "metadata" is reserved by declarative models
+    meta = Column("metadata", JSONB)
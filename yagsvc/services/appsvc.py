@@ -1,53 +1,559 @@
 import json
 import os
+import random
+import re
+import threading
+import time
+import typing as t
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    wait,
+)
+from dataclasses import dataclass
+from functools import cached_property
+
+import requests
+from opentelemetry.trace import (
+    Span,
+    SpanKind,
+    Status,
+    StatusCode,
+)
+from urllib3.exceptions import EmptyPoolError
 
-from yagsvc.biz.errors import AppSvcException
+from yagsvc.biz import (
+    metrics,
+    stats,
+    tracing,
+)
+from yagsvc.biz.errors import (
+    AppSvcException,
+    AppSvcNotFoundException,
+)
+from yagsvc.biz.misc import (
+    APP_RELEASE_BATCH_WORKERS,
+    GUNICORN_NUM_THREADS,
+    RELEASE_PREFETCH_WORKERS,
+    SEARCH_AS_YOU_TYPE_WORKERS,
+    SEARCH_CACHE_REFRESH_WORKERS,
+    get_executor,
+    log,
+)
+from yagsvc.dto.codec import codec
 from yagsvc.services.dto.appsvc import (
+    SCHEMA_VERSION,
     GetAppReleaseResponseDTO,
     SearchAppsAclRequestDTO,
-    SearchAppsAclResponseDTO,
     SearchAppsRequestOutDTO,
-    SearchAppsResponseDTO,
 )
-from yagsvc.services.helpers import get_requests_session
+from yagsvc.services.helpers import (
+    Bulkhead,
+    CircuitBreaker,
+    LatencyTracker,
+    SingleFlight,
+    get_pooled_session,
+)
 
 REQUESTS_TIMEOUT_CONN_READ = (3, 10)
 APPSVC_URL = os.environ["APPSVC_URL"]
+# an attempt and a hedge for each thread which may fetch releases
+APPSVC_HEDGE_WORKERS = int(
+    os.environ.get(
+        "APPSVC_HEDGE_WORKERS",
+        str(2 * (GUNICORN_NUM_THREADS + APP_RELEASE_BATCH_WORKERS + RELEASE_PREFETCH_WORKERS + 1)),
+    )
+)
+# a connection per call which may run at once: the hedge pool's, and the search and ACL calls of gunicorn's threads,
+# the search as you type and search cache refresh pools and the ACL index refresh
+APPSVC_POOL_MAXSIZE = int(
+    os.environ.get(
+        "APPSVC_POOL_MAXSIZE",
+        str(
+            APPSVC_HEDGE_WORKERS + GUNICORN_NUM_THREADS + SEARCH_AS_YOU_TYPE_WORKERS + SEARCH_CACHE_REFRESH_WORKERS + 1
+        ),
+    )
+)
+# how long a call waits for a connection when they are all in use anyway, it fails afterwards
+APPSVC_POOL_TIMEOUT = float(os.environ.get("APPSVC_POOL_TIMEOUT", "1"))
+APPSVC_TIMEOUTS: dict[str, tuple[float, float]] = {
+    "search_apps": REQUESTS_TIMEOUT_CONN_READ,
+    "search_apps_acl": (3, float(os.environ.get("APPSVC_ACL_TIMEOUT_READ", "3"))),
+    "get_app_release": REQUESTS_TIMEOUT_CONN_READ,
+}
+
+APP_RELEASE_BATCH_BULKHEAD = "get_app_release_batch"
+APP_RELEASE_HEDGE_BULKHEAD = "get_app_release_hedge"
+ACL_INDEX_BULKHEAD = "search_apps_acl_index"
+
+APPSVC_BREAKER_WINDOW = int(os.environ.get("APPSVC_BREAKER_WINDOW", "20"))
+APPSVC_BREAKER_MIN_CALLS = int(os.environ.get("APPSVC_BREAKER_MIN_CALLS", "10"))
+APPSVC_BREAKER_FAILURE_RATE = float(os.environ.get("APPSVC_BREAKER_FAILURE_RATE", "0.5"))
+APPSVC_BREAKER_SLOW_CALL_SECS = float(os.environ.get("APPSVC_BREAKER_SLOW_CALL_SECS", "2"))
+APPSVC_BREAKER_SLOW_CALL_RATE = float(os.environ.get("APPSVC_BREAKER_SLOW_CALL_RATE", "0.8"))
+APPSVC_BREAKER_OPEN_SECS = float(os.environ.get("APPSVC_BREAKER_OPEN_SECS", "10"))
+# search storms can't take all the gunicorn threads, the ones left serve accounts and auth
+APPSVC_BULKHEADS: dict[str, int] = {
+    "search_apps": int(os.environ.get("APPSVC_BULKHEAD_SEARCH", str(max(1, GUNICORN_NUM_THREADS // 2)))),
+    "search_apps_acl": int(os.environ.get("APPSVC_BULKHEAD_ACL", str(max(1, GUNICORN_NUM_THREADS // 2)))),
+    "get_app_release": int(os.environ.get("APPSVC_BULKHEAD_APP_RELEASE", str(GUNICORN_NUM_THREADS))),
+    # release fetches of the batch and prefetch pools and of the ACL index refresh
+    APP_RELEASE_BATCH_BULKHEAD: int(
+        os.environ.get(
+            "APPSVC_BULKHEAD_APP_RELEASE_BATCH", str(APP_RELEASE_BATCH_WORKERS + RELEASE_PREFETCH_WORKERS + 1)
+        )
+    ),
+    # hedges of release fetches, see hedged
+    APP_RELEASE_HEDGE_BULKHEAD: int(
+        os.environ.get(
+            "APPSVC_BULKHEAD_APP_RELEASE_HEDGE",
+            str(GUNICORN_NUM_THREADS + APP_RELEASE_BATCH_WORKERS + RELEASE_PREFETCH_WORKERS + 1),
+        )
+    ),
+    # search pages of the ACL index refresh, read one at a time
+    ACL_INDEX_BULKHEAD: int(os.environ.get("APPSVC_BULKHEAD_ACL_INDEX", "1")),
+}
+# how long a call may wait for a bulkhead slot before failing
+APPSVC_BULKHEAD_MAX_WAIT = float(os.environ.get("APPSVC_BULKHEAD_MAX_WAIT", "0.5"))
+
+# read timeouts are the p99 times the factor, within bounds, once enough latencies are known
+APPSVC_ADAPTIVE_TIMEOUTS = os.environ.get("APPSVC_ADAPTIVE_TIMEOUTS", "true").lower() == "true"
+APPSVC_LATENCY_WINDOW = int(os.environ.get("APPSVC_LATENCY_WINDOW", "500"))
+APPSVC_LATENCY_MIN_SAMPLES = int(os.environ.get("APPSVC_LATENCY_MIN_SAMPLES", "100"))
+APPSVC_TIMEOUT_P99_FACTOR = float(os.environ.get("APPSVC_TIMEOUT_P99_FACTOR", "3"))
+APPSVC_TIMEOUT_MIN_READ = float(os.environ.get("APPSVC_TIMEOUT_MIN_READ", "1"))
+APPSVC_TIMEOUT_MAX_READ = float(os.environ.get("APPSVC_TIMEOUT_MAX_READ", "30"))
+
+# idempotent reads still running past their p95 are sent again, the first reply wins
+APPSVC_HEDGING = os.environ.get("APPSVC_HEDGING", "true").lower() == "true"
+APPSVC_HEDGE_PERCENTILE = float(os.environ.get("APPSVC_HEDGE_PERCENTILE", "95"))
+# at most this share of calls is hedged, whatever the latencies
+APPSVC_HEDGE_BUDGET = float(os.environ.get("APPSVC_HEDGE_BUDGET", "0.1"))
+
+APPSVC_PASSTHROUGH = os.environ.get("APPSVC_PASSTHROUGH", "false").lower() == "true"
+# share of passed through replies which are still decoded and checked against the DTOs
+APPSVC_PASSTHROUGH_VALIDATE_RATE = float(os.environ.get("APPSVC_PASSTHROUGH_VALIDATE_RATE", "0.01"))
+APPSVC_SCHEMA_VERSION_HEADER = os.environ.get("APPSVC_SCHEMA_VERSION_HEADER", "X-Schema-Version")
+
+# streamed search replies are read and decoded by chunks of this size
+APPSVC_STREAM_CHUNK_SIZE = int(os.environ.get("APPSVC_STREAM_CHUNK_SIZE", "8192"))
+# streams hold an appsvc connection while clients read them: they have connections of their own, that many at most
+APPSVC_STREAM_MAX_CONCURRENT = int(
+    os.environ.get("APPSVC_STREAM_MAX_CONCURRENT", str(max(1, GUNICORN_NUM_THREADS // 2)))
+)
+# how long a stream may take to be read whole, slow readers don't keep a connection longer
+APPSVC_STREAM_MAX_SECS = float(os.environ.get("APPSVC_STREAM_MAX_SECS", "30"))
+SEARCH_APPS_ARRAY_START = re.compile(r'"apps"\s*:\s*\[')
+
+
+@dataclass
+class AppsvcResponse:
+    """Raw appsvc reply with its validators, decoded on first access to body; raw is None when appsvc replied 304."""
+
+    raw: t.Optional[bytes]
+    etag: t.Optional[str]
+    last_modified: t.Optional[str]
+    schema_version: t.Optional[str] = None
+
+    @cached_property
+    def body(self) -> t.Any:
+        return json.loads(self.raw) if self.raw is not None else None
+
+    @property
+    def size(self) -> int:
+        return len(self.raw) if self.raw is not None else 0
 
+    @property
+    def not_modified(self) -> bool:
+        return self.raw is None
 
-def search_apps_acl(req: SearchAppsAclRequestDTO) -> SearchAppsAclResponseDTO:
-    s = get_requests_session()
-    res = s.post(
-        url=f"{APPSVC_URL}/apps/search/acl",
-        data=json.dumps(SearchAppsAclRequestDTO.Schema().dump(req)),
-        headers={"Content-Type": "application/json"},
-        timeout=REQUESTS_TIMEOUT_CONN_READ,
+
+class AppsvcClient:
+    """Long-lived appsvc HTTP client, one per gunicorn worker (see get_client)."""
+
+    def __init__(self, base_url: str, pool_maxsize: int) -> None:
+        self.base_url = base_url
+        self.pool_stats = stats.Counters("appsvc_pool", ["checkouts", "new_conns", "waits", "timeouts"])
+        self.session = get_pooled_session(self.pool_stats, pool_maxsize=pool_maxsize, pool_timeout=APPSVC_POOL_TIMEOUT)
+        # streamed replies are read at the pace of clients, their connections never come out of the shared pool
+        self.stream_pool_stats = stats.Counters("appsvc_stream_pool", ["checkouts", "new_conns", "waits", "timeouts"])
+        self.stream_session = get_pooled_session(
+            self.stream_pool_stats, pool_maxsize=APPSVC_STREAM_MAX_CONCURRENT, pool_timeout=APPSVC_POOL_TIMEOUT
+        )
+
+    def get(
+        self, endpoint: str, path: str, headers: t.Optional[dict] = None, bulkhead: t.Optional[str] = None
+    ) -> requests.Response:
+        return self.request(endpoint, "GET", path, headers=headers, bulkhead=bulkhead)
+
+    def post(
+        self, endpoint: str, path: str, data: str, stream: bool = False, bulkhead: t.Optional[str] = None
+    ) -> requests.Response:
+        return self.request(endpoint, "POST", path, data=data, stream=stream, bulkhead=bulkhead)
+
+    def request(
+        self,
+        endpoint: str,
+        method: str,
+        path: str,
+        data: t.Optional[str] = None,
+        headers: t.Optional[dict] = None,
+        stream: bool = False,
+        bulkhead: t.Optional[str] = None,
+    ) -> requests.Response:
+        """Calls appsvc through the endpoint's bulkhead (or the given one) and circuit breaker.
+
+        With stream, only the reply headers are read: the caller reads the body and closes the reply.
+        """
+        with bulkheads[bulkhead or endpoint].enter() as entered:
+            if not entered:
+                raise AppSvcException(f"appsvc {endpoint}: too many concurrent calls")
+            breaker = breakers[endpoint]
+            if not breaker.allow():
+                raise AppSvcException(f"appsvc {endpoint}: circuit open")
+            started, status = time.monotonic(), "error"
+            # None when no call was made
+            failed: t.Optional[bool] = None
+            try:
+                with tracing.span(f"appsvc {endpoint}", SpanKind.CLIENT, span_attributes(endpoint, method)) as span:
+                    headers = {"Content-Type": "application/json", **(headers or {})}
+                    tracing.inject(headers)
+                    try:
+                        res = (self.stream_session if stream else self.session).request(
+                            method,
+                            url=f"{self.base_url}{path}",
+                            data=data,
+                            headers=headers,
+                            timeout=get_timeout(endpoint),
+                            stream=stream,
+                        )
+                    except EmptyPoolError as e:
+                        raise AppSvcException(f"appsvc {endpoint}: no connection available") from e
+                    except Exception:
+                        failed = True
+                        raise
+                    failed, status = res.status_code >= 500, str(res.status_code)
+                    set_span_response(span, res.status_code, -1 if stream else len(res.content))
+                    return res
+            finally:
+                if failed is None:
+                    breaker.release()
+                else:
+                    duration = time.monotonic() - started
+                    breaker.record(failed, duration)
+                    # timeouts and errors would drag the adaptive timeouts up to their maximum
+                    if not failed:
+                        latencies[endpoint].record(duration)
+                    metrics.observe_appsvc(endpoint, status, duration)
+
+    def get_stats(self) -> dict:
+        res: dict = self.pool_stats.snapshot()
+        # a checkout either reuses a kept-alive connection or opens a new one
+        res["hits"] = res["checkouts"] - res["new_conns"]
+        return res
+
+    def close(self) -> None:
+        self.session.close()
+        self.stream_session.close()
+
+
+# shared by both serving modes, see appsvc_async
+breakers = {
+    endpoint: CircuitBreaker(
+        f"appsvc_breaker_{endpoint}",
+        window=APPSVC_BREAKER_WINDOW,
+        min_calls=APPSVC_BREAKER_MIN_CALLS,
+        failure_rate=APPSVC_BREAKER_FAILURE_RATE,
+        slow_call_secs=APPSVC_BREAKER_SLOW_CALL_SECS,
+        slow_call_rate=APPSVC_BREAKER_SLOW_CALL_RATE,
+        open_secs=APPSVC_BREAKER_OPEN_SECS,
     )
+    for endpoint in APPSVC_TIMEOUTS
+}
+bulkheads = {
+    endpoint: Bulkhead(f"appsvc_bulkhead_{endpoint}", max_concurrent, APPSVC_BULKHEAD_MAX_WAIT)
+    for endpoint, max_concurrent in APPSVC_BULKHEADS.items()
+}
+stats.register("appsvc_breakers", lambda: {endpoint: b.get_stats() for endpoint, b in breakers.items()})
+# streams are counted from their first byte to their last, not only until the reply headers
+stream_bulkhead = Bulkhead("appsvc_bulkhead_search_apps_stream", APPSVC_STREAM_MAX_CONCURRENT, APPSVC_BULKHEAD_MAX_WAIT)
+stats.register(
+    "appsvc_bulkheads",
+    lambda: {
+        **{endpoint: b.get_stats() for endpoint, b in bulkheads.items()},
+        "search_apps_stream": stream_bulkhead.get_stats(),
+    },
+)
+latencies = {
+    endpoint: LatencyTracker(APPSVC_LATENCY_WINDOW, APPSVC_LATENCY_MIN_SAMPLES) for endpoint in APPSVC_TIMEOUTS
+}
+stats.register(
+    "appsvc_latencies",
+    lambda: {
+        endpoint: {**tracker.get_stats(), "read_timeout": get_timeout(endpoint)[1]}
+        for endpoint, tracker in latencies.items()
+    },
+)
+hedge_stats = stats.Counters("appsvc_hedging", ["calls", "hedged", "hedge_wins"])
+stats.register("appsvc_hedging", hedge_stats.snapshot)
+# a worker of the hedge pool for each call handed to it
+_hedge_slots = threading.BoundedSemaphore(APPSVC_HEDGE_WORKERS)
+
+
+def span_attributes(endpoint: str, method: str) -> dict:
+    return {"yagsvc.appsvc.endpoint": endpoint, "http.request.method": method}
+
+
+def set_span_response(span: Span, status_code: int, size: int) -> None:
+    if span.is_recording():
+        span.set_attribute("http.response.status_code", status_code)
+        span.set_attribute("http.response.body.size", size)
+        if status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR))
+
+
+def get_timeout(endpoint: str) -> tuple[float, float]:
+    conn, read = APPSVC_TIMEOUTS[endpoint]
+    p99 = latencies[endpoint].percentile(99) if APPSVC_ADAPTIVE_TIMEOUTS else None
+    if p99 is None:
+        return conn, read
+    return conn, min(max(p99 * APPSVC_TIMEOUT_P99_FACTOR, APPSVC_TIMEOUT_MIN_READ), APPSVC_TIMEOUT_MAX_READ)
+
+
+def get_hedge_delay(endpoint: str) -> t.Optional[float]:
+    """How long to wait for a reply before hedging, None when the call must not be hedged."""
+    if not APPSVC_HEDGING:
+        return None
+    return latencies[endpoint].percentile(APPSVC_HEDGE_PERCENTILE)
+
+
+def within_hedge_budget() -> bool:
+    counters = hedge_stats.snapshot()
+    return counters["hedged"] < counters["calls"] * APPSVC_HEDGE_BUDGET
+
+
+def _in_hedge_slot(slots: threading.BoundedSemaphore, fn: t.Callable[[], t.Any]) -> t.Callable[[], t.Any]:
+    def call() -> t.Any:
+        try:
+            return fn()
+        finally:
+            slots.release()
+
+    return tracing.bind(call)
+
+
+def hedged(endpoint: str, fn: t.Callable[[], t.Any], hedge_fn: t.Optional[t.Callable[[], t.Any]] = None) -> t.Any:
+    """Calls fn, and hedge_fn (fn by default) past the hedge delay: the first success wins. Idempotent calls only."""
+    delay = get_hedge_delay(endpoint)
+    slots = _hedge_slots
+    if delay is None or not slots.acquire(blocking=False):
+        return fn()
+    hedge_stats.inc("calls")
+    executor = get_executor("appsvc_hedge", APPSVC_HEDGE_WORKERS)
+    first = executor.submit(_in_hedge_slot(slots, fn))
+    done, _ = wait([first], timeout=delay)
+    if done or not within_hedge_budget() or not slots.acquire(blocking=False):
+        return first.result()
+    hedge_stats.inc("hedged")
+    pending: set[Future] = {first, executor.submit(_in_hedge_slot(slots, hedge_fn or fn))}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [future for future in done if future.exception() is None]
+        if succeeded:
+            if first not in succeeded:
+                hedge_stats.inc("hedge_wins")
+            return succeeded[0].result()
+        if not pending:
+            # both failed
+            return first.result()
+
+
+_client: t.Optional[AppsvcClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AppsvcClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AppsvcClient(APPSVC_URL, APPSVC_POOL_MAXSIZE)
+    return _client
+
+
+def _drop_client() -> None:
+    # sockets inherited from the parent must never be shared with it, the child opens its own on first use
+    global _client, _client_lock, _hedge_slots
+    _client = None
+    _client_lock = threading.Lock()
+    # as the hedge pool, the calls holding slots don't run in the child
+    _hedge_slots = threading.BoundedSemaphore(APPSVC_HEDGE_WORKERS)
+
+
+os.register_at_fork(after_in_child=_drop_client)
+stats.register("appsvc_pool", lambda: get_client().get_stats())
+
+# identical in-flight calls from the threads of a worker share one upstream request
+single_flight = SingleFlight("appsvc_single_flight")
+stats.register("appsvc_single_flight", single_flight.get_stats)
+
+passthrough_stats = stats.Counters("appsvc_passthrough", ["passed", "skipped", "validated", "validation_failures"])
+stats.register("appsvc_passthrough", passthrough_stats.snapshot)
+
+
+def search_apps_acl(req: SearchAppsAclRequestDTO) -> dict:
+    data = json.dumps(codec(SearchAppsAclRequestDTO).dump(req), sort_keys=True)
+    return single_flight.do(f"search_apps_acl:{data}", lambda: _search_apps_acl(data), "search_apps_acl")
+
+
+def _search_apps_acl(data: str) -> dict:
+    res = get_client().post("search_apps_acl", "/apps/search/acl", data)
     if res.status_code != 200:
         raise AppSvcException(res.text)
     return res.json()
 
 
-def search_apps(req: SearchAppsRequestOutDTO) -> SearchAppsResponseDTO:
-    s = get_requests_session()
-    res = s.post(
-        url=f"{APPSVC_URL}/apps/search",
-        data=json.dumps(SearchAppsRequestOutDTO.Schema().dump(req)),
-        headers={"Content-Type": "application/json"},
-        timeout=REQUESTS_TIMEOUT_CONN_READ,
-    )
+def search_apps(req: SearchAppsRequestOutDTO, bulkhead: t.Optional[str] = None) -> dict:
+    return fetch_search_apps(req, bulkhead).body
+
+
+def fetch_search_apps(req: SearchAppsRequestOutDTO, bulkhead: t.Optional[str] = None) -> AppsvcResponse:
+    data = json.dumps(codec(SearchAppsRequestOutDTO).dump(req), sort_keys=True)
+    return single_flight.do(f"search_apps:{data}", lambda: _fetch_search_apps(data, bulkhead), "search_apps")
+
+
+def _fetch_search_apps(data: str, bulkhead: t.Optional[str]) -> AppsvcResponse:
+    res = get_client().post("search_apps", "/apps/search", data, bulkhead=bulkhead)
     if res.status_code != 200:
         raise AppSvcException(res.text)
-    return res.json()
+    return _response(res)
+
+
+def stream_search_apps(req: SearchAppsRequestOutDTO) -> t.Generator[list[dict], None, None]:
+    """Apps of a search reply, decoded as the reply comes in: a list of them per chunk read.
+
+    appsvc errors are raised right away, before any app is returned. The stream's connection and bulkhead slot are
+    held until the generator is exhausted or closed, and for APPSVC_STREAM_MAX_SECS at most: callers must close it.
+    """
+    data = json.dumps(codec(SearchAppsRequestOutDTO).dump(req), sort_keys=True)
+    stream = _stream_search_apps(data)
+    # runs up to the reply headers: a generator which never started wouldn't release anything when closed
+    next(stream)
+    return stream
+
+
+def _stream_search_apps(data: str) -> t.Generator[list[dict], None, None]:
+    if not stream_bulkhead.acquire():
+        raise AppSvcException("appsvc search_apps: too many concurrent streams")
+    try:
+        with get_client().post("search_apps", "/apps/search", data, stream=True) as res:
+            if res.status_code != 200:
+                raise AppSvcException(res.text)
+            yield []
+            yield from _iter_search_apps(res, time.monotonic() + APPSVC_STREAM_MAX_SECS)
+    finally:
+        stream_bulkhead.release()
+
+
+def _iter_search_apps(res: requests.Response, deadline: float) -> t.Iterator[list[dict]]:
+    # replies are {"apps": [...]} (SearchAppsResponseDTO): apps are decoded one by one from the array, only the
+    # current chunk and the app it ends within are held in memory
+    decoder = json.JSONDecoder()
+    text, pos, in_array = "", 0, False
+    res.encoding = "utf-8"
+    with res:
+        for chunk in res.iter_content(APPSVC_STREAM_CHUNK_SIZE, decode_unicode=True):
+            if time.monotonic() > deadline:
+                raise AppSvcException("appsvc search_apps: stream not read in time")
+            text, pos = text[pos:] + chunk, 0
+            if not in_array:
+                start = SEARCH_APPS_ARRAY_START.search(text)
+                if start is None:
+                    continue
+                pos, in_array = start.end(), True
+            apps: list[dict] = []
+            while True:
+                while pos < len(text) and text[pos] in " \t\r\n,":
+                    pos += 1
+                if pos == len(text):
+                    break
+                if text[pos] == "]":
+                    yield apps
+                    return
+                try:
+                    app, pos = decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    # the app ends in the next chunk
+                    break
+                apps.append(app)
+            if apps:
+                yield apps
+    raise AppSvcException("appsvc search_apps: truncated reply")
 
 
 def get_app_release(app_release_uuid: str) -> GetAppReleaseResponseDTO:
-    s = get_requests_session()
-    res = s.get(
-        url=f"{APPSVC_URL}/apps/{app_release_uuid}",
-        headers={"Content-Type": "application/json"},
-        timeout=REQUESTS_TIMEOUT_CONN_READ,
+    return fetch_app_release(app_release_uuid).body
+
+
+def fetch_app_release(
+    app_release_uuid: str,
+    etag: t.Optional[str] = None,
+    last_modified: t.Optional[str] = None,
+    bulkhead: t.Optional[str] = None,
+) -> AppsvcResponse:
+    return single_flight.do(
+        f"get_app_release:{app_release_uuid}:{etag}:{last_modified}",
+        lambda: _fetch_app_release(app_release_uuid, etag, last_modified, bulkhead),
+        f"get_app_release:{app_release_uuid}",
+    )
+
+
+def _fetch_app_release(
+    app_release_uuid: str, etag: t.Optional[str], last_modified: t.Optional[str], bulkhead: t.Optional[str]
+) -> AppsvcResponse:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    res = hedged(
+        "get_app_release",
+        lambda: get_client().get("get_app_release", f"/apps/{app_release_uuid}", headers, bulkhead),
+        lambda: get_client().get("get_app_release", f"/apps/{app_release_uuid}", headers, APP_RELEASE_HEDGE_BULKHEAD),
     )
+    if res.status_code == 304:
+        return AppsvcResponse(None, res.headers.get("ETag", etag), res.headers.get("Last-Modified", last_modified))
+    if res.status_code == 404:
+        raise AppSvcNotFoundException(res.text)
     if res.status_code != 200:
         raise AppSvcException(res.text)
-    return res.json()
+    return _response(res)
+
+
+def _response(res: requests.Response) -> AppsvcResponse:
+    return AppsvcResponse(
+        res.content,
+        res.headers.get("ETag"),
+        res.headers.get("Last-Modified"),
+        res.headers.get(APPSVC_SCHEMA_VERSION_HEADER),
+    )
+
+
+def passthrough(res: AppsvcResponse, dto: type) -> t.Optional[bytes]:
+    """Upstream bytes of a reply which can be sent to clients as they are, None when it has to be re-encoded.
+
+    Replies qualify when they were produced by the same DTO version as services.dto.appsvc. A sample of them is
+    still checked to dump (i.e. to be re-encoded) to exactly what appsvc sent.
+    """
+    if not APPSVC_PASSTHROUGH or res.raw is None or res.schema_version != SCHEMA_VERSION:
+        passthrough_stats.inc("skipped")
+        return None
+    # sampling replies to check, not security: nothing to guess about it
+    if random.random() < APPSVC_PASSTHROUGH_VALIDATE_RATE:  # nosec B311
+        passthrough_stats.inc("validated")
+        if codec(dto).dump(res.body) != res.body:
+            passthrough_stats.inc("validation_failures")
+            log.warning("appsvc reply doesn't match %s version %s", dto.__name__, SCHEMA_VERSION)
+            return None
+    passthrough_stats.inc("passed")
+    return res.raw
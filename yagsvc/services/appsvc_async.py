@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+import typing as t
+
+import httpx
+from opentelemetry.trace import SpanKind
+
+from yagsvc.biz import (
+    metrics,
+    stats,
+    tracing,
+)
+from yagsvc.biz.errors import (
+    AppSvcException,
+    AppSvcNotFoundException,
+)
+from yagsvc.dto.codec import codec
+from yagsvc.services.appsvc import (
+    APPSVC_SCHEMA_VERSION_HEADER,
+    APPSVC_URL,
+    REQUESTS_TIMEOUT_CONN_READ,
+    AppsvcResponse,
+    breakers,
+    get_hedge_delay,
+    get_timeout,
+    hedge_stats,
+    latencies,
+    set_span_response,
+    span_attributes,
+    within_hedge_budget,
+)
+from yagsvc.services.dto.appsvc import (
+    GetAppReleaseResponseDTO,
+    SearchAppsAclRequestDTO,
+    SearchAppsRequestOutDTO,
+)
+
+# requests waiting on appsvc don't hold a thread each in the asyncio serving mode, only a connection
+APPSVC_ASYNC_MAX_CONNECTIONS = int(os.environ.get("APPSVC_ASYNC_MAX_CONNECTIONS", "200"))
+# calls pass the timeouts of their endpoint (see AsyncAppsvcClient.request), this one only applies to any other
+APPSVC_ASYNC_DEFAULT_TIMEOUT = httpx.Timeout(REQUESTS_TIMEOUT_CONN_READ[1], connect=REQUESTS_TIMEOUT_CONN_READ[0])
+
+
+class AsyncAppsvcClient:
+    """asyncio counterpart of appsvc.AppsvcClient, one per event loop, without bulkheads."""
+
+    def __init__(self, base_url: str, max_connections: int) -> None:
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Content-Type": "application/json"},
+            timeout=APPSVC_ASYNC_DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def get(self, endpoint: str, path: str, headers: t.Optional[dict] = None) -> httpx.Response:
+        return await self.request(endpoint, "GET", path, headers=headers)
+
+    async def post(self, endpoint: str, path: str, data: str) -> httpx.Response:
+        return await self.request(endpoint, "POST", path, data=data)
+
+    async def request(
+        self, endpoint: str, method: str, path: str, data: t.Optional[str] = None, headers: t.Optional[dict] = None
+    ) -> httpx.Response:
+        breaker = breakers[endpoint]
+        if not breaker.allow():
+            raise AppSvcException(f"appsvc {endpoint}: circuit open")
+        started, status = time.monotonic(), "error"
+        # None when the call has no outcome, e.g. cancelled
+        failed: t.Optional[bool] = None
+        try:
+            with tracing.span(f"appsvc {endpoint}", SpanKind.CLIENT, span_attributes(endpoint, method)) as span:
+                headers = dict(headers or {})
+                tracing.inject(headers)
+                try:
+                    res = await self.client.request(
+                        method, path, content=data, headers=headers, timeout=_timeout(endpoint)
+                    )
+                except Exception:
+                    failed = True
+                    raise
+                failed, status = res.status_code >= 500, str(res.status_code)
+                set_span_response(span, res.status_code, len(res.content))
+                return res
+        finally:
+            if failed is None:
+                breaker.release()
+            else:
+                duration = time.monotonic() - started
+                breaker.record(failed, duration)
+                # timeouts and errors would drag the adaptive timeouts up to their maximum
+                if not failed:
+                    latencies[endpoint].record(duration)
+                metrics.observe_appsvc(endpoint, status, duration)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def _timeout(endpoint: str) -> httpx.Timeout:
+    conn, read = get_timeout(endpoint)
+    return httpx.Timeout(read, connect=conn)
+
+
+async def hedged(endpoint: str, fn: t.Callable[[], t.Awaitable[t.Any]]) -> t.Any:
+    """asyncio counterpart of appsvc.hedged, the slower call is cancelled."""
+    delay = get_hedge_delay(endpoint)
+    if delay is None:
+        return await fn()
+    hedge_stats.inc("calls")
+    first = asyncio.ensure_future(fn())
+    pending: set[asyncio.Future] = {first}
+    try:
+        # callers cancelled meanwhile cancel both calls too (see finally)
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not within_hedge_budget():
+            return await first
+        hedge_stats.inc("hedged")
+        pending.add(asyncio.ensure_future(fn()))
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded:
+                if first not in succeeded:
+                    hedge_stats.inc("hedge_wins")
+                return succeeded[0].result()
+            if not pending:
+                return first.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of helpers.SingleFlight: concurrent awaits of the same key share one upstream call."""
+
+    def __init__(self, name: str) -> None:
+        self.counters = stats.Counters(name, ["calls", "upstream_calls"])
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: t.Callable[[], t.Awaitable[t.Any]]) -> t.Any:
+        self.counters.inc("calls")
+        fut = self._calls.get(key)
+        if fut is not None:
+            return await asyncio.shield(fut)
+        self.counters.inc("upstream_calls")
+        fut = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if fut.done():
+                self._calls.pop(key, None)
+            else:
+                # the leader was cancelled, followers still get the result
+                fut.add_done_callback(lambda _: self._calls.pop(key, None))
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["saved"] = res["calls"] - res["upstream_calls"]
+        return res
+
+
+_clients: dict[int, AsyncAppsvcClient] = {}
+single_flight = AsyncSingleFlight("appsvc_async_single_flight")
+stats.register("appsvc_async_single_flight", single_flight.get_stats)
+
+
+def get_client() -> AsyncAppsvcClient:
+    # httpx connections are bound to the event loop which opened them
+    loop_id = id(asyncio.get_running_loop())
+    client = _clients.get(loop_id)
+    if client is None:
+        client = _clients[loop_id] = AsyncAppsvcClient(APPSVC_URL, APPSVC_ASYNC_MAX_CONNECTIONS)
+    return client
+
+
+async def close_clients() -> None:
+    while _clients:
+        _, client = _clients.popitem()
+        await client.close()
+
+
+async def search_apps_acl(req: SearchAppsAclRequestDTO) -> dict:
+    data = json.dumps(codec(SearchAppsAclRequestDTO).dump(req), sort_keys=True)
+    return await single_flight.do(f"search_apps_acl:{data}", lambda: _search_apps_acl(data))
+
+
+async def _search_apps_acl(data: str) -> dict:
+    res = await get_client().post("search_apps_acl", "/apps/search/acl", data)
+    if res.status_code != 200:
+        raise AppSvcException(res.text)
+    return res.json()
+
+
+async def search_apps(req: SearchAppsRequestOutDTO) -> dict:
+    return (await fetch_search_apps(req)).body
+
+
+async def fetch_search_apps(req: SearchAppsRequestOutDTO) -> AppsvcResponse:
+    data = json.dumps(codec(SearchAppsRequestOutDTO).dump(req), sort_keys=True)
+    return await single_flight.do(f"search_apps:{data}", lambda: _fetch_search_apps(data))
+
+
+async def _fetch_search_apps(data: str) -> AppsvcResponse:
+    res = await get_client().post("search_apps", "/apps/search", data)
+    if res.status_code != 200:
+        raise AppSvcException(res.text)
+    return _response(res)
+
+
+async def get_app_release(app_release_uuid: str) -> GetAppReleaseResponseDTO:
+    return (await fetch_app_release(app_release_uuid)).body
+
+
+async def fetch_app_release(
+    app_release_uuid: str, etag: t.Optional[str] = None, last_modified: t.Optional[str] = None
+) -> AppsvcResponse:
+    return await single_flight.do(
+        f"get_app_release:{app_release_uuid}:{etag}:{last_modified}",
+        lambda: _fetch_app_release(app_release_uuid, etag, last_modified),
+    )
+
+
+async def _fetch_app_release(
+    app_release_uuid: str, etag: t.Optional[str], last_modified: t.Optional[str]
+) -> AppsvcResponse:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    res = await hedged(
+        "get_app_release", lambda: get_client().get("get_app_release", f"/apps/{app_release_uuid}", headers)
+    )
+    if res.status_code == 304:
+        return AppsvcResponse(None, res.headers.get("ETag", etag), res.headers.get("Last-Modified", last_modified))
+    if res.status_code == 404:
+        raise AppSvcNotFoundException(res.text)
+    if res.status_code != 200:
+        raise AppSvcException(res.text)
+    return _response(res)
+
+
+def _response(res: httpx.Response) -> AppsvcResponse:
+    return AppsvcResponse(
+        res.content,
+        res.headers.get("ETag"),
+        res.headers.get("Last-Modified"),
+        res.headers.get(APPSVC_SCHEMA_VERSION_HEADER),
+    )
@@ -10,6 +10,15 @@ from marshmallow import (
 )
 from marshmallow_dataclass import dataclass
 
+from yagsvc.dto.helpers import (
+    OMIT_NONE,
+    OmitNone,
+)
+
+# bump together with appsvc on every sync: replies carrying the same version (see appsvc.APPSVC_SCHEMA_VERSION_HEADER)
+# may be passed through to clients without being decoded and re-encoded
+SCHEMA_VERSION = "2"
+
 
 @dataclass
 class ContainerOpDescr:
@@ -176,17 +185,21 @@ class SearchAppsOrderBy(StrEnum):
 
 
 @dataclass
-class SearchAppsRequestOutDTO:
+class SearchAppsRequestOutDTO(OmitNone):
     app_name: t.Optional[str] = field(default=None, metadata={"validate": validate.Length(min=3)})
     kids_mode: bool = False
     offset: int = 0
     limit: int = 100
     order_by: t.Optional[SearchAppsOrderBy] = field(default=SearchAppsOrderBy.TS_ADDED, metadata={"by_value": True})
+    # keyset pagination: order_by value and id of the last app of the previous page, apps after it are returned;
+    # left out of first pages, for appsvc versions which don't know them
+    after_value: t.Any = field(default=None, metadata=OMIT_NONE)
+    after_id: t.Optional[str] = field(default=None, metadata=OMIT_NONE)
     Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
 
 
 @dataclass
-class SearchAppsResponseItem:
+class SearchAppsResponseItem(OmitNone):
     cover_image_id: str
     esrb_rating: int
     id: str
@@ -194,6 +207,9 @@ class SearchAppsResponseItem:
     name: str
     slug: str
     year_released: int
+    # missing from the replies of appsvc versions without keyset pagination
+    ts_added: t.Optional[str] = field(default=None, metadata=OMIT_NONE)
+    Schema: t.ClassVar[t.Type[Schema]] = Schema  # pylint: disable=invalid-name
 
 
 @dataclass
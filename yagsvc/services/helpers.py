@@ -1,19 +1,92 @@
+import threading
+import time
 import typing as t
+from collections import (
+    OrderedDict,
+    deque,
+)
+from contextlib import contextmanager
 
 import requests
 from requests.adapters import (
     HTTPAdapter,
     Retry,
 )
+from urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from urllib3.exceptions import EmptyPoolError
+
+from yagsvc.biz.stats import Counters
+
+
+class StatsHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count checkouts, new connections and waits for a free connection.
+
+    Waits last at most pool_timeout, then fail with urllib3's EmptyPoolError (requests never passes a pool timeout,
+    urllib3 waits forever without one).
+    """
+
+    def __init__(self, stats: Counters, pool_timeout: float, **kwargs: t.Any) -> None:
+        self.stats = stats
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: t.Any, **kwargs: t.Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _instrumented_pool_cls(HTTPConnectionPool, self.stats, self.pool_timeout),
+            "https": _instrumented_pool_cls(HTTPSConnectionPool, self.stats, self.pool_timeout),
+        }
+
+
+class _InstrumentedPool(HTTPConnectionPool):
+    """Base of the pool classes of a StatsHTTPAdapter, which sets stats and pool_timeout (see _instrumented_pool_cls)."""
+
+    stats: Counters
+    pool_timeout: float
+
+    def _get_conn(self, timeout: t.Optional[float] = None) -> t.Any:
+        self.stats.inc("checkouts")
+        # the pool queue is pre-filled with placeholders, so an empty queue means every connection is in use
+        if self.pool is not None and self.pool.empty():
+            self.stats.inc("waits")
+        try:
+            return super()._get_conn(self.pool_timeout if timeout is None else timeout)
+        except EmptyPoolError:
+            self.stats.inc("timeouts")
+            raise
 
+    def _new_conn(self) -> t.Any:
+        self.stats.inc("new_conns")
+        return super()._new_conn()
 
-def get_requests_session(
+
+def _instrumented_pool_cls(
+    base: t.Type[HTTPConnectionPool], stats: Counters, pool_timeout: float
+) -> t.Type[HTTPConnectionPool]:
+    # HTTPSConnectionPool subclasses HTTPConnectionPool: _InstrumentedPool comes first for both
+    return type(
+        f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"stats": stats, "pool_timeout": pool_timeout}
+    )
+
+
+def get_pooled_session(
+    stats: Counters,
+    pool_maxsize: int,
+    pool_timeout: float,
+    pool_connections: int = 1,
     total: int = 0,
     backoff_factor: int = 3,
     allowed_methods: t.Optional[list[str]] = None,
     status_forcelist: t.Optional[list[int]] = None,
 ) -> requests.Session:
-    # backoff_factor for 3: 5, 10, 20, 40, 80, 160, 320, 640, 1280, 2560
+    """Returns a long-lived keep-alive session meant to be shared by all threads of a worker.
+
+    pool_block makes threads wait (up to pool_timeout) for a free connection instead of opening throwaway ones above
+    pool_maxsize.
+    """
     if not allowed_methods:
         allowed_methods = ["GET", "POST"]
     if not status_forcelist:
@@ -25,6 +98,234 @@ def get_requests_session(
         status_forcelist=status_forcelist,
     )
     sess = requests.Session()
-    sess.mount("http://", HTTPAdapter(max_retries=retries))
-    sess.mount("https://", HTTPAdapter(max_retries=retries))
+    sess.headers["Connection"] = "keep-alive"
+    for prefix in ("http://", "https://"):
+        sess.mount(
+            prefix,
+            StatsHTTPAdapter(
+                stats,
+                pool_timeout,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=True,
+                max_retries=retries,
+            ),
+        )
     return sess
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: t.Any = None
+        self.exc: t.Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key: one caller runs fn, the others wait and get its result or exception.
+
+    Per-key counters are kept for the most recently used max_tracked_keys keys only, under the label of the call when
+    it has one: keys holding request payloads (e.g. search terms) shouldn't be exposed by the stats.
+    """
+
+    def __init__(self, name: str, max_tracked_keys: int = 256) -> None:
+        self.max_tracked_keys = max_tracked_keys
+        self.counters = Counters(name, ["calls", "upstream_calls"])
+        self._calls: dict[str, _Call] = {}
+        self._keys: OrderedDict[str, list[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: t.Callable[[], t.Any], label: t.Optional[str] = None) -> t.Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+            self._track(label or key, leader)
+        if not leader:
+            call.done.wait()
+            if call.exc is not None:
+                raise call.exc
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.exc = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _track(self, key: str, leader: bool) -> None:
+        self.counters.inc("calls")
+        if leader:
+            self.counters.inc("upstream_calls")
+        key_stats = self._keys.pop(key, None) or [0, 0]
+        key_stats[0] += 1
+        key_stats[1] += int(leader)
+        self._keys[key] = key_stats
+        if len(self._keys) > self.max_tracked_keys:
+            self._keys.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["saved"] = res["calls"] - res["upstream_calls"]
+        with self._lock:
+            res["keys"] = {
+                key: {"calls": calls, "upstream_calls": upstream, "saved": calls - upstream}
+                for key, (calls, upstream) in self._keys.items()
+                if calls > upstream
+            }
+        return res
+
+
+class CircuitBreaker:
+    """Rejects calls for open_secs once failed or slow calls reach their rate, then lets one probe call through."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        slow_call_secs: float,
+        slow_call_rate: float,
+        open_secs: float,
+    ) -> None:
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_secs = slow_call_secs
+        self.slow_call_rate = slow_call_rate
+        self.open_secs = open_secs
+        self.counters = Counters(name, ["calls", "failures", "slow_calls", "rejected", "opened"])
+        self.state = self.CLOSED
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_secs:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probing):
+                self._probing = self.state == self.HALF_OPEN
+                return True
+        self.counters.inc("rejected")
+        return False
+
+    def record(self, failed: bool, duration: float) -> None:
+        slow = duration > self.slow_call_secs
+        self.counters.inc("calls")
+        self.counters.inc("failures", int(failed))
+        self.counters.inc("slow_calls", int(slow))
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if failed or slow:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self.state == self.OPEN:
+                # calls allowed before the breaker opened
+                return
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(f for f, _ in self._outcomes) / len(self._outcomes)
+            slow_calls = sum(s for _, s in self._outcomes) / len(self._outcomes)
+            if failures >= self.failure_rate or slow_calls >= self.slow_call_rate:
+                self._open()
+
+    def release(self) -> None:
+        """Gives up a call allowed by allow() without an outcome, e.g. cancelled."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.counters.inc("opened")
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["state"] = self.state
+        return res
+
+
+class Bulkhead:
+    """Caps the number of concurrent calls to an upstream."""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.counters = Counters(name, ["calls", "rejected"])
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def enter(self) -> t.Iterator[bool]:
+        """Yields whether a slot was acquired within max_wait, callers must not go on otherwise."""
+        if not self.acquire():
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.release()
+
+    def acquire(self) -> bool:
+        """Whether a slot was acquired within max_wait, callers release it."""
+        if not self._semaphore.acquire(timeout=self.max_wait):
+            self.counters.inc("rejected")
+            return False
+        self.counters.inc("calls")
+        with self._lock:
+            self._active += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        res: dict = self.counters.snapshot()
+        res["active"] = self._active
+        res["max_concurrent"] = self.max_concurrent
+        return res
+
+
+class LatencyTracker:
+    """Rolling window of the durations of the last `window` calls to an upstream."""
+
+    def __init__(self, window: int, min_samples: int) -> None:
+        self.min_samples = min_samples
+        self._durations: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, duration: float) -> None:
+        with self._lock:
+            self._durations.append(duration)
+
+    def percentile(self, p: float) -> t.Optional[float]:
+        """None until min_samples durations are known."""
+        with self._lock:
+            if len(self._durations) < self.min_samples:
+                return None
+            durations = sorted(self._durations)
+        return durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+
+    def get_stats(self) -> dict:
+        return {f"p{p}": self.percentile(p) for p in (50, 95, 99)}
@@ -1,3 +1,54 @@
+import os
+import typing as t
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.pool import (
+    Pool,
+    QueuePool,
+)
+
+# a connection per gunicorn thread: requests never wait for one, unless the overflow is in use too
+SQLDB_POOL_SIZE = int(os.environ.get("SQLDB_POOL_SIZE", os.environ.get("GUNICORN_NUM_THREADS", "5")))
+SQLDB_POOL_MAX_OVERFLOW = int(os.environ.get("SQLDB_POOL_MAX_OVERFLOW", "2"))
+# how long a checkout may wait for a connection before failing
+SQLDB_POOL_TIMEOUT = float(os.environ.get("SQLDB_POOL_TIMEOUT", "10"))
+SQLDB_POOL_RECYCLE = int(os.environ.get("SQLDB_POOL_RECYCLE", "1800"))
+# connections dropped by the server (restarts, failovers, idle timeouts) are replaced before being used
+SQLDB_POOL_PRE_PING = os.environ.get("SQLDB_POOL_PRE_PING", "true").lower() == "true"
+
+# optional read replica (same credentials and database), serving the read-only queries which tolerate replication lag
+SQLDB_REPLICA_HOST = os.environ.get("SQLDB_REPLICA_HOST")
+SQLDB_REPLICA_PORT = os.environ.get("SQLDB_REPLICA_PORT", os.environ.get("SQLDB_PORT"))
+
+DEFAULT_BIND = "default"
+REPLICA_BIND = "replica"
 
 sqldb = SQLAlchemy()
+
+
+def engine_options(bind: str, poolclass: t.Type[Pool] = QueuePool) -> dict:
+    return {
+        "poolclass": poolclass,
+        "pool_size": SQLDB_POOL_SIZE,
+        "max_overflow": SQLDB_POOL_MAX_OVERFLOW,
+        "pool_timeout": SQLDB_POOL_TIMEOUT,
+        "pool_recycle": SQLDB_POOL_RECYCLE,
+        "pool_pre_ping": SQLDB_POOL_PRE_PING,
+        # names the pool in logs and metrics
+        "pool_logging_name": bind,
+    }
+
+
+def replica_uri() -> t.Optional[str]:
+    if not SQLDB_REPLICA_HOST:
+        return None
+    return (
+        f'postgresql://{os.environ["SQLDB_USERNAME"]}:{os.environ["SQLDB_PASSWORD"]}@{SQLDB_REPLICA_HOST}:'
+        f'{SQLDB_REPLICA_PORT}/{os.environ["SQLDB_DBNAME"]}'
+    )
+
+
+def replica_bind_arguments() -> dict:
+    """bind_arguments running a statement on the replica when there is one, on the primary otherwise."""
+    engines = sqldb.engines
+    return {"bind": engines[REPLICA_BIND]} if REPLICA_BIND in engines else {}